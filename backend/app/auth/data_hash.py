@@ -6,12 +6,28 @@ Featuring a large salt and variable number of rounds, it’s currently the defau
 hash for many systems (notably BSD), and has no known weaknesses. 
 
 Font: (https://passlib.readthedocs.io/en/stable/lib/passlib.hash.bcrypt.html)
+
+This service does not hash passwords on its request path, so passlib and the
+bcrypt context are only loaded the first time one of these functions is called.
 """
 
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+@lru_cache(maxsize=1)
+def get_password_hash_context() -> "CryptContext":
+    """
+    Builds the configured hashing context on first use
+    """
 
+    # pylint: disable=import-outside-toplevel
+    from passlib.context import CryptContext
 
-passord_hash = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def get_hashed_data(data: str) -> str:
@@ -19,8 +35,8 @@ def get_hashed_data(data: str) -> str:
     Hashes and return str with the configured scheme
     """
 
-    return passord_hash.hash(data)
+    return get_password_hash_context().hash(data)
 
 
 def validate_hashed_data(data: str, hashed_data: str) -> bool:
-    return passord_hash.verify(data, hashed_data)
+    return get_password_hash_context().verify(data, hashed_data)
@@ -0,0 +1,312 @@
+"""
+Vectorized analytics over the sells of an enterprise.
+
+The columns an analysis needs are fetched as arrays instead of ORM objects:
+with PostgreSQL the query runs inside `COPY (...) TO STDOUT` and the CSV
+stream is parsed by NumPy's C reader, with other databases (SQLite in the
+test suite) the rows are fetched and converted in one call. Aggregates are
+then computed with NumPy: group-bys through `np.bincount` over the keys
+(sorted with `np.unique` first when they are too sparse), moving averages
+through cumulative sums, rankings through `np.argpartition` and percentiles
+through `np.percentile`.
+
+The revenue of a sell is its quantity times the price of the product, or its
+cost when the product has no price. Days are UTC calendar days.
+
+Only sells still in the database are analysed, see app.db.archive.
+
+NumPy, a dependency of the project, is imported on first use so it is not
+loaded at boot. In an environment installed without it, the analytics fail
+with AnalyticsUnavailable.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import io
+from typing import TYPE_CHECKING, Any
+
+import sqlalchemy as sa
+from sqlalchemy import Connection
+from sqlmodel import col, select
+from sqlmodel.sql.expression import Select
+
+from app.models.sell import BaseProduct, Sell
+
+if TYPE_CHECKING:
+    import numpy
+
+
+EPOCH = date(1970, 1, 1)
+
+
+class AnalyticsUnavailable(RuntimeError):
+    """The analytics are requested but NumPy is not installed."""
+
+
+def _numpy():
+    # pylint: disable=import-outside-toplevel
+    try:
+        import numpy
+    except ImportError as ex:
+        raise AnalyticsUnavailable("numpy is required for the sell analytics") from ex
+
+    return numpy
+
+
+@dataclass
+class SellColumns:
+    """One array per column, one entry per sell."""
+
+    day: "numpy.ndarray"  # int64, days since 1970-01-01
+    product_id: "numpy.ndarray"  # int64
+    user_id: "numpy.ndarray"  # int64
+    quantity: "numpy.ndarray"  # int64
+    revenue: "numpy.ndarray"  # float64
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+
+def _day_number(dialect_name: str) -> sa.ColumnElement:
+    if dialect_name == "postgresql":
+        return (sa.cast(col(Sell.created_at), sa.Date) - sa.literal(EPOCH, sa.Date)).label("day")
+
+    return sa.cast(
+        sa.func.julianday(col(Sell.created_at)) - 2440587.5, sa.Integer
+    ).label("day")
+
+
+def columns_query(
+    dialect_name: str,
+    enterprise_id: int,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    product_id: int | None = None,
+) -> Select:
+    """Columns of SellColumns for the sells of an enterprise, naive UTC bounds."""
+
+    query = (
+        select(
+            _day_number(dialect_name),
+            col(Sell.product_id),
+            col(Sell.user_id),
+            col(Sell.quantity),
+            (
+                col(Sell.quantity)
+                * sa.func.coalesce(col(BaseProduct.price), col(BaseProduct.cost))
+            ).label("revenue"),
+        )
+        .join(BaseProduct, onclause=col(Sell.product_id) == col(BaseProduct.id))
+        .where(col(Sell.enterprise_id) == enterprise_id)
+    )
+
+    if start_date is not None:
+        query = query.where(col(Sell.created_at) >= start_date)
+    if end_date is not None:
+        query = query.where(col(Sell.created_at) < end_date)
+    if product_id is not None:
+        query = query.where(col(Sell.product_id) == product_id)
+
+    return query
+
+
+def _copy_csv(connection: Connection, query: Select) -> io.BytesIO:
+    compiled = query.compile(dialect=connection.dialect)
+    cursor = connection.connection.cursor()
+    buffer = io.BytesIO()
+
+    try:
+        statement = cursor.mogrify(compiled.string, compiled.params).decode()
+        cursor.copy_expert(f"COPY ({statement}) TO STDOUT WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+    buffer.seek(0)
+    return buffer
+
+
+def fetch_columns(
+    connection: Connection,
+    enterprise_id: int,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    product_id: int | None = None,
+) -> SellColumns:
+    """Fetches the sells of an enterprise as column arrays, see the module."""
+
+    np = _numpy()
+    query = columns_query(
+        connection.dialect.name, enterprise_id, start_date, end_date, product_id
+    )
+
+    if connection.dialect.name == "postgresql":
+        buffer = _copy_csv(connection, query)
+        table = (
+            np.loadtxt(buffer, delimiter=",", dtype=np.float64, ndmin=2)
+            if buffer.getbuffer().nbytes
+            else np.empty((0, 5))
+        )
+    else:
+        table = np.array(connection.execute(query).all(), dtype=np.float64).reshape(-1, 5)
+
+    return SellColumns(
+        day=table[:, 0].astype(np.int64),
+        product_id=table[:, 1].astype(np.int64),
+        user_id=table[:, 2].astype(np.int64),
+        quantity=table[:, 3].astype(np.int64),
+        revenue=table[:, 4],
+    )
+
+
+def day_strings(days: "numpy.ndarray") -> list[str]:
+    """ISO dates of day numbers."""
+
+    np = _numpy()
+    return np.asarray(days, dtype="datetime64[D]").astype(str).tolist()
+
+
+def group_sums(
+    keys: "numpy.ndarray", *weights: "numpy.ndarray"
+) -> tuple["numpy.ndarray", "numpy.ndarray", list["numpy.ndarray"]]:
+    """
+    Groups `weights` by `keys` (non-negative integers).
+
+    Keys spanning less than a few times their count are counted directly by
+    value, avoiding the sort of `np.unique`.
+
+    Returns:
+        tuple: the distinct keys in order, the count of each and the sum of
+        each weight array per key.
+    """
+
+    np = _numpy()
+    low = int(keys.min())
+    span = int(keys.max()) - low + 1
+
+    if span <= 4 * len(keys):
+        index = keys - low
+        counts = np.bincount(index, minlength=span)
+        present = np.flatnonzero(counts)
+        return (
+            present + low,
+            counts[present],
+            [np.bincount(index, weights=weight, minlength=span)[present] for weight in weights],
+        )
+
+    distinct, index = np.unique(keys, return_inverse=True)
+    return (
+        distinct,
+        np.bincount(index),
+        [np.bincount(index, weights=weight) for weight in weights],
+    )
+
+
+def revenue_by_product_day(columns: SellColumns) -> list[dict[str, Any]]:
+    """Quantity sold and revenue per product and day, by product then day."""
+
+    if not len(columns):
+        return []
+
+    first_day = columns.day.min()
+    span = int(columns.day.max() - first_day) + 1
+    keys, _, (quantity, revenue) = group_sums(
+        columns.product_id * span + (columns.day - first_day), columns.quantity, columns.revenue
+    )
+
+    return [
+        {"product_id": product_id, "day": day, "quantity": int(sold), "revenue": amount}
+        for product_id, day, sold, amount in zip(
+            (keys // span).tolist(),
+            day_strings(keys % span + first_day),
+            quantity.tolist(),
+            revenue.tolist(),
+        )
+    ]
+
+
+def daily_revenue(
+    columns: SellColumns, first_day: int | None = None, last_day: int | None = None
+) -> tuple[int, "numpy.ndarray"]:
+    """
+    Revenue of every day between `first_day` and `last_day` (inclusive, the
+    days of the first and last sells by default), days without sells at 0.
+
+    Returns:
+        tuple[int, numpy.ndarray]: the first day and the revenue per day.
+    """
+
+    np = _numpy()
+    if first_day is None:
+        first_day = int(columns.day.min()) if len(columns) else 0
+    if last_day is None:
+        last_day = int(columns.day.max()) if len(columns) else first_day - 1
+
+    inside = (columns.day >= first_day) & (columns.day <= last_day)
+    revenue = np.bincount(
+        columns.day[inside] - first_day,
+        weights=columns.revenue[inside],
+        minlength=max(last_day - first_day + 1, 0),
+    )
+
+    return first_day, revenue
+
+
+def moving_average(values: "numpy.ndarray", window: int) -> "numpy.ndarray":
+    """Trailing mean over `window` values, NaN until the window is full."""
+
+    np = _numpy()
+    averages = np.full(len(values), np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        averages[window - 1:] = (sums[window:] - sums[:-window]) / window
+
+    return averages
+
+
+def top_sellers(columns: SellColumns, limit: int) -> list[dict[str, Any]]:
+    """The `limit` users with the highest revenue, highest first."""
+
+    np = _numpy()
+    if not len(columns):
+        return []
+
+    users, sells, (quantity, revenue) = group_sums(
+        columns.user_id, columns.quantity, columns.revenue
+    )
+
+    if limit < len(users):
+        top = np.argpartition(-revenue, limit - 1)[:limit]
+    else:
+        top = np.arange(len(users))
+    top = top[np.lexsort((users[top], -revenue[top]))]
+
+    return [
+        {"user_id": user_id, "sells": count, "quantity": int(sold), "revenue": amount}
+        for user_id, count, sold, amount in zip(
+            users[top].tolist(), sells[top].tolist(), quantity[top].tolist(), revenue[top].tolist()
+        )
+    ]
+
+
+def revenue_percentiles(columns: SellColumns, percentiles: list[float]) -> dict[str, float | None]:
+    """Percentiles of the revenue per sell, linear interpolation."""
+
+    np = _numpy()
+    if not len(columns):
+        return {f"p{percentile:g}": None for percentile in percentiles}
+
+    values = np.percentile(columns.revenue, percentiles)
+
+    return {
+        f"p{percentile:g}": value for percentile, value in zip(percentiles, values.tolist())
+    }
+
+
+def day_number(value: date | datetime) -> int:
+    return (date(value.year, value.month, value.day) - EPOCH).days
+
+
+def days_before(value: datetime) -> int:
+    """Last day entirely before an exclusive end bound."""
+
+    return day_number(value - timedelta(microseconds=1))
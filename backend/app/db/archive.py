@@ -0,0 +1,310 @@
+"""
+Cold storage of old sells in compressed Arrow IPC files.
+
+Sells older than the archival cutoff are moved out of the database in
+batches: each batch is written to one file per enterprise and month, then
+deleted from `sell` in the same transaction that claimed it. Files live under
+
+    SELL_ARCHIVE_DIR/enterprise_id=<id>/<YYYY-MM>/sells-<first id>-<last id>.arrow
+
+Reads memory-map the files of the months a date range covers and filter
+them with pyarrow compute kernels, so only the matching rows are turned into
+Python objects. Read routes merge them with the rows still in the database
+when their `start_date` reaches an archived month (GET /sells/ and
+GET /sells/export).
+
+A batch whose transaction fails after its files were written removes them
+again. A crash in between leaves rows both in a file and in the database;
+read routes drop archived rows whose id is still in the database.
+
+pyarrow, a dependency of the project, is imported on first use so it is not
+loaded at boot. In an environment installed without it, archival fails with
+ArchiveUnavailable, and so do reads of ranges that have archived files.
+
+Settings (environment):
+    SELL_ARCHIVE_DIR: Root directory of the archive (default: ./archive/sells).
+    SELL_ARCHIVE_AFTER_DAYS: Age of the sells moved to the archive (default: 90).
+    SELL_ARCHIVE_BATCH_ROWS: Sells moved per transaction (default: 10000).
+    SELL_ARCHIVE_COMPRESSION: IPC buffer compression, zstd, lz4 or none
+        (default: zstd).
+
+Usage:
+    python -m app.db.archive [--older-than-days 90] [--before 2024-01-01]
+"""
+
+import argparse
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timedelta
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from sqlmodel import Session, col, delete, select
+
+from app.db.conn import engine
+from app.db.partitions import month_start
+from app.middlewares.idempotency import utcnow
+from app.models.sell import Sell
+
+if TYPE_CHECKING:
+    import pyarrow
+
+
+SELL_ARCHIVE_DIR = os.environ.get("SELL_ARCHIVE_DIR", "./archive/sells")
+SELL_ARCHIVE_AFTER_DAYS = int(os.environ.get("SELL_ARCHIVE_AFTER_DAYS", "90"))
+SELL_ARCHIVE_BATCH_ROWS = int(os.environ.get("SELL_ARCHIVE_BATCH_ROWS", "10000"))
+SELL_ARCHIVE_COMPRESSION = os.environ.get("SELL_ARCHIVE_COMPRESSION", "zstd")
+
+class ArchiveUnavailable(RuntimeError):
+    """The archive is needed but pyarrow is not installed."""
+
+
+def _pyarrow():
+    # pylint: disable=import-outside-toplevel
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+    except ImportError as ex:
+        raise ArchiveUnavailable("pyarrow is required to read or write the sell archive") from ex
+
+    return pyarrow
+
+
+def _schema(pa) -> "pyarrow.Schema":
+    # The columns of SELL_COLUMNS, see app.db.statements
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("product_id", pa.int64()),
+            ("client_id", pa.int64()),
+            ("quantity", pa.int64()),
+            ("user_id", pa.int64()),
+            ("created_at", pa.timestamp("us")),
+        ]
+    )
+
+
+def month_key(value: date | datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def enterprise_directory(root: str | Path, enterprise_id: int) -> Path:
+    return Path(root) / f"enterprise_id={enterprise_id}"
+
+
+def month_directory(root: str | Path, enterprise_id: int, month: date) -> Path:
+    return enterprise_directory(root, enterprise_id) / month_key(month)
+
+
+def write_archive_file(directory: Path, rows: list[dict[str, Any]]) -> Path:
+    """Writes rows of one enterprise and month, sorted by id, to a new file."""
+
+    pa = _pyarrow()
+
+    rows.sort(key=lambda row: row["id"])
+    table = pa.Table.from_pylist(rows, schema=_schema(pa))
+    compression = None if SELL_ARCHIVE_COMPRESSION == "none" else SELL_ARCHIVE_COMPRESSION
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"sells-{rows[0]['id']}-{rows[-1]['id']}.arrow"
+    partial = path.with_suffix(".partial")
+    with pa.OSFile(str(partial), "wb") as sink:
+        with pa.ipc.new_file(
+            sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+        ) as writer:
+            writer.write_table(table)
+    os.replace(partial, path)
+
+    return path
+
+
+def archive_batch(
+    session: Session, cutoff: datetime, root: str | Path, batch_rows: int
+) -> int:
+    """
+    Moves up to `batch_rows` sells created before `cutoff` to the archive,
+    committing the session.
+
+    Returns:
+        int: sells archived.
+    """
+
+    rows = session.exec(
+        select(
+            col(Sell.id),
+            col(Sell.product_id),
+            col(Sell.client_id),
+            col(Sell.quantity),
+            col(Sell.user_id),
+            col(Sell.created_at),
+            col(Sell.enterprise_id),
+        )
+        .where(col(Sell.created_at) < cutoff)
+        .order_by(col(Sell.created_at), col(Sell.id))
+        .limit(batch_rows)
+        .with_for_update(skip_locked=True, of=Sell)  # type: ignore
+    ).all()
+
+    if not rows:
+        return 0
+
+    groups: dict[tuple[int, date], list[dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        values = row._asdict()
+        groups[(values.pop("enterprise_id"), month_start(values["created_at"]))].append(values)
+
+    written: list[Path] = []
+    try:
+        for (enterprise_id, month), group in groups.items():
+            written.append(write_archive_file(month_directory(root, enterprise_id, month), group))
+
+        session.exec(  # type: ignore
+            delete(Sell).where(col(Sell.id).in_([row.id for row in rows]))
+        )
+        session.commit()
+    except BaseException:
+        session.rollback()
+        for path in written:
+            path.unlink(missing_ok=True)
+        raise
+
+    return len(rows)
+
+
+def archive_sells(
+    session: Session,
+    cutoff: datetime | None = None,
+    root: str | Path | None = None,
+    batch_rows: int = SELL_ARCHIVE_BATCH_ROWS,
+) -> int:
+    """
+    Moves every sell created before `cutoff` (SELL_ARCHIVE_AFTER_DAYS ago by
+    default) to the archive, one transaction per batch.
+
+    Returns:
+        int: sells archived.
+    """
+
+    _pyarrow()
+
+    cutoff = cutoff or utcnow() - timedelta(days=SELL_ARCHIVE_AFTER_DAYS)
+    root = root or SELL_ARCHIVE_DIR
+    archived = 0
+
+    while moved := archive_batch(session, cutoff, root, batch_rows):
+        archived += moved
+
+    return archived
+
+
+def archive_old_sells(session: Session) -> int:
+    """Periodic job: archive_sells with the default cutoff."""
+
+    return archive_sells(session)
+
+
+def archived_files(
+    enterprise_id: int,
+    start_date: datetime,
+    end_date: datetime | None = None,
+    root: str | Path | None = None,
+) -> list[Path]:
+    """Files of the months between `start_date` and `end_date` (now when None)."""
+
+    directory = enterprise_directory(root or SELL_ARCHIVE_DIR, enterprise_id)
+    if not directory.is_dir():
+        return []
+
+    # The end is exclusive, a range ending on the 1st does not read that month
+    first = month_key(start_date)
+    last = month_key((end_date or utcnow()) - timedelta(microseconds=1))
+    files: list[Path] = []
+
+    for month in sorted(directory.iterdir()):
+        if first <= month.name <= last:
+            files.extend(
+                sorted(month.glob("sells-*.arrow"), key=lambda path: int(path.stem.split("-")[1]))
+            )
+
+    return files
+
+
+def read_archived_sells(
+    enterprise_id: int,
+    start_date: datetime,
+    end_date: datetime | None = None,
+    user_ids: Iterable[int] | None = None,
+    session: Session | None = None,
+    root: str | Path | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Archived sells of an enterprise with `start_date <= created_at < end_date`,
+    optionally of some users, month by month and by id within a file.
+
+    With a session, sells still in the database (see the module) are left out.
+    """
+
+    files = archived_files(enterprise_id, start_date, end_date, root)
+    if not files:
+        return iter(())
+
+    # Raised here rather than on the first read, so callers can report it
+    pa = _pyarrow()
+
+    return _read_files(pa, files, start_date, end_date, user_ids, session)
+
+
+def _read_files(
+    pa,
+    files: list[Path],
+    start_date: datetime,
+    end_date: datetime | None,
+    user_ids: Iterable[int] | None,
+    session: Session | None,
+) -> Iterator[dict[str, Any]]:
+    start = pa.scalar(start_date, pa.timestamp("us"))
+    end = pa.scalar(end_date, pa.timestamp("us")) if end_date is not None else None
+    users = pa.array(list(user_ids), pa.int64()) if user_ids is not None else None
+
+    for path in files:
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+
+            mask = pa.compute.greater_equal(table["created_at"], start)
+            if end is not None:
+                mask = pa.compute.and_(mask, pa.compute.less(table["created_at"], end))
+            if users is not None:
+                mask = pa.compute.and_(mask, pa.compute.is_in(table["user_id"], value_set=users))
+            rows = table.filter(mask).to_pylist()
+
+        if rows and session is not None:
+            _, first_id, last_id = path.stem.split("-")
+            in_database = set(
+                session.exec(
+                    select(col(Sell.id)).where(col(Sell.id).between(int(first_id), int(last_id)))
+                )
+            )
+            rows = [row for row in rows if row["id"] not in in_database]
+
+        yield from rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old sells to the archive")
+    parser.add_argument("--older-than-days", type=int, default=SELL_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--before", type=datetime.fromisoformat, help="cutoff, naive UTC")
+    parser.add_argument("--batch-rows", type=int, default=SELL_ARCHIVE_BATCH_ROWS)
+    parser.add_argument("--dir", default=SELL_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    cutoff = args.before or utcnow() - timedelta(days=args.older_than_days)
+    with Session(engine) as session:
+        archived = archive_sells(session, cutoff, args.dir, args.batch_rows)
+
+    print(f"Archived {archived} sells created before {cutoff.isoformat()} to {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
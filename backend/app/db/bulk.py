@@ -0,0 +1,93 @@
+"""
+Bulk loading helpers for staging data before set-based statements.
+
+Rows are streamed into a temporary staging table in chunks: with PostgreSQL
+through `COPY ... FROM STDIN` on the connection of the running transaction,
+with other databases (SQLite in the test suite) through `executemany`
+inserts. Only one chunk is held in memory at a time.
+"""
+
+from collections.abc import Iterable, Sequence
+from itertools import islice
+import io
+import os
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy import Connection
+
+
+BULK_CHUNK_ROWS = int(os.environ.get("BULK_CHUNK_ROWS", "10000"))
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def staging_table(connection: Connection, name: str, columns: Iterable[sa.Column]) -> sa.Table:
+    """
+    Creates an empty temporary table with copies of `columns`, without their
+    constraints, replacing a previous one with the same name.
+    """
+
+    table = sa.Table(
+        name,
+        sa.MetaData(),
+        *(sa.Column(column.name, column.type) for column in columns),
+        prefixes=["TEMPORARY"],
+    )
+    table.drop(connection, checkfirst=True)
+    table.create(connection)
+
+    return table
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+
+    if isinstance(value, bool):
+        return "t" if value else "f"
+
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy_chunk(connection: Connection, table: sa.Table, rows: Sequence[Sequence[Any]]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(_copy_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table.name}" ({columns}) FROM STDIN', buffer)
+    finally:
+        cursor.close()
+
+
+def copy_rows(
+    connection: Connection,
+    table: sa.Table,
+    rows: Iterable[Sequence[Any]],
+    chunk_rows: int = BULK_CHUNK_ROWS,
+) -> int:
+    """
+    Loads `rows`, tuples in the column order of `table`, in chunks.
+
+    Returns:
+        int: rows loaded.
+    """
+
+    names = [column.name for column in table.columns]
+    iterator = iter(rows)
+    loaded = 0
+
+    while chunk := list(islice(iterator, chunk_rows)):
+        if connection.dialect.name == "postgresql":
+            _copy_chunk(connection, table, chunk)
+        else:
+            connection.execute(table.insert(), [dict(zip(names, row)) for row in chunk])
+
+        loaded += len(chunk)
+
+    return loaded
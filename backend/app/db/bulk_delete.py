@@ -0,0 +1,149 @@
+"""
+Bulk deletes of the sells and clients of an enterprise.
+
+Matching rows are deleted in chunks, each chunk in its own transaction, so
+row locks are held for one chunk at a time instead of for the whole delete:
+
+- the ids of the next chunk are selected in id order and locked;
+- for sells, their quantities go back to the stock with one aggregated
+  UPDATE per chunk (see app.db.stock.put_stock_totals);
+- for clients, their sells and reservations lose their client, as when a
+  single client is deleted;
+- the chunk is deleted with `DELETE ... RETURNING`, rows deleted by a
+  concurrent request in the meantime are not counted.
+
+Settings (environment):
+    BULK_DELETE_CHUNK_ROWS: Rows deleted per transaction (default: 1000).
+"""
+
+from datetime import datetime
+import os
+
+import sqlalchemy as sa
+from sqlmodel import Session, col, delete, select, update
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.db.stock import put_stock_totals
+from app.models.reservation import StockReservation
+from app.models.sell import Client, Sell
+
+
+BULK_DELETE_CHUNK_ROWS = int(os.environ.get("BULK_DELETE_CHUNK_ROWS", "1000"))
+
+
+def _next_chunk(
+    session: Session, query: SelectOfScalar, id_column, last_id: int, chunk_rows: int
+) -> list[int]:
+    return list(
+        session.exec(
+            query.where(id_column > last_id)
+            .order_by(id_column)
+            .limit(chunk_rows)
+            .with_for_update(of=id_column.table)
+        ).all()
+    )
+
+
+def delete_sells(
+    session: Session,
+    enterprise_id: int,
+    ids: list[int] | None = None,
+    user_ids: list[int] | None = None,
+    client_id: int | None = None,
+    product_id: int | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    chunk_rows: int = BULK_DELETE_CHUNK_ROWS,
+) -> int:
+    """
+    Deletes the sells of an enterprise matching every given filter, naive UTC
+    bounds, giving their quantities back to the stock. Commits each chunk.
+
+    Returns:
+        int: number of sells deleted.
+    """
+
+    query = select(col(Sell.id)).where(col(Sell.enterprise_id) == enterprise_id)
+    #pylint: disable=no-member
+    if ids is not None:
+        query = query.where(col(Sell.id).in_(ids))
+    if user_ids is not None:
+        query = query.where(col(Sell.user_id).in_(user_ids))
+    if client_id is not None:
+        query = query.where(col(Sell.client_id) == client_id)
+    if product_id is not None:
+        query = query.where(col(Sell.product_id) == product_id)
+    if start_date is not None:
+        query = query.where(col(Sell.created_at) >= start_date)
+    if end_date is not None:
+        query = query.where(col(Sell.created_at) < end_date)
+
+    deleted = 0
+    last_id = 0
+    while chunk := _next_chunk(session, query, col(Sell.id), last_id, chunk_rows):
+        put_stock_totals(
+            session,
+            select(col(Sell.product_id), col(Sell.quantity)).where(col(Sell.id).in_(chunk)),
+        )
+        deleted += len(
+            session.exec(  # type: ignore
+                delete(Sell).where(col(Sell.id).in_(chunk)).returning(col(Sell.id))
+            ).all()
+        )
+        session.commit()
+        last_id = chunk[-1]
+
+    return deleted
+
+
+def delete_clients(
+    session: Session,
+    enterprise_id: int,
+    ids: list[int] | None = None,
+    person_codes: list[str] | None = None,
+    enterprise_codes: list[str] | None = None,
+    chunk_rows: int = BULK_DELETE_CHUNK_ROWS,
+) -> int:
+    """
+    Deletes the clients of an enterprise matching any of the given lists,
+    keeping their sells and reservations without a client. Commits each chunk.
+
+    Returns:
+        int: number of clients deleted.
+    """
+
+    #pylint: disable=no-member
+    matches = [
+        column.in_(values)
+        for column, values in (
+            (col(Client.id), ids),
+            (col(Client.person_code), person_codes),
+            (col(Client.enterprise_code), enterprise_codes),
+        )
+        if values is not None
+    ]
+    if not matches:
+        return 0
+
+    query = (
+        select(col(Client.id))
+        .where(col(Client.enterprise_id) == enterprise_id)
+        .where(sa.or_(*matches))
+    )
+
+    deleted = 0
+    last_id = 0
+    while chunk := _next_chunk(session, query, col(Client.id), last_id, chunk_rows):
+        for model in (Sell, StockReservation):
+            session.exec(  # type: ignore
+                update(model).where(col(model.client_id).in_(chunk)).values(client_id=None)
+            )
+        deleted += len(
+            session.exec(  # type: ignore
+                delete(Client).where(col(Client.id).in_(chunk)).returning(col(Client.id))
+            ).all()
+        )
+        session.commit()
+        last_id = chunk[-1]
+
+    return deleted
@@ -0,0 +1,186 @@
+"""
+Bulk import of the clients of an enterprise from CSV or NDJSON.
+
+Rows are read lazily from the uploaded file and validated against
+ClientImport, ClientCreate with the limits of the client columns. Valid rows
+are streamed into a temporary staging table (COPY with PostgreSQL, see
+app.db.bulk), then merged into `client` by one `INSERT ... SELECT`, in the
+transaction of the caller.
+
+A client is skipped when its `person_code` or `enterprise_code` is already
+used by a client of the enterprise or by an earlier line of the same file.
+Lines repeating a code of the file are rejected while staging, codes already
+used are left out of the merge by an anti-join of the staging table with
+`client`. Every skipped line is reported with its number and the reason: CSV
+lines count the header as line 1, NDJSON lines count from 1.
+"""
+
+from collections.abc import Iterable, Iterator
+import csv
+from dataclasses import dataclass, field
+import io
+import json
+from typing import IO, Any
+
+from pydantic import ValidationError
+import sqlalchemy as sa
+from sqlalchemy import Connection
+from sqlmodel import col, select
+
+from app.db.bulk import BULK_CHUNK_ROWS, copy_rows, staging_table
+from app.models.sell import Client, ClientImport
+
+
+IMPORT_COLUMNS = ("name", "description", "enterprise_code", "person_code")
+CODE_COLUMNS = ("person_code", "enterprise_code")
+
+
+@dataclass
+class ImportReport:
+    read: int = 0
+    inserted: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def error(self, line: int, message: str):
+        self.errors.append({"line": line, "error": message})
+
+
+def csv_records(file: IO[bytes]) -> Iterator[tuple[int, dict[str, Any]]]:
+    """Numbered records of a CSV file with a header line."""
+
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+
+    for record in reader:
+        yield reader.line_num, {
+            name: value if value != "" else None for name, value in record.items()
+        }
+
+
+def ndjson_records(file: IO[bytes]) -> Iterator[tuple[int, Any]]:
+    """Numbered records of an NDJSON file, blank lines skipped."""
+
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            yield number, json.loads(line)
+        except ValueError as ex:
+            yield number, ex
+
+
+def _validation_message(ex: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in ex.errors()
+    )
+
+
+class ClientRows:
+    """Validated rows of the records, collecting the errors in the report."""
+
+    def __init__(self, report: ImportReport):
+        self.report = report
+        self.lines: dict[tuple[str, str], int] = {}
+
+    def rows(self, records: Iterable[tuple[int, Any]]) -> Iterator[tuple]:
+        for line, record in records:
+            self.report.read += 1
+
+            if isinstance(record, Exception):
+                self.report.error(line, f"Invalid JSON: {record}")
+                continue
+
+            try:
+                client = ClientImport.model_validate(record)
+            except ValidationError as ex:
+                self.report.error(line, _validation_message(ex))
+                continue
+
+            duplicate = next(
+                (
+                    (name, self.lines[(name, getattr(client, name))])
+                    for name in CODE_COLUMNS
+                    if (name, getattr(client, name)) in self.lines
+                ),
+                None,
+            )
+            if duplicate is not None:
+                self.report.error(line, f"Duplicate {duplicate[0]} of line {duplicate[1]}")
+                continue
+
+            for name in CODE_COLUMNS:
+                if getattr(client, name) is not None:
+                    self.lines[(name, getattr(client, name))] = line
+
+            yield (line, *(getattr(client, name) for name in IMPORT_COLUMNS))
+
+
+def import_clients(
+    connection: Connection,
+    enterprise_id: int,
+    records: Iterable[tuple[int, Any]],
+    chunk_rows: int = BULK_CHUNK_ROWS,
+) -> ImportReport:
+    """
+    Imports numbered records as clients of an enterprise, see the module. The
+    caller commits.
+    """
+
+    report = ImportReport()
+    clients = Client.__table__  # type: ignore
+    staging = staging_table(
+        connection,
+        "client_import",
+        [sa.Column("line", sa.Integer), *(clients.c[name] for name in IMPORT_COLUMNS)],
+    )
+    copy_rows(connection, staging, ClientRows(report).rows(records), chunk_rows)
+
+    # One NOT EXISTS per code, each a probe of the index on the code
+    unused_codes = [
+        ~sa.exists().where(
+            clients.c.enterprise_id == enterprise_id, clients.c[name] == staging.c[name]
+        )
+        for name in CODE_COLUMNS
+    ]
+    merge = (
+        sa.insert(clients)
+        .from_select(
+            [*IMPORT_COLUMNS, "enterprise_id"],
+            select(
+                *(staging.c[name] for name in IMPORT_COLUMNS),
+                sa.literal(enterprise_id, sa.Integer),
+            )
+            .where(*unused_codes)
+            .order_by(staging.c.line),
+        )
+        .returning(col(Client.person_code), col(Client.enterprise_code))
+    )
+    inserted = connection.execute(merge).all()
+    report.inserted = len(inserted)
+
+    # A line with a code was inserted when one of its codes came back, codes
+    # being unique in the file; lines without codes are always inserted
+    returned = {
+        (name, getattr(row, name))
+        for row in inserted
+        for name in CODE_COLUMNS
+        if getattr(row, name) is not None
+    }
+    coded = connection.execute(
+        select(staging.c.line, staging.c.person_code, staging.c.enterprise_code)
+        .where(sa.or_(staging.c.person_code.is_not(None), staging.c.enterprise_code.is_not(None)))
+        .order_by(staging.c.line)
+    )
+    for line, person_code, enterprise_code in coded:
+        codes = {("person_code", person_code), ("enterprise_code", enterprise_code)}
+        if not codes & returned:
+            used = " or ".join(
+                name for name, value in sorted(codes) if value is not None
+            )
+            report.error(line, f"A client with this {used} already exists")
+
+    staging.drop(connection)
+    report.errors.sort(key=lambda error: error["line"])
+
+    return report
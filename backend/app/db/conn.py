@@ -1,7 +1,11 @@
 """Module for database setup and utilities using SQLModel and SQLAlchemy."""
 
+from collections.abc import Iterator
+import time
+
 import sqlalchemy as sa
-from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, create_engine
 
 from . import settings as st
 
@@ -11,32 +15,78 @@ SQLALCHEMY_DATABASE_URL = (
 )
 
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=st.DB_POOL_SIZE,
+    max_overflow=st.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    # Compiled SQL per statement shape, see app.db.statements
+    query_cache_size=st.DB_QUERY_CACHE_SIZE,
+)
 
-def create_db():
-    """Creates a new database if it doesn't exist, and removes it if we are in testing mode."""
 
-    if st.ENV == "test":
-        SQLModel.metadata.drop_all(engine)
+def warm_pool(retries: int = st.DB_CONNECT_RETRIES, delay: float = 2.0):
+    """Opens the pool connections up front and checks the database answers.
 
-    # Create tables if they don't exist
-    SQLModel.metadata.create_all(engine)
+    Args:
+        retries: attempts before giving up while the database is not reachable.
+        delay: seconds to wait between attempts.
 
+    Raises:
+        OperationalError: if the database is still unreachable after all retries.
+    """
 
-def get_db():
-    """Gets a new database session and closes it when done.
+    for attempt in range(1, retries + 1):
+        connections = []
+        try:
+            for _ in range(st.DB_POOL_SIZE):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(sa.text("SELECT 1"))
+            return
+        except OperationalError as ex:
+            print(f"Database not reachable (attempt {attempt}/{retries}): {ex}")
+            if attempt == retries:
+                raise
+            time.sleep(delay)
+        finally:
+            for connection in connections:
+                connection.close()
+
+
+def unit_of_work(bind: sa.Engine | sa.Connection) -> Iterator[Session]:
+    """
+    Yields a session for one request and commits it once the request is
+    handled, or rolls it back when the handler raised.
 
-    Yields:
-        Session: a new database session
+    Objects are not expired by the commit: what a handler flushed (ids and
+    defaults come back from the INSERT) stays readable without reloading it.
+    Handlers only commit themselves when something must follow the commit,
+    the final commit is then a no-op.
     """
 
-    session = Session(autocommit=False, autoflush=False, bind=engine)
+    session = Session(bind=bind, autoflush=False, expire_on_commit=False)
     try:
         yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
     finally:
-        if session.is_active:
-            session.close()
+        session.close()
+
+
+def get_db() -> Iterator[Session]:
+    """Request dependency with the unit of work of the request, see `unit_of_work`.
+
+    FastAPI runs the code after the `yield` before sending the response, so a
+    failing commit answers 500 instead of a success.
+
+    Yields:
+        Session: a new database session
+    """
+
+    yield from unit_of_work(engine)
 
 
 GUID_SERVER_DEFAULT_PSQL = sa.DefaultClause(sa.text("gen_random_uuid()"))
@@ -0,0 +1,324 @@
+"""
+Schema management for the Sells database.
+
+Tables are created by SQLModel metadata; changes to tables that already exist
+(new columns, indexes) are kept in MIGRATIONS as idempotent PostgreSQL
+statements applied in order after the tables are created.
+
+This runs once per deployment, before the API workers start, instead of on
+every application import. Indexes are built with CREATE INDEX CONCURRENTLY,
+outside any transaction, so they do not block writes while they build; an
+index an interrupted build left invalid is dropped and built again.
+
+Columns added to tables holding data may also need filling. `--backfill`
+fills `sell.enterprise_id` from the user of each sell (or its product when
+the user has no enterprise), in batches committed one at a time so the table
+is never locked as a whole, then makes the column NOT NULL (see
+`require_sell_enterprise_id`). It runs once, as the job of
+k8s/backfill-job.yaml, while the previous release serves; once the column is
+NOT NULL it returns at once. Tenant queries filter on the column alone, so
+without `--backfill` the command fails while the column is still nullable,
+which holds the rollout of new API workers until the backfill is done.
+
+Settings (environment):
+    SELL_BACKFILL_BATCH: Sells updated per transaction by --backfill
+        (default: 5000).
+
+Usage:
+    python -m app.db.migrate [--drop] [--backfill]
+"""
+
+import argparse
+import os
+import re
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel, col, select, update
+
+from app.db.conn import engine as default_engine
+from app.db import settings as st
+# Registers every table on SQLModel.metadata
+import app.models  # pylint: disable=unused-import
+from app.models.sell import BaseProduct, Sell
+from app.models.user import User
+
+
+SELL_BACKFILL_BATCH = int(os.environ.get("SELL_BACKFILL_BATCH", "5000"))
+# Temporary, see require_sell_enterprise_id
+SELL_ENTERPRISE_ID_CHECK = "sell_enterprise_id_not_null"
+
+MIGRATIONS: list[tuple[str, list[str]]] = [
+    (
+        "product_stock_shards",
+        [
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS stock_shards "
+            "INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+    (
+        "product_reserved",
+        [
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS reserved "
+            "INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+    (
+        # Deleting clients looks up their sells and reservations
+        "client_id_indexes",
+        [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sell_client_id "
+            "ON sell (client_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_stock_reservation_client_id "
+            "ON stock_reservation (client_id)",
+        ],
+    ),
+    (
+        # Filled by --backfill for the sells from before the column, which
+        # then makes it NOT NULL
+        "sell_enterprise_id",
+        [
+            "ALTER TABLE sell ADD COLUMN IF NOT EXISTS enterprise_id INTEGER "
+            "REFERENCES enterprise (id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sell_enterprise_id_created_at "
+            "ON sell (enterprise_id, created_at)",
+        ],
+    ),
+    (
+        # Lookups of products not soft-deleted, and the compaction of the
+        # others (see app.db.products), which checks they have no sells
+        "product_live_indexes",
+        [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "ix_product_live_enterprise_id_id "
+            "ON product (enterprise_id, id) WHERE deleted_at IS NULL",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "ix_product_live_enterprise_id_name "
+            "ON product (enterprise_id, name) WHERE deleted_at IS NULL",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_deleted_at "
+            "ON product (deleted_at) WHERE deleted_at IS NOT NULL",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sell_product_id "
+            "ON sell (product_id)",
+        ],
+    ),
+    (
+        # The rebalance of app.db.stock only scans the sharded products
+        "product_sharded_index",
+        [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_sharded_id "
+            "ON product (id) WHERE stock_shards > 0",
+        ],
+    ),
+]
+
+
+CONCURRENT_INDEX = re.compile(
+    r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+) ON (\w+)"
+)
+
+
+def apply_migrations(engine: Engine):
+    """
+    Applies MIGRATIONS in order, each statement in its own transaction but
+    the concurrent index builds, which cannot run in one. Only PostgreSQL
+    schemas are migrated.
+    """
+
+    if engine.dialect.name != "postgresql":
+        return
+
+    for name, statements in MIGRATIONS:
+        print(f"Applying migration {name}")
+        for statement in statements:
+            if CONCURRENT_INDEX.match(statement):
+                create_index_concurrently(engine, statement)
+            else:
+                with engine.begin() as conn:
+                    conn.execute(sa.text(statement))
+
+
+def create_index_concurrently(engine: Engine, statement: str):
+    """
+    Runs a CREATE INDEX CONCURRENTLY IF NOT EXISTS statement outside of any
+    transaction. A valid index of that name is kept, an invalid one (left by
+    an interrupted build) is dropped first. Partitioned tables cannot build
+    their indexes concurrently, theirs are built by a plain CREATE INDEX; the
+    partition conversion (see app.db.partitions) creates them beforehand.
+    """
+
+    match = CONCURRENT_INDEX.match(statement)
+    assert match is not None
+    index, table = match.groups()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(
+            sa.text(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index)"
+            ),
+            {"index": index},
+        ).scalar()
+        if valid:
+            return
+        if valid is not None:
+            print(f"Rebuilding the invalid index {index}")
+            conn.execute(sa.text(f"DROP INDEX CONCURRENTLY {index}"))
+
+        partitioned = conn.execute(
+            sa.text(
+                "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"
+            ),
+            {"table": table},
+        ).scalar()
+        if partitioned:
+            statement = statement.replace(" CONCURRENTLY", "", 1)
+
+        conn.execute(sa.text(statement))
+
+
+def migrate(engine: Engine = default_engine, drop: bool = False):
+    """Creates missing tables and applies pending schema changes.
+
+    Args:
+        engine: the engine bound to the target database.
+        drop: drops every table first. Only meant for test databases.
+    """
+
+    if drop:
+        print("Dropping all tables")
+        SQLModel.metadata.drop_all(engine)
+
+    SQLModel.metadata.create_all(engine)
+    apply_migrations(engine)
+
+
+def sell_enterprise_id_required(engine: Engine = default_engine) -> bool:
+    """Whether `sell.enterprise_id` is NOT NULL, read from the catalog."""
+
+    columns = sa.inspect(engine).get_columns("sell")
+    return not next(c["nullable"] for c in columns if c["name"] == "enterprise_id")
+
+
+def require_sell_enterprise_id(engine: Engine = default_engine) -> bool:
+    """
+    Makes `sell.enterprise_id` NOT NULL unless a sell still lacks one. SET NOT
+    NULL alone would scan the table under an exclusive lock: a CHECK
+    constraint is added NOT VALID, then validated, which scans the table
+    without blocking writes, and lets SET NOT NULL skip its scan. Only
+    PostgreSQL schemas are changed.
+
+    Returns:
+        bool: whether the column is NOT NULL.
+    """
+
+    required = sell_enterprise_id_required(engine)
+    if required or engine.dialect.name != "postgresql":
+        return required
+
+    check = SELL_ENTERPRISE_ID_CHECK
+    with engine.begin() as conn:
+        conn.execute(sa.text(f"ALTER TABLE sell DROP CONSTRAINT IF EXISTS {check}"))
+        conn.execute(
+            sa.text(
+                f"ALTER TABLE sell ADD CONSTRAINT {check} "
+                "CHECK (enterprise_id IS NOT NULL) NOT VALID"
+            )
+        )
+    try:
+        with engine.begin() as conn:
+            conn.execute(sa.text(f"ALTER TABLE sell VALIDATE CONSTRAINT {check}"))
+    except sa.exc.IntegrityError:
+        return False
+
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text("ALTER TABLE sell ALTER COLUMN enterprise_id SET NOT NULL")
+        )
+        conn.execute(sa.text(f"ALTER TABLE sell DROP CONSTRAINT {check}"))
+
+    return True
+
+
+def backfill_sell_enterprise_ids(
+    engine: Engine = default_engine, batch_rows: int = SELL_BACKFILL_BATCH
+) -> int:
+    """
+    Sets `sell.enterprise_id` to the enterprise of the user of each sell
+    without one, or of its product when the user has none, `batch_rows`
+    sells per transaction by increasing id. The table is walked once, and not
+    at all once the column is NOT NULL.
+
+    Returns:
+        int: sells updated.
+    """
+
+    if sell_enterprise_id_required(engine):
+        return 0
+
+    enterprise_of_sell = sa.func.coalesce(
+        select(col(User.enterprise_id))
+        .where(col(User.id) == col(Sell.user_id))
+        .scalar_subquery(),
+        select(col(BaseProduct.enterprise_id))
+        .where(col(BaseProduct.id) == col(Sell.product_id))
+        .scalar_subquery(),
+    )
+
+    updated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(col(Sell.id))
+                .where(col(Sell.id) > last_id)
+                .where(col(Sell.enterprise_id).is_(None))
+                .order_by(col(Sell.id))
+                .limit(batch_rows)
+            ).scalars().all()
+            if not ids:
+                return updated
+
+            #pylint: disable=no-member
+            updated += conn.execute(
+                update(Sell)
+                .where(col(Sell.id).in_(ids))
+                .values(enterprise_id=enterprise_of_sell)
+            ).rowcount
+
+        last_id = ids[-1]
+        print(f"Backfilled sell.enterprise_id up to sell {last_id} ({updated} sells)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update the database schema")
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        default=st.ENV == "test",
+        help="drop all tables before creating them (default in the test env)",
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="fill the columns added to existing rows, see the module",
+    )
+    args = parser.parse_args()
+
+    migrate(drop=args.drop)
+    print("Schema is up to date")
+
+    if args.backfill:
+        updated = backfill_sell_enterprise_ids()
+        print(f"Backfilled {updated} sells")
+        if not require_sell_enterprise_id():
+            raise SystemExit(
+                "Some sells have no enterprise, neither from their user nor product"
+            )
+    elif not sell_enterprise_id_required():
+        raise SystemExit(
+            "sell.enterprise_id is not filled yet, run `python -m app.db.migrate "
+            "--backfill` (k8s/backfill-job.yaml) first"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Optional monthly range partitioning of the `sell` table by `created_at`.
+
+Partitioning is PostgreSQL only and opt-in: `convert` turns the plain table
+created by the migrations into a partitioned one, once, and from then on
+`maintain` keeps partitions ready ahead of time and detaches the old ones.
+
+Layout after `convert`:
+
+- `sell` is partitioned by range on `created_at`, with the primary key
+  (id, created_at) and indexes on (user_id, created_at),
+  (enterprise_id, created_at), client_id and product_id;
+- one partition per month, named `sell_yYYYYmMM`, covering
+  [first day of the month, first day of the next month);
+- `sell_default` catches rows outside every partition. `maintain` moves its
+  rows into the partition created for their month, so it normally stays
+  empty.
+
+Detached partitions stay in the database as standalone tables with the same
+name, ready to be archived or dropped.
+
+Queries prune partitions when they filter `created_at` with a range, e.g.
+the `start_date`/`end_date` parameters of GET /sells/ and GET /sells/me.
+Lookups by id alone still probe the index of every partition.
+
+Settings (environment):
+    SELL_PARTITIONS_AHEAD: Months created ahead of the current one (default: 3).
+    SELL_PARTITIONS_RETAIN_MONTHS: Months kept attached before the current one,
+        0 keeps every partition (default: 0).
+
+Usage:
+    python -m app.db.partitions convert
+    python -m app.db.partitions maintain [--ahead 3] [--retain-months 24]
+    python -m app.db.partitions status
+"""
+
+import argparse
+from datetime import date, datetime
+import os
+
+import sqlalchemy as sa
+from sqlalchemy import Connection
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from app.db.conn import engine as default_engine
+from app.middlewares.idempotency import utcnow
+
+
+SELL_PARTITIONS_AHEAD = int(os.environ.get("SELL_PARTITIONS_AHEAD", "3"))
+SELL_PARTITIONS_RETAIN_MONTHS = int(os.environ.get("SELL_PARTITIONS_RETAIN_MONTHS", "0"))
+
+DEFAULT_PARTITION = "sell_default"
+# Serializes maintenance between workers, see pg_advisory_xact_lock
+MAINTENANCE_LOCK_ID = 0x5E11
+
+
+def month_start(value: date | datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"sell_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+
+    return bool(
+        connection.execute(
+            sa.text(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass('sell'))"
+            )
+        ).scalar()
+    )
+
+
+def attached_partitions(connection: Connection) -> list[str]:
+    return list(
+        connection.execute(
+            sa.text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('sell') ORDER BY c.relname"
+            )
+        ).scalars()
+    )
+
+
+def create_partition(connection: Connection, month: date) -> bool:
+    """
+    Creates and attaches the partition of `month`, moving into it the rows
+    of the default partition that belong to it.
+
+    Returns:
+        bool: False when the partition already existed.
+    """
+
+    name = partition_name(month)
+    if name in attached_partitions(connection):
+        return False
+
+    bounds = {"start": month, "end": add_months(month, 1)}
+    connection.execute(sa.text(f"CREATE TABLE {name} (LIKE sell INCLUDING DEFAULTS)"))
+    connection.execute(
+        sa.text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    connection.execute(
+        sa.text(
+            f"ALTER TABLE sell ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        )
+    )
+
+    return True
+
+
+def convert_sell_table(connection: Connection, ahead: int = SELL_PARTITIONS_AHEAD) -> int:
+    """
+    Rebuilds `sell` as a partitioned table holding the same rows.
+
+    Rows without `created_at` get the time of the conversion, as the column
+    becomes part of the primary key.
+
+    Returns:
+        int: rows copied.
+    """
+
+    if is_partitioned(connection):
+        print("sell is already partitioned")
+        return 0
+
+    connection.execute(sa.text("LOCK TABLE sell IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(sa.text("ALTER TABLE sell RENAME TO sell_unpartitioned"))
+    # Frees the names of its indexes for the new table, it is dropped at the end
+    for index in connection.execute(
+        sa.text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = 'sell_unpartitioned'::regclass"
+        )
+    ).scalars():
+        connection.execute(sa.text(f"ALTER INDEX {index} RENAME TO {index}_unpartitioned"))
+    connection.execute(
+        sa.text(
+            "CREATE TABLE sell (LIKE sell_unpartitioned INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+    )
+    connection.execute(sa.text("ALTER TABLE sell ALTER COLUMN created_at SET NOT NULL"))
+    connection.execute(sa.text("ALTER TABLE sell ADD PRIMARY KEY (id, created_at)"))
+    for index, columns in (
+        ("ix_sell_user_id_created_at", "user_id, created_at"),
+        ("ix_sell_client_id", "client_id"),
+        ("ix_sell_product_id", "product_id"),
+        ("ix_sell_enterprise_id_created_at", "enterprise_id, created_at"),
+    ):
+        connection.execute(sa.text(f"CREATE INDEX {index} ON sell ({columns})"))
+    for column, target in (
+        ("product_id", "product"),
+        ("client_id", "client"),
+        ("user_id", '"user"'),
+        ("enterprise_id", "enterprise"),
+    ):
+        connection.execute(
+            sa.text(f"ALTER TABLE sell ADD FOREIGN KEY ({column}) REFERENCES {target} (id)")
+        )
+    connection.execute(sa.text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF sell DEFAULT"))
+
+    now = utcnow()
+    first = connection.execute(sa.text("SELECT min(created_at) FROM sell_unpartitioned")).scalar()
+    month = month_start(first or now)
+    last = add_months(month_start(now), ahead)
+    while month <= last:
+        create_partition(connection, month)
+        month = add_months(month, 1)
+
+    copied = connection.execute(
+        sa.text(
+            "INSERT INTO sell (id, product_id, client_id, quantity, user_id, created_at, "
+            "enterprise_id) SELECT id, product_id, client_id, quantity, user_id, "
+            "COALESCE(created_at, :now), enterprise_id FROM sell_unpartitioned"
+        ),
+        {"now": now},
+    ).rowcount
+
+    connection.execute(sa.text("ALTER SEQUENCE sell_id_seq OWNED BY sell.id"))
+    connection.execute(sa.text("DROP TABLE sell_unpartitioned"))
+
+    return copied
+
+
+def maintain_partitions(
+    connection: Connection,
+    ahead: int = SELL_PARTITIONS_AHEAD,
+    retain_months: int = SELL_PARTITIONS_RETAIN_MONTHS,
+    today: date | None = None,
+) -> tuple[list[str], list[str]]:
+    """
+    Creates the partitions up to `ahead` months from now and detaches those
+    older than `retain_months` (when above 0).
+
+    Returns:
+        tuple[list[str], list[str]]: partitions created and detached.
+    """
+
+    connection.execute(sa.text("SELECT pg_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+
+    current = month_start(today or utcnow())
+    created = [
+        partition_name(add_months(current, months))
+        for months in range(ahead + 1)
+        if create_partition(connection, add_months(current, months))
+    ]
+
+    detached = []
+    if retain_months > 0:
+        oldest_kept = partition_name(add_months(current, -retain_months))
+        for name in attached_partitions(connection):
+            if name != DEFAULT_PARTITION and name < oldest_kept:
+                connection.execute(sa.text(f"ALTER TABLE sell DETACH PARTITION {name}"))
+                detached.append(name)
+
+    return created, detached
+
+
+def maintain_sell_partitions(session: Session) -> int:
+    """Periodic job: maintain_partitions when `sell` is partitioned."""
+
+    connection = session.connection()
+    if not is_partitioned(connection):
+        return 0
+
+    created, detached = maintain_partitions(connection)
+    session.commit()
+
+    return len(created) + len(detached)
+
+
+def main(engine: Engine = default_engine):
+    parser = argparse.ArgumentParser(description="Partitioning of the sell table")
+    parser.add_argument("command", choices=("convert", "maintain", "status"))
+    parser.add_argument("--ahead", type=int, default=SELL_PARTITIONS_AHEAD)
+    parser.add_argument("--retain-months", type=int, default=SELL_PARTITIONS_RETAIN_MONTHS)
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        if args.command == "convert":
+            print(f"Copied {convert_sell_table(connection, args.ahead)} sells")
+        elif args.command == "maintain":
+            created, detached = maintain_partitions(connection, args.ahead, args.retain_months)
+            print(f"Created: {created or 'none'}, detached: {detached or 'none'}")
+
+        if not is_partitioned(connection):
+            print("sell is not partitioned")
+            return
+
+        for name in attached_partitions(connection):
+            print(name)
+
+
+if __name__ == "__main__":
+    main()
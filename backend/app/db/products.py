@@ -0,0 +1,86 @@
+"""
+Soft-deleted products.
+
+A product is deleted by setting its `deleted_at`, the row stays so the sells
+made before keep their product, for stock returns and analytics. Product
+lookups of the sell paths only see the products with `deleted_at IS NULL`
+(see app.db.statements), through the partial indexes on (enterprise_id, id)
+and (enterprise_id, name) which leave the deleted ones out.
+
+`compact_deleted_products` (a periodic job) hard-deletes the products
+deleted for more than PRODUCT_COMPACT_AFTER_DAYS that no sell or reservation
+refers to anymore, with their stock shards. Products with sells are kept as
+long as their sells are.
+
+Settings (environment):
+    PRODUCT_COMPACT_AFTER_DAYS: Days a product stays soft-deleted before it
+        is compacted (default: 90).
+    PRODUCT_COMPACT_BATCH: Products deleted per transaction (default: 500).
+    PRODUCT_COMPACT_INTERVAL_SECONDS: Interval of `compact_deleted_products`,
+        see app.tasks (default: 3600).
+"""
+
+from datetime import timedelta
+import os
+
+import sqlalchemy as sa
+from sqlmodel import Session, col, delete, select
+
+from app.middlewares.idempotency import utcnow
+from app.models.reservation import StockReservation
+from app.models.sell import BaseProduct, ProductStockShard, Sell
+
+
+PRODUCT_COMPACT_AFTER_DAYS = int(os.environ.get("PRODUCT_COMPACT_AFTER_DAYS", "90"))
+PRODUCT_COMPACT_BATCH = int(os.environ.get("PRODUCT_COMPACT_BATCH", "500"))
+
+
+def compact_deleted_products(
+    session: Session,
+    batch_size: int = PRODUCT_COMPACT_BATCH,
+    after_days: int = PRODUCT_COMPACT_AFTER_DAYS,
+) -> int:
+    """
+    Deletes long soft-deleted products without sells nor reservations, see
+    the module, committing after each batch. Products locked by another
+    transaction are skipped until the next run.
+
+    Returns:
+        int: number of products deleted.
+    """
+
+    cutoff = utcnow() - timedelta(days=after_days)
+    total = 0
+    last_id = 0
+
+    while True:
+        product_ids = session.exec(
+            select(col(BaseProduct.id))
+            .where(col(BaseProduct.deleted_at) < cutoff)
+            .where(col(BaseProduct.id) > last_id)
+            .where(~sa.exists().where(col(Sell.product_id) == col(BaseProduct.id)))
+            .where(
+                ~sa.exists().where(col(StockReservation.product_id) == col(BaseProduct.id))
+            )
+            .order_by(col(BaseProduct.id))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True, of=BaseProduct)  # type: ignore
+        ).all()
+
+        if product_ids:
+            #pylint: disable=no-member
+            session.exec(  # type: ignore
+                delete(ProductStockShard).where(
+                    col(ProductStockShard.product_id).in_(product_ids)
+                )
+            )
+            session.exec(  # type: ignore
+                delete(BaseProduct).where(col(BaseProduct.id).in_(product_ids))
+            )
+        session.commit()
+        total += len(product_ids)
+
+        if len(product_ids) < batch_size:
+            return total
+
+        last_id = product_ids[-1]
@@ -0,0 +1,327 @@
+"""
+Full resync of the users of an enterprise from an RH snapshot.
+
+The snapshot is NDJSON, one user per line in the UserRead shape of the RH
+events (with nested `role`, `scope` and `enterprise`), read from a file or
+streamed from an HTTP endpoint. Users are loaded in chunks into a temporary
+staging table, so memory stays bounded by the chunk size whatever the number
+of users; roles and scopes, a handful per enterprise, are collected on the
+way. A user repeated in the snapshot is staged from its first line only, the
+later ones are counted as repeated; a user whose id belongs to another
+enterprise is left out and counted as foreign.
+
+The local tables are then brought in line with set-based statements, in one
+transaction:
+
+- roles and scopes of the snapshot are upserted, only over those of the
+  enterprise;
+- users are upserted from the staging table, only over those of the
+  enterprise, rows equal to the snapshot are left untouched;
+- users of the enterprise missing from the snapshot are deleted, unless sells,
+  products or reservations still refer to them (reported as kept);
+- the event watermarks of the snapshot users are raised to the time the
+  snapshot was taken, so RH events older than the snapshot are dropped (see
+  app.messages.watermark). That time is given by the operator: the time of
+  the resync would also drop the events still queued when it starts, which
+  are newer than the snapshot.
+
+As for the RH events, only users with the All or Sells scope are kept.
+
+Usage:
+    python -m app.db.resync --enterprise-id 1 --as-of 2024-05-01T12:00:00Z \
+        --file users.ndjson
+    python -m app.db.resync --enterprise-id 1 --as-of 2024-05-01T12:00:00Z \
+        --url http://localhost:8090/users.ndjson
+"""
+
+import argparse
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import json
+import time
+from typing import Any
+import urllib.request
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from sqlmodel import col, select
+
+from app.db.bulk import BULK_CHUNK_ROWS, copy_rows, staging_table
+from app.db.conn import engine as default_engine
+from app.db.upsert import insert_for
+from app.messages.batch import SYNCED_SCOPES, USER_COLUMNS, user_row
+from app.messages.watermark import event_version
+from app.models.enterprise import Enterprise
+from app.models.reservation import StockReservation
+from app.models.role import Role
+from app.models.scope import Scope
+from app.models.sell import BaseProduct, Sell
+from app.models.user import User
+from app.models.watermark import UserEventWatermark
+
+
+@dataclass
+class ResyncReport:
+    enterprise_id: int
+    read: int = 0
+    skipped: int = 0
+    repeated: int = 0
+    foreign: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    kept: int = 0
+    roles: int = 0
+    scopes: int = 0
+    elapsed_seconds: float = 0.0
+
+
+def read_lines(path: str | None = None, url: str | None = None) -> Iterator[bytes]:
+    """Streams the snapshot lines of a file or of an HTTP response."""
+
+    if url is not None:
+        with urllib.request.urlopen(url) as response:  # nosec - operator supplied
+            yield from response
+        return
+
+    assert path is not None
+    with open(path, "rb") as file:
+        yield from file
+
+
+class SnapshotReader:
+    """Turns snapshot lines into user rows, collecting roles and scopes."""
+
+    def __init__(self, enterprise_id: int, report: ResyncReport):
+        self.enterprise_id = enterprise_id
+        self.report = report
+        self.enterprise: dict[str, Any] | None = None
+        self.roles: dict[int, dict[str, Any]] = {}
+        self.scopes: dict[int, dict[str, Any]] = {}
+
+    def rows(self, lines: Iterable[bytes | str]) -> Iterator[tuple]:
+        """Numbered user rows, in the `line` and USER_COLUMNS order."""
+
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+
+            self.report.read += 1
+            user = json.loads(line)
+            scope = user.get("scope") or {}
+            enterprise = user.get("enterprise") or {}
+
+            if (
+                enterprise.get("id", user.get("enterprise_id")) != self.enterprise_id
+                or scope.get("name") not in SYNCED_SCOPES
+            ):
+                self.report.skipped += 1
+                continue
+
+            if self.enterprise is None and enterprise:
+                self.enterprise = enterprise
+
+            if user.get("role"):
+                self.roles[user["role"]["id"]] = user["role"]
+            self.scopes[scope["id"]] = scope
+
+            row = user_row(user)
+            yield (number, *(row[name] for name in USER_COLUMNS))
+
+
+def _upsert_relations(
+    connection: sa.Connection, reader: SnapshotReader
+) -> tuple[int, int]:
+    if reader.enterprise is not None:
+        connection.execute(
+            insert_for(connection, Enterprise)
+            .values(
+                id=reader.enterprise_id,
+                name=reader.enterprise["name"],
+                accountable_email=reader.enterprise["accountable_email"],
+            )
+            .on_conflict_do_nothing(index_elements=["id"])
+        )
+
+    changed = []
+    for model, relations, fields in (
+        (Role, reader.roles, ("name", "hierarchy")),
+        (Scope, reader.scopes, ("name",)),
+    ):
+        if not relations:
+            changed.append(0)
+            continue
+
+        statement = insert_for(connection, model).values(
+            [
+                {
+                    "id": relation["id"],
+                    "enterprise_id": reader.enterprise_id,
+                    **{field: relation[field] for field in fields},
+                }
+                for relation in relations.values()
+            ]
+        )
+        table = model.__table__  # type: ignore
+        statement = statement.on_conflict_do_update(
+            index_elements=["id"],
+            set_={field: statement.excluded[field] for field in fields},
+            where=sa.and_(
+                table.c.enterprise_id == reader.enterprise_id,
+                sa.or_(
+                    *(
+                        table.c[field].is_distinct_from(statement.excluded[field])
+                        for field in fields
+                    )
+                ),
+            ),
+        )
+        changed.append(connection.execute(statement).rowcount)
+
+    return changed[0], changed[1]
+
+
+def resync_users(
+    enterprise_id: int,
+    lines: Iterable[bytes | str],
+    as_of: datetime,
+    engine: Engine = default_engine,
+    chunk_rows: int = BULK_CHUNK_ROWS,
+) -> ResyncReport:
+    """
+    Replaces the users of an enterprise with a snapshot, see the module.
+
+    Args:
+        enterprise_id: the enterprise of the snapshot; lines of other
+            enterprises are skipped.
+        lines: NDJSON lines, one user each.
+        as_of: time the snapshot was taken, naive UTC unless it has a time
+            zone; RH events older than it are dropped afterwards.
+        engine: the engine of the Sells database.
+        chunk_rows: users loaded per COPY.
+    """
+
+    started = time.perf_counter()
+    as_of = event_version(as_of)
+    report = ResyncReport(enterprise_id=enterprise_id)
+    reader = SnapshotReader(enterprise_id, report)
+    users = User.__table__  # type: ignore
+    columns = [users.c[name] for name in USER_COLUMNS]
+
+    with engine.begin() as connection:
+        staging = staging_table(
+            connection, "user_snapshot", [sa.Column("line", sa.Integer), *columns]
+        )
+        copy_rows(connection, staging, reader.rows(lines), chunk_rows)
+
+        # ON CONFLICT DO UPDATE cannot affect a row twice in one statement
+        earlier = staging.alias("earlier")
+        report.repeated = connection.execute(
+            sa.delete(staging).where(
+                sa.exists().where(
+                    earlier.c.id == staging.c.id, earlier.c.line < staging.c.line
+                )
+            )
+        ).rowcount
+        report.foreign = connection.execute(
+            sa.delete(staging).where(
+                sa.exists().where(
+                    users.c.id == staging.c.id, users.c.enterprise_id != enterprise_id
+                )
+            )
+        ).rowcount
+        connection.execute(sa.text("ANALYZE user_snapshot"))
+
+        report.roles, report.scopes = _upsert_relations(connection, reader)
+
+        report.inserted = connection.execute(
+            select(sa.func.count()).select_from(staging).where(
+                ~sa.exists().where(users.c.id == staging.c.id)
+            )
+        ).scalar_one()
+
+        upsert = insert_for(connection, User).from_select(
+            list(USER_COLUMNS),
+            select(*(staging.c[name] for name in USER_COLUMNS)).where(sa.true()),
+        )
+        updated_columns = [
+            name for name in USER_COLUMNS if name not in ("id", "created_at")
+        ]
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["id"],
+            set_={name: upsert.excluded[name] for name in updated_columns},
+            where=sa.and_(
+                users.c.enterprise_id == enterprise_id,
+                sa.or_(
+                    *(
+                        users.c[name].is_distinct_from(upsert.excluded[name])
+                        for name in updated_columns
+                    )
+                ),
+            ),
+        )
+        report.updated = connection.execute(upsert).rowcount - report.inserted
+
+        missing = sa.and_(
+            users.c.enterprise_id == enterprise_id,
+            ~sa.exists().where(staging.c.id == users.c.id),
+        )
+        referenced = sa.or_(
+            sa.exists().where(col(Sell.user_id) == users.c.id),
+            sa.exists().where(col(BaseProduct.created_by) == users.c.id),
+            sa.exists().where(col(BaseProduct.last_updated_by) == users.c.id),
+            sa.exists().where(col(StockReservation.user_id) == users.c.id),
+        )
+        report.kept = connection.execute(
+            select(sa.func.count()).select_from(users).where(missing, referenced)
+        ).scalar_one()
+        report.deleted = connection.execute(
+            sa.delete(users).where(missing, ~referenced)
+        ).rowcount
+
+        watermarks = UserEventWatermark.__table__  # type: ignore
+        raise_watermarks = insert_for(connection, UserEventWatermark).from_select(
+            ["user_id", "applied_at"],
+            select(staging.c.id, sa.literal(as_of, sa.DateTime)).where(sa.true()),
+        )
+        connection.execute(
+            raise_watermarks.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={"applied_at": raise_watermarks.excluded.applied_at},
+                where=watermarks.c.applied_at < raise_watermarks.excluded.applied_at,
+            )
+        )
+
+        staging.drop(connection)
+
+    report.elapsed_seconds = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resync the users of an enterprise")
+    parser.add_argument("--enterprise-id", type=int, required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="NDJSON snapshot file")
+    source.add_argument("--url", help="URL streaming the NDJSON snapshot")
+    parser.add_argument(
+        "--as-of",
+        type=datetime.fromisoformat,
+        required=True,
+        help="time the snapshot was taken, naive UTC unless it has a time zone",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=BULK_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    report = resync_users(
+        args.enterprise_id,
+        read_lines(path=args.file, url=args.url),
+        args.as_of,
+        chunk_rows=args.chunk_rows,
+    )
+    print(json.dumps(asdict(report), indent=2))
+
+
+if __name__ == "__main__":
+    main()
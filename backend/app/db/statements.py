@@ -0,0 +1,192 @@
+"""
+Statements of the request paths, built once.
+
+Building a select() and computing its cache key walks the whole expression,
+which costs more than the compiled SQL lookup it leads to, on every request.
+The statements here are constants with bindparam() placeholders, executed
+with `params=`; their cache key is computed once and memoized, so running
+one only costs the lookup of its compiled SQL in the cache of the engine
+(DB_QUERY_CACHE_SIZE entries, see app.db.settings). Queries with optional
+filters are built once per combination of filters by the lru_cache of their
+builder, whose flags tell which filters are given; parameters of absent
+filters are ignored. bench/compile_cost.py measures both ways.
+
+Product lookups leave out soft-deleted products, see app.db.products.
+
+Parameters are named after the columns they compare to: `product_id`,
+`client_id`, `user_id`, `enterprise_id`, `reservation_id`, `name`,
+`person_code`, `enterprise_code`, `start_date` and `end_date` (naive UTC,
+see app.router.sell.naive_utc), `user_ids` (a list), and `last_id` and
+`limit` for chunked reads.
+"""
+
+from functools import lru_cache
+
+from sqlalchemy import bindparam
+from sqlmodel import col, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.models.reservation import StockReservation
+from app.models.sell import BaseProduct, Client, Sell
+from app.models.user import User
+
+
+# Columns of ClientRead and BaseSell, selected as plain rows for read routes
+CLIENT_COLUMNS = (
+    col(Client.id),
+    col(Client.name),
+    col(Client.description),
+    col(Client.enterprise_code),
+    col(Client.person_code),
+)
+SELL_COLUMNS = (
+    col(Sell.id),
+    col(Sell.product_id),
+    col(Sell.client_id),
+    col(Sell.quantity),
+    col(Sell.user_id),
+    col(Sell.created_at),
+)
+
+USER_ID = select(col(User.id)).where(col(User.id) == bindparam("user_id"))
+
+PRODUCT = (
+    select(BaseProduct)
+    .where(col(BaseProduct.id) == bindparam("product_id"))
+    .where(col(BaseProduct.enterprise_id) == bindparam("enterprise_id"))
+    .where(col(BaseProduct.deleted_at).is_(None))
+)
+PRODUCT_FOR_UPDATE = PRODUCT.with_for_update()
+
+# With its creator, whose enterprise POST /sells/ checks
+PRODUCT_AND_CREATOR = (
+    select(BaseProduct, User)
+    .where(col(BaseProduct.id) == bindparam("product_id"))
+    .where(col(BaseProduct.deleted_at).is_(None))
+    .join(User, onclause=col(BaseProduct.created_by) == col(User.id))
+)
+
+CLIENT = (
+    select(Client)
+    .where(col(Client.id) == bindparam("client_id"))
+    .where(col(Client.enterprise_id) == bindparam("enterprise_id"))
+)
+
+# Sells by (user_id, client_id, product_id) of the enterprise
+SELL = (
+    select(Sell)
+    .where(col(Sell.user_id) == bindparam("user_id"))
+    .where(col(Sell.client_id) == bindparam("client_id"))
+    .where(col(Sell.product_id) == bindparam("product_id"))
+    .where(col(Sell.enterprise_id) == bindparam("enterprise_id"))
+)
+
+# The same with their product, whose stock gets the quantity back
+SELL_AND_PRODUCT_FOR_UPDATE = (
+    select(Sell, BaseProduct)
+    .where(col(Sell.user_id) == bindparam("user_id"))
+    .where(col(Sell.client_id) == bindparam("client_id"))
+    .where(col(Sell.product_id) == bindparam("product_id"))
+    .where(col(Sell.enterprise_id) == bindparam("enterprise_id"))
+    .join(BaseProduct, onclause=col(Sell.product_id) == col(BaseProduct.id))
+    .with_for_update(of=Sell)
+)
+
+# Reservations of the current user
+RESERVATION = (
+    select(StockReservation)
+    .where(col(StockReservation.id) == bindparam("reservation_id"))
+    .where(col(StockReservation.user_id) == bindparam("user_id"))
+)
+RESERVATION_FOR_UPDATE = RESERVATION.with_for_update()
+
+
+@lru_cache
+def clients(name: bool, person_code: bool, enterprise_code: bool) -> SelectOfScalar:
+    """Clients of `enterprise_id`, filtered by the flagged columns."""
+
+    query = select(*CLIENT_COLUMNS).where(
+        col(Client.enterprise_id) == bindparam("enterprise_id")
+    )
+
+    if name:
+        query = query.where(col(Client.name) == bindparam("name"))
+    if person_code:
+        query = query.where(col(Client.person_code) == bindparam("person_code"))
+    if enterprise_code:
+        query = query.where(col(Client.enterprise_code) == bindparam("enterprise_code"))
+
+    return query
+
+
+def created_between(
+    query: SelectOfScalar, start_date: bool, end_date: bool
+) -> SelectOfScalar:
+    """
+    Restricts a sell query to `start_date <= created_at < end_date`, either
+    bound being optional. A bounded range lets PostgreSQL skip the monthly
+    partitions outside of it when `sell` is partitioned (see app.db.partitions).
+    """
+
+    if start_date:
+        query = query.where(col(Sell.created_at) >= bindparam("start_date"))
+    if end_date:
+        query = query.where(col(Sell.created_at) < bindparam("end_date"))
+
+    return query
+
+
+@lru_cache
+def my_sells(start_date: bool, end_date: bool) -> SelectOfScalar:
+    """Sells of `user_id` by id."""
+
+    return created_between(
+        select(*SELL_COLUMNS)
+        .where(col(Sell.user_id) == bindparam("user_id"))
+        .order_by(col(Sell.id)),
+        start_date,
+        end_date,
+    )
+
+
+@lru_cache
+def enterprise_users(user_ids: bool) -> SelectOfScalar:
+    """Ids and names of the users of `enterprise_id`, among `user_ids` if flagged."""
+
+    query = select(col(User.id), col(User.username)).where(
+        col(User.enterprise_id) == bindparam("enterprise_id")
+    )
+    if user_ids:
+        #pylint: disable=no-member
+        query = query.where(col(User.id).in_(bindparam("user_ids", expanding=True)))
+
+    return query
+
+
+@lru_cache
+def enterprise_sells(
+    start_date: bool, end_date: bool, user_ids: bool, chunked: bool = False
+) -> SelectOfScalar:
+    """
+    Sells of `enterprise_id` by id, of `user_ids` if flagged. Chunked, it
+    reads the next `limit` sells after `last_id`.
+    """
+
+    query = created_between(
+        select(*SELL_COLUMNS)
+        .where(col(Sell.enterprise_id) == bindparam("enterprise_id"))
+        .order_by(col(Sell.id)),
+        start_date,
+        end_date,
+    )
+    if user_ids:
+        #pylint: disable=no-member
+        query = query.where(
+            col(Sell.user_id).in_(bindparam("user_ids", expanding=True))
+        )
+    if chunked:
+        query = query.where(col(Sell.id) > bindparam("last_id")).limit(
+            bindparam("limit")
+        )
+
+    return query
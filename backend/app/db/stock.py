@@ -0,0 +1,389 @@
+"""
+Stock operations for products, with an optional hot-product mode.
+
+By default the stock of a product lives in `product.stock` and every sale
+decrements that row, so concurrent sales of the same product serialize on its
+row lock. A product with `stock_shards > 0` keeps its stock split across that
+many `product_stock_shard` rows instead (and `product.stock` stays at 0):
+
+- a sale locks one random shard holding enough stock, preferring shards not
+  locked by other sales, and only locks every shard when no single one is
+  enough;
+- returned stock goes to a random shard;
+- the total stock is the sum of the shards;
+- `rebalance_stock_shards` (a periodic job) evens the shards out, so sales
+  keep finding shards with enough stock as they drain.
+
+Reservations take their quantity out of the stock when they are created and
+add it to the `product.reserved` counter, so the stock is always what can be
+sold or reserved, in both modes, and neither needs to scan reservations.
+Expired holds are given back in batches by `expire_stock_reservations`.
+
+Settings (environment):
+    STOCK_REBALANCE_BATCH: Sharded products read at a time by the rebalance,
+        which goes through all of them on every run (default: 100).
+    RESERVATION_EXPIRE_BATCH: Reservations expired per transaction (default: 500).
+"""
+
+from collections import Counter
+import os
+import random
+
+from sqlalchemy import func, literal
+from sqlmodel import Session, col, delete, select, update
+from sqlmodel.sql.expression import Select
+
+from app.middlewares.idempotency import utcnow
+from app.models.reservation import ReservationStatus, StockReservation
+from app.models.sell import BaseProduct, ProductStockShard
+
+
+STOCK_REBALANCE_BATCH = int(os.environ.get("STOCK_REBALANCE_BATCH", "100"))
+RESERVATION_EXPIRE_BATCH = int(os.environ.get("RESERVATION_EXPIRE_BATCH", "500"))
+
+
+def split_stock(total: int, shards: int) -> list[int]:
+    """Splits a stock as evenly as possible, the remainder going to the first shards."""
+
+    size, remainder = divmod(total, shards)
+    return [size + (1 if shard < remainder else 0) for shard in range(shards)]
+
+
+def _lock_shards(session: Session, product_id: int) -> list[ProductStockShard]:
+    # Always locked in shard order, so two sessions locking every shard of the
+    # same product cannot deadlock.
+    return list(
+        session.exec(
+            select(ProductStockShard)
+            .where(col(ProductStockShard.product_id) == product_id)
+            .order_by(col(ProductStockShard.shard))
+            .with_for_update()
+        ).all()
+    )
+
+
+def get_total_stock(session: Session, product: BaseProduct) -> int:
+    """Returns the stock of a product, summing its shards in hot-product mode."""
+
+    if not product.stock_shards:
+        return product.stock
+
+    total = session.exec(
+        select(func.coalesce(func.sum(ProductStockShard.stock), 0)).where(
+            col(ProductStockShard.product_id) == product.id
+        )
+    ).one()
+
+    return int(total)
+
+
+def take_stock(session: Session, product: BaseProduct, quantity: int) -> bool:
+    """
+    Removes `quantity` from the stock of a product in the current transaction.
+
+    The product row itself does not need to be locked: the decrement is a
+    conditional UPDATE of the product row, or of a shard in hot-product mode.
+
+    Returns:
+        bool: False when there is not enough stock, nothing is changed then.
+    """
+
+    if not product.stock_shards:
+        result = session.exec(  # type: ignore
+            update(BaseProduct)
+            .where(col(BaseProduct.id) == product.id)
+            .where(col(BaseProduct.stock) >= quantity)
+            .values(stock=col(BaseProduct.stock) - quantity)
+        )
+        return result.rowcount == 1
+
+    # A free shard first, then, when every shard is taken by other sales, wait
+    # for a random one. Once the lock is granted PostgreSQL checks the stock
+    # condition again, moving on to the next shard if it no longer holds.
+    for skip_locked in (True, False):
+        shard = session.exec(
+            select(ProductStockShard)
+            .where(col(ProductStockShard.product_id) == product.id)
+            .where(col(ProductStockShard.stock) >= quantity)
+            .order_by(func.random())
+            .limit(1)
+            .with_for_update(skip_locked=skip_locked)
+        ).first()
+
+        if shard is not None:
+            shard.stock -= quantity
+            session.add(shard)
+            return True
+
+    # No single shard holds the quantity: wait for all of them.
+    shards = _lock_shards(session, product.id)  # type: ignore
+
+    if sum(x.stock for x in shards) < quantity:
+        return False
+
+    remaining = quantity
+    for x in sorted(shards, key=lambda s: s.stock, reverse=True):
+        taken = min(x.stock, remaining)
+        x.stock -= taken
+        remaining -= taken
+        session.add(x)
+
+        if remaining == 0:
+            break
+
+    return True
+
+
+def put_stock(session: Session, product: BaseProduct, quantity: int):
+    """Adds `quantity` back to the stock of a product in the current transaction."""
+
+    if not product.stock_shards:
+        session.exec(  # type: ignore
+            update(BaseProduct)
+            .where(col(BaseProduct.id) == product.id)
+            .values(stock=col(BaseProduct.stock) + quantity)
+        )
+        return
+
+    shard = session.exec(
+        select(ProductStockShard)
+        .where(col(ProductStockShard.product_id) == product.id)
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update()
+    ).first()
+
+    if shard is None:
+        raise ValueError(f"Product {product.id} has no stock shards")
+
+    shard.stock += quantity
+    session.add(shard)
+
+
+def put_stock_totals(session: Session, quantities: Select):
+    """
+    Adds quantities back to the stock of many products in the current
+    transaction. `quantities` selects `product_id` and `quantity` columns,
+    with any number of rows per product; they are summed per product and
+    added by one UPDATE of the products and one of the shards, a random shard
+    per sharded product.
+    """
+
+    rows = quantities.subquery()
+    totals = (
+        select(rows.c.product_id, func.sum(rows.c.quantity).label("quantity"))
+        .group_by(rows.c.product_id)
+        .subquery()
+    )
+
+    session.exec(  # type: ignore
+        update(BaseProduct)
+        .where(col(BaseProduct.id) == totals.c.product_id)
+        .where(col(BaseProduct.stock_shards) == 0)
+        .values(stock=col(BaseProduct.stock) + totals.c.quantity)
+    )
+
+    sharded = (
+        select(totals.c.product_id, totals.c.quantity, col(BaseProduct.stock_shards))
+        .join(BaseProduct, onclause=col(BaseProduct.id) == totals.c.product_id)
+        .where(col(BaseProduct.stock_shards) > 0)
+        .subquery()
+    )
+    session.exec(  # type: ignore
+        update(ProductStockShard)
+        .where(col(ProductStockShard.product_id) == sharded.c.product_id)
+        .where(
+            col(ProductStockShard.shard)
+            == literal(random.randrange(2**31)) % sharded.c.stock_shards
+        )
+        .values(stock=col(ProductStockShard.stock) + sharded.c.quantity)
+    )
+
+
+def _add_reserved(session: Session, product_id: int, quantity: int):
+    session.exec(  # type: ignore
+        update(BaseProduct)
+        .where(col(BaseProduct.id) == product_id)
+        .values(reserved=col(BaseProduct.reserved) + quantity)
+    )
+
+
+def hold_stock(session: Session, product: BaseProduct, quantity: int) -> bool:
+    """
+    Moves `quantity` from the stock of a product to its reserved counter.
+
+    Returns:
+        bool: False when there is not enough stock, nothing is changed then.
+    """
+
+    if not take_stock(session, product, quantity):
+        return False
+
+    _add_reserved(session, product.id, quantity)  # type: ignore
+    return True
+
+
+def release_held_stock(
+    session: Session, product: BaseProduct, quantity: int, sold: bool = False
+):
+    """
+    Removes `quantity` from the reserved counter of a product, giving it back
+    to the stock unless the reservation was `sold`.
+    """
+
+    if not sold:
+        put_stock(session, product, quantity)
+
+    _add_reserved(session, product.id, -quantity)  # type: ignore
+
+
+def set_stock_shards(session: Session, product: BaseProduct, shards: int) -> int:
+    """
+    Enables, resizes or (with 0 shards) disables hot-product mode for a product,
+    redistributing its whole stock. The product row must be locked by the
+    caller; the shards are locked here, so this waits for in-flight sales.
+    The caller commits.
+
+    Returns:
+        int: the total stock of the product.
+    """
+
+    current = _lock_shards(session, product.id)  # type: ignore
+    total = product.stock + sum(x.stock for x in current)
+
+    if shards == 0:
+        session.exec(  # type: ignore
+            delete(ProductStockShard).where(
+                col(ProductStockShard.product_id) == product.id
+            )
+        )
+        product.stock = total
+    else:
+        by_number = {x.shard: x for x in current}
+
+        for number, stock in enumerate(split_stock(total, shards)):
+            shard = by_number.pop(number, None) or ProductStockShard(
+                product_id=product.id, shard=number  # type: ignore
+            )
+            shard.stock = stock
+            session.add(shard)
+
+        for extra in by_number.values():
+            session.delete(extra)
+
+        product.stock = 0
+
+    product.stock_shards = shards
+    session.add(product)
+    session.flush()
+
+    return total
+
+
+def rebalance_stock_shards(
+    session: Session, batch_size: int = STOCK_REBALANCE_BATCH
+) -> int:
+    """
+    Evens out the shards of every sharded product, committing after each
+    product. Shards locked by in-flight sales are skipped and left as they
+    are. The sharded products are read `batch_size` at a time by increasing
+    id from the partial index ix_product_sharded_id, and one worker at a time
+    runs this job (see app.tasks).
+
+    Returns:
+        int: number of products rebalanced.
+    """
+
+    rebalanced = 0
+    last_id = 0
+
+    while True:
+        product_ids = session.exec(
+            select(BaseProduct.id)
+            .where(col(BaseProduct.stock_shards) > 0)
+            .where(col(BaseProduct.id) > last_id)
+            .order_by(col(BaseProduct.id))
+            .limit(batch_size)
+        ).all()
+        session.commit()
+
+        if not product_ids:
+            return rebalanced
+
+        for product_id in product_ids:
+            rebalanced += rebalance_product_shards(session, product_id)
+
+        last_id = product_ids[-1]
+
+
+def rebalance_product_shards(session: Session, product_id: int) -> bool:
+    """Evens out the shards of a product and commits, telling if any moved."""
+
+    shards = list(
+        session.exec(
+            select(ProductStockShard)
+            .where(col(ProductStockShard.product_id) == product_id)
+            .order_by(col(ProductStockShard.shard))
+            .with_for_update(skip_locked=True)
+        ).all()
+    )
+    stocks = [x.stock for x in shards]
+
+    if len(shards) < 2 or max(stocks) - min(stocks) <= 1:
+        session.commit()
+        return False
+
+    for shard, stock in zip(shards, split_stock(sum(stocks), len(shards))):
+        shard.stock = stock
+        session.add(shard)
+
+    session.commit()
+    return True
+
+
+def expire_stock_reservations(
+    session: Session, batch_size: int = RESERVATION_EXPIRE_BATCH
+) -> int:
+    """
+    Expires held reservations past `expires_at`, giving their stock back with
+    one update per product and batch, and committing after each batch.
+
+    Returns:
+        int: number of reservations expired.
+    """
+
+    total = 0
+
+    while True:
+        reservations = session.exec(
+            select(StockReservation)
+            .where(col(StockReservation.status) == ReservationStatus.HELD.value)
+            .where(col(StockReservation.expires_at) <= utcnow())
+            .order_by(col(StockReservation.expires_at))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        if not reservations:
+            session.commit()
+            return total
+
+        quantities: Counter[int] = Counter()
+        for reservation in reservations:
+            reservation.status = ReservationStatus.EXPIRED.value
+            quantities[reservation.product_id] += reservation.quantity
+            session.add(reservation)
+
+        products = session.exec(
+            select(BaseProduct)
+            .where(col(BaseProduct.id).in_(quantities))
+            .order_by(col(BaseProduct.id))
+        ).all()
+        for product in products:
+            release_held_stock(session, product, quantities[product.id])  # type: ignore
+
+        session.commit()
+        total += len(reservations)
+
+        if len(reservations) < batch_size:
+            return total
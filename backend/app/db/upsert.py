@@ -0,0 +1,82 @@
+"""
+Dialect-aware `INSERT ... ON CONFLICT DO UPDATE` for SQLModel tables.
+
+PostgreSQL is the production database and SQLite stands in for it in the test
+suite; both support the same upsert clause through their SQLAlchemy dialects.
+"""
+
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from sqlalchemy import Connection
+from sqlmodel import Session, SQLModel
+
+
+def insert_for(session: Session | Connection, model: type[SQLModel]):
+    """The dialect `insert` construct of the session bind, with `on_conflict_*`."""
+
+    # pylint: disable=import-outside-toplevel
+    bind = session.get_bind() if isinstance(session, Session) else session
+    dialect = bind.dialect.name
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert is not supported on {dialect}")
+
+    return insert(model)
+
+
+def upsert_statement(
+    session: Session,
+    model: type[SQLModel],
+    rows: Sequence[dict[str, Any]],
+    index_elements: Iterable[str] = ("id",),
+    update_columns: Iterable[str] | None = None,
+):
+    """The statement run by `upsert`, for callers adding e.g. RETURNING."""
+
+    index_elements = list(index_elements)
+    if update_columns is None:
+        update_columns = [name for name in rows[0] if name not in index_elements]
+
+    statement = insert_for(session, model).values(list(rows))
+    set_ = {name: statement.excluded[name] for name in update_columns}
+    return (
+        statement.on_conflict_do_update(index_elements=index_elements, set_=set_)
+        if set_
+        else statement.on_conflict_do_nothing(index_elements=index_elements)
+    )
+
+
+def upsert(
+    session: Session,
+    model: type[SQLModel],
+    rows: Sequence[dict[str, Any]],
+    index_elements: Iterable[str] = ("id",),
+    update_columns: Iterable[str] | None = None,
+) -> int:
+    """
+    Inserts `rows` in one statement, updating the rows that already exist.
+
+    Args:
+        session: the session running the statement, the caller commits.
+        model: the table model.
+        rows: column values of each row, all with the same keys.
+        index_elements: columns of the unique index that detects conflicts.
+        update_columns: columns overwritten on conflict, every other column
+            of the rows by default. With none, rows that already exist are
+            left as they are.
+
+    Returns:
+        int: number of rows inserted or updated.
+    """
+
+    if not rows:
+        return 0
+
+    statement = upsert_statement(session, model, rows, index_elements, update_columns)
+    result = session.exec(statement)  # type: ignore
+    return result.rowcount
@@ -1,53 +1,81 @@
 """Main module for the FastAPI application.
 
-This module initializes the FastAPI application, database, and includes all the routes.
+This module initializes the FastAPI application and includes all the routes.
 It also sets up CORS (Cross-Origin Resource Sharing) to allow requests from specified origins.
 
-Functions:
-    create_db(): Initializes the database by creating all tables.
+The database schema is not touched here, it is managed by `python -m app.db.migrate`.
+On startup the lifespan only warms the connection pool and checks the database is reachable.
 
 Imports:
     FastAPI: Class to create a new FastAPI instance.
     CORSMiddleware: Middleware for managing CORS.
-    create_db: Function to initialize the database.
+    AdmissionMiddleware: Middleware shedding requests when the worker is saturated.
+    warm_pool: Function to open the pool connections and verify connectivity.
     router: FastAPI router containing all application routes.
 """
 
 import asyncio
+from contextlib import suppress
 from fastapi import FastAPI
 from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.messages.subscriber import AsyncListener
-from app.messages.event import UpdateEvent
-
-from .db.conn import create_db
+from .db.conn import warm_pool
 from .db.settings import ENV
+from .middlewares.admission import AdmissionMiddleware
+from .responses import DefaultJSONResponse
+from .router.admin import router as adminRouter
+from .router.analytics import router as analyticsRouter
 from .router.liveness import router as liveRouter
+from .router.reservation import router as reservationRouter
 from .router.sell import router as sellRouter
+from .tasks import start_periodic_jobs
 
 
-create_db()
-
+def report_listener_exit(task: asyncio.Task):
+    """Prints why the event listener stopped, which it only does on errors."""
 
-external_update_listener = AsyncListener(
-    "rh_event.sells", UpdateEvent.process_message
-)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Event listener stopped, users are not synced: {task.exception()!r}")
 
 
 @asynccontextmanager
 async def listener_span(fapi_app: FastAPI, *args, **kwargs):
-    # pylint: disable=unused-argument
+    # pylint: disable=unused-argument,import-outside-toplevel
+
+    # The broker stack (aio_pika) is only needed once the worker is serving.
+    from app.messages.event import UpdateEvent
+    from app.messages.routing import is_sells_event
+    from app.messages.subscriber import AsyncListener
 
+    await asyncio.to_thread(warm_pool)
+
+    external_update_listener = AsyncListener(
+        "rh_event.sells",
+        UpdateEvent.process_message,
+        batch_processor=UpdateEvent.process_batch,
+        prefilter=is_sells_event,
+    )
     loop = asyncio.get_running_loop()
     task = loop.create_task(external_update_listener.listen(loop))
+    task.add_done_callback(report_listener_exit)
+    jobs = start_periodic_jobs()
     yield
-    await task
+
+    # The listener and jobs never finish on their own, stop them so the worker
+    # can exit once in-flight requests are drained.
+    for background_task in (task, *jobs):
+        background_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await background_task
     print("Ending test_span after req")
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=DefaultJSONResponse)
 app.include_router(liveRouter)
+app.include_router(adminRouter)
+app.include_router(reservationRouter)
+app.include_router(analyticsRouter)
 app.include_router(sellRouter)
 
 app.router.lifespan_context = listener_span
@@ -74,6 +102,9 @@ if ENV == "test":
         "http://localhost:8000",  # Adjust this as needed
     ]
 
+# Inside CORS, so shed requests still carry the CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -1,15 +1,20 @@
-"""Base class for async broker connections."""
+"""Base class for async broker connections.
+
+aio_pika is imported on the first connection, so modules using the broker
+do not slow down the worker boot.
+"""
 
 from asyncio import AbstractEventLoop
 from os import environ
 
-import aio_pika
-
 
 class AsyncBroker:
     # pylint: disable=too-few-public-methods
 
     def default_connect_robust(self, loop: AbstractEventLoop):
+        # pylint: disable=import-outside-toplevel
+        import aio_pika
+
         return aio_pika.connect_robust(
             host=environ.get("BROKER_HOST", "my-rabbit"),
             username=environ.get("BROKER_USER", "guest"),
@@ -0,0 +1,206 @@
+"""
+Batched application of user-sync events.
+
+The events of a batch are folded, in order, into the final state of each user:
+a row to upsert or an id to delete. The batch is then applied in a single
+transaction with one `INSERT ... ON CONFLICT DO UPDATE` and one
+`DELETE ... WHERE id IN (...)`, plus one lookup per table when updates refer
+to roles or scopes by name. Both return the ids of the users they wrote, the
+only ones whose event watermarks are kept (see app.messages.watermark).
+
+As in the per-message `update_user`, an update only changes the fields its
+event carries with a value, the other columns of an existing user are left as
+they are: the upsert of such a user only sets those columns on conflict, the
+full row from the event's user being used when the user has to be inserted.
+"""
+
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import tuple_
+from sqlmodel import Session, col, delete, select
+
+from app.db.upsert import upsert_statement
+from app.models.role import Role
+from app.models.scope import DefaultScope, Scope
+from app.models.user import User
+from app.router.utils import UserEvents
+
+if TYPE_CHECKING:
+    from app.messages.event import UpdateEvent
+
+
+USER_COLUMNS = (
+    "id",
+    "username",
+    "email",
+    "full_name",
+    "created_at",
+    "role_id",
+    "scope_id",
+    "enterprise_id",
+)
+SYNCED_SCOPES = (DefaultScope.ALL.value, DefaultScope.SELLS.value)
+
+
+def user_row(user: dict[str, Any]) -> dict[str, Any]:
+    """Columns of the user table from a UserRead payload."""
+
+    created_at = user.get("created_at")
+
+    return {
+        "id": user["id"],
+        "username": user["username"],
+        "email": user["email"],
+        "full_name": user.get("full_name"),
+        "created_at": (
+            datetime.fromisoformat(created_at)
+            if isinstance(created_at, str)
+            else created_at or datetime.now()
+        ),
+        "role_id": user.get("role", {}).get("id", user.get("role_id")),
+        "scope_id": user.get("scope", {}).get("id", user.get("scope_id")),
+        "enterprise_id": user.get("enterprise", {}).get("id", user.get("enterprise_id")),
+    }
+
+
+class UserSyncBatch:
+    """Final state of the users touched by a batch of events."""
+
+    def __init__(self):
+        self.upserts: dict[int, dict[str, Any]] = {}
+        # user id -> columns the updates carry, every column (None) once created
+        self.columns: dict[int, set[str] | None] = {}
+        self.deletes: set[int] = set()
+        # user id -> (enterprise id, name) still to be resolved to an id
+        self.role_names: dict[int, tuple[int, str]] = {}
+        self.scope_names: dict[int, tuple[int, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.upserts) + len(self.deletes)
+
+    def _set_row(self, row: dict[str, Any], columns: set[str] | None = None):
+        self.deletes.discard(row["id"])
+        self.upserts[row["id"]] = row
+        self.columns[row["id"]] = columns
+
+    def _set_deleted(self, user_id: int):
+        self.upserts.pop(user_id, None)
+        self.columns.pop(user_id, None)
+        self.role_names.pop(user_id, None)
+        self.scope_names.pop(user_id, None)
+        self.deletes.add(user_id)
+
+    def add(self, event: "UpdateEvent"):
+        """Folds one event, already checked for the sells scope, into the batch."""
+
+        data = event.data
+
+        if event.event == UserEvents.USER_CREATED:
+            self._set_row(user_row(data))
+
+        elif event.event == UserEvents.USER_DELETED:
+            self._set_deleted(data["id"])
+
+        elif event.event == UserEvents.USER_UPDATED:
+            if event.full_user is None or not data.get("enterprise_id") or not data.get("id"):
+                return
+
+            user_id = data["id"]
+
+            if event.full_user["scope"]["name"] not in SYNCED_SCOPES:
+                self._set_deleted(user_id)
+                return
+
+            if user_id in self.upserts:
+                row, columns = self.upserts[user_id], self.columns[user_id]
+            else:
+                row, columns = user_row(event.full_user), set()
+
+            carried = [
+                field for field in ("username", "email", "full_name")
+                if data.get(field) is not None
+            ]
+            for field in carried:
+                row[field] = data[field]
+
+            if data.get("role_id"):
+                row["role_id"] = data["role_id"]
+                carried.append("role_id")
+                self.role_names.pop(user_id, None)
+            elif data.get("role_name"):
+                self.role_names[user_id] = (data["enterprise_id"], data["role_name"])
+
+            if data.get("scope_id"):
+                row["scope_id"] = data["scope_id"]
+                carried.append("scope_id")
+                self.scope_names.pop(user_id, None)
+            elif data.get("scope_name"):
+                self.scope_names[user_id] = (data["enterprise_id"], data["scope_name"])
+
+            self._set_row(row, None if columns is None else columns | set(carried))
+
+    def _resolve_names(self, session: Session):
+        for names, model, column in (
+            (self.role_names, Role, "role_id"),
+            (self.scope_names, Scope, "scope_id"),
+        ):
+            if not names:
+                continue
+
+            found = {
+                (enterprise_id, name): id_
+                for id_, enterprise_id, name in session.exec(
+                    select(model.id, model.enterprise_id, model.name).where(  # type: ignore
+                        tuple_(model.enterprise_id, model.name).in_(  # type: ignore
+                            set(names.values())
+                        )
+                    )
+                )
+            }
+
+            for user_id, key in names.items():
+                if key in found and user_id in self.upserts:
+                    self.upserts[user_id][column] = found[key]
+                    if self.columns[user_id] is not None:
+                        self.columns[user_id].add(column)  # type: ignore
+
+    def apply(self, session: Session) -> tuple[set[int], set[int]]:
+        """
+        Writes the batch in the session transaction, the caller commits.
+
+        Returns:
+            tuple[set[int], set[int]]: ids of the users upserted and of the
+            users deleted, leaving out the users the batch did not change.
+        """
+
+        self._resolve_names(session)
+
+        # One upsert per set of columns updated on conflict
+        groups: dict[frozenset[str] | None, list[dict[str, Any]]] = {}
+        for user_id, row in self.upserts.items():
+            columns = self.columns[user_id]
+            groups.setdefault(None if columns is None else frozenset(columns), []).append(
+                {name: row[name] for name in USER_COLUMNS}
+            )
+
+        upserted: set[int] = set()
+        for columns, rows in groups.items():
+            statement = upsert_statement(
+                session,
+                User,
+                rows,
+                update_columns=None if columns is None else sorted(columns),
+            )
+            returned = session.exec(statement.returning(col(User.id)))  # type: ignore
+            upserted.update(returned.scalars())  # type: ignore
+
+        deleted: set[int] = set()
+        if self.deletes:
+            deleted.update(
+                session.exec(  # type: ignore
+                    delete(User).where(col(User.id).in_(self.deletes)).returning(col(User.id))
+                ).scalars()
+            )
+
+        return upserted, deleted
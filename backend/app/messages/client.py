@@ -27,6 +27,8 @@ Class AsyncSender:
     - publish_to: Publishes a message to a specified route on an exchange.
     - publish: Connects to the message broker,
       prepares the message, and publishes it to the specified routes.
+
+pika and aio_pika are imported when a sender is first used.
 """
 
 from asyncio import AbstractEventLoop
@@ -34,17 +36,20 @@ from datetime import datetime as dt, timedelta, timezone
 import json
 from json.decoder import JSONDecodeError
 from os import environ
-from typing import Any
-
-from aio_pika import DeliveryMode, ExchangeType, Message
-from aio_pika.abc import AbstractChannel, AbstractExchange, AbstractMessage
-import pika
+from typing import Any, TYPE_CHECKING
 
 from app.messages.async_broker import AsyncBroker
+from app.messages.routing import routing_headers
+
+if TYPE_CHECKING:
+    from aio_pika.abc import AbstractChannel, AbstractExchange, AbstractMessage
 
 
 class SyncSender:
     def __init__(self, queue_name):
+        # pylint: disable=import-outside-toplevel
+        import pika
+
         self.queue_name = queue_name
         self.connection = pika.BlockingConnection(
             pika.ConnectionParameters(
@@ -74,7 +79,10 @@ class AsyncSender(AsyncBroker):
     def __init__(self, queue_name):
         self.queue_name = queue_name
 
-    def default_exchange(self, channel: AbstractChannel):
+    def default_exchange(self, channel: "AbstractChannel"):
+        # pylint: disable=import-outside-toplevel
+        from aio_pika import ExchangeType
+
         return channel.declare_exchange(
             environ.get("DEFAULT_EXCHANGE", "openferp"),
             durable=bool(environ.get("EXCHANGE_DURABLE", "True")),
@@ -82,12 +90,15 @@ class AsyncSender(AsyncBroker):
         )
 
     async def publish_to(
-        self, route: str, exchange: AbstractExchange, message: AbstractMessage
+        self, route: str, exchange: "AbstractExchange", message: "AbstractMessage"
     ):
         await exchange.publish(routing_key=f"rh_event.{route}", message=message)
         print(f"Published on Exchange {exchange.name}, {str(exchange)}")
 
     async def publish(self, message_body: str, loop: AbstractEventLoop):
+        # pylint: disable=import-outside-toplevel
+        from aio_pika import DeliveryMode, Message
+
         print("Connecting to broker...")
         connection = await self.default_connect_robust(loop)
 
@@ -117,6 +128,7 @@ class AsyncSender(AsyncBroker):
         message = Message(
             message_body.encode("ascii"),
             delivery_mode=DeliveryMode.PERSISTENT,
+            headers=routing_headers(body),
         )
 
         exchange = await self.default_exchange(channel)
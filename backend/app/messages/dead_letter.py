@@ -0,0 +1,222 @@
+"""
+Retry and dead-letter routing of the RH event queue.
+
+A message whose processing fails is acknowledged on the main queue and
+re-published to a retry queue, so the consumer keeps draining. Each retry
+tier is a queue with a fixed TTL that dead-letters expired messages back to
+the main queue; the tier grows with the attempt (exponential backoff by
+default). After the last tier the message goes to the dead-letter queue,
+where it stays until an admin replays it.
+
+    sells_events/rh  --fail-->  sells_events/rh.retry.<delay_ms>  --TTL-->  sells_events/rh
+                     --fail after the last tier-->  sells_events/rh.dlq
+
+Attempts are counted in the `x-retry-count` header and the last error is kept
+in `x-last-error`. The main queue keeps its arguments: retries are published
+explicitly through the default exchange.
+
+Settings (environment):
+    BROKER_RETRY_DELAYS_MS: Comma separated delay of each retry tier
+        (default: 1000,5000,25000).
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from os import environ
+from typing import TYPE_CHECKING, Any
+
+from app.messages.async_broker import AsyncBroker
+from app.metrics import counters
+
+if TYPE_CHECKING:
+    from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+
+
+MAIN_QUEUE = "sells_events/rh"
+DEAD_LETTER_QUEUE = f"{MAIN_QUEUE}.dlq"
+
+BROKER_RETRY_DELAYS_MS = tuple(
+    int(delay)
+    for delay in environ.get("BROKER_RETRY_DELAYS_MS", "1000,5000,25000").split(",")
+    if delay.strip()
+)
+
+RETRY_COUNT_HEADER = "x-retry-count"
+LAST_ERROR_HEADER = "x-last-error"
+FAILED_AT_HEADER = "x-failed-at"
+# Headers added by the retry routing or by the broker, dropped on replay
+ROUTING_STATE_HEADERS = (
+    RETRY_COUNT_HEADER,
+    LAST_ERROR_HEADER,
+    FAILED_AT_HEADER,
+    "x-death",
+    "x-first-death-exchange",
+    "x-first-death-queue",
+    "x-first-death-reason",
+    "x-last-death-exchange",
+    "x-last-death-queue",
+    "x-last-death-reason",
+)
+
+
+def retry_queue_name(delay_ms: int) -> str:
+    # Named by delay, so changing the tiers declares new queues instead of
+    # redeclaring existing ones with other arguments
+    return f"{MAIN_QUEUE}.retry.{delay_ms}"
+
+
+def retry_count(headers: dict[str, Any] | None) -> int:
+    try:
+        return int((headers or {}).get(RETRY_COUNT_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def failure_route(
+    headers: dict[str, Any] | None,
+    error: Exception,
+    delays_ms: tuple[int, ...] = BROKER_RETRY_DELAYS_MS,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Where a failed message goes next and the headers it carries there.
+
+    Returns:
+        tuple[str, dict]: the retry queue of the attempt, or the dead-letter
+        queue once every tier was used, and the updated headers.
+    """
+
+    attempt = retry_count(headers)
+    queue_name = (
+        retry_queue_name(delays_ms[attempt])
+        if attempt < len(delays_ms)
+        else DEAD_LETTER_QUEUE
+    )
+
+    return queue_name, {
+        **(headers or {}),
+        RETRY_COUNT_HEADER: attempt + 1,
+        LAST_ERROR_HEADER: f"{type(error).__name__}: {error}"[:500],
+        FAILED_AT_HEADER: datetime.now(timezone.utc).isoformat(),
+    }
+
+
+async def declare_retry_queues(channel: "AbstractChannel"):
+    """Declares the retry tiers and the dead-letter queue."""
+
+    for delay_ms in BROKER_RETRY_DELAYS_MS:
+        await channel.declare_queue(
+            retry_queue_name(delay_ms),
+            durable=True,
+            arguments={
+                "x-message-ttl": delay_ms,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": MAIN_QUEUE,
+            },
+        )
+
+    await channel.declare_queue(DEAD_LETTER_QUEUE, durable=True)
+
+
+async def publish_to_queue(
+    channel: "AbstractChannel", queue_name: str, body: bytes, headers: dict[str, Any]
+):
+    # pylint: disable=import-outside-toplevel
+    from aio_pika import DeliveryMode, Message
+
+    await channel.default_exchange.publish(
+        Message(body, headers=headers, delivery_mode=DeliveryMode.PERSISTENT),
+        routing_key=queue_name,
+    )
+
+
+async def route_failed_message(
+    channel: "AbstractChannel", message: "AbstractIncomingMessage", error: Exception
+):
+    """Re-publishes a failed message to its next retry tier or to the DLQ.
+
+    The caller acknowledges the original delivery afterwards.
+    """
+
+    queue_name, headers = failure_route(dict(message.headers or {}), error)
+    await publish_to_queue(channel, queue_name, message.body, headers)
+
+    if queue_name == DEAD_LETTER_QUEUE:
+        print(f"Message dead-lettered after {headers[RETRY_COUNT_HEADER] - 1} retries: {error}")
+        counters.increment("broker.messages_dead_lettered")
+    else:
+        print(f"Message sent to {queue_name}: {error}")
+        counters.increment("broker.messages_retried")
+
+
+class DeadLetters(AsyncBroker):
+    """Inspection and replay of the dead-letter queue, for admin routes."""
+
+    async def _get(self, channel: "AbstractChannel", limit: int):
+        queue = await channel.declare_queue(DEAD_LETTER_QUEUE, durable=True)
+        messages = []
+
+        while len(messages) < limit:
+            message = await queue.get(no_ack=False, fail=False)
+            if message is None:
+                break
+            messages.append(message)
+
+        return queue, messages
+
+    async def peek(self, limit: int) -> tuple[int, list[dict[str, Any]]]:
+        """
+        Reads up to `limit` messages without removing them.
+
+        Returns:
+            tuple[int, list[dict]]: messages in the queue and the ones read.
+        """
+
+        connection = await self.default_connect_robust(asyncio.get_running_loop())
+
+        async with connection:
+            channel = await connection.channel()
+            queue, messages = await self._get(channel, limit)
+
+            read = [
+                {
+                    "body": message.body.decode(errors="replace"),
+                    "headers": {
+                        name: value
+                        for name, value in (message.headers or {}).items()
+                        if name != "x-death"
+                    },
+                }
+                for message in messages
+            ]
+
+            # Every message is held until all are read, so none is read twice
+            for message in messages:
+                await message.nack(requeue=True)
+
+            return queue.declaration_result.message_count or len(messages), read
+
+    async def replay(self, limit: int) -> int:
+        """
+        Moves up to `limit` messages back to the main queue, as new messages.
+
+        Returns:
+            int: messages replayed.
+        """
+
+        connection = await self.default_connect_robust(asyncio.get_running_loop())
+
+        async with connection:
+            channel = await connection.channel()
+            _, messages = await self._get(channel, limit)
+
+            for message in messages:
+                headers = {
+                    name: value
+                    for name, value in (message.headers or {}).items()
+                    if name not in ROUTING_STATE_HEADERS
+                }
+                await publish_to_queue(channel, MAIN_QUEUE, message.body, headers)
+                await message.ack()
+
+            counters.increment("broker.messages_replayed", len(messages))
+            return len(messages)
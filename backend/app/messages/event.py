@@ -6,6 +6,14 @@ from sys import stdout
 from typing import Any
 
 from app.db.conn import get_db
+from app.messages.batch import UserSyncBatch
+from app.messages.watermark import (
+    claim_event,
+    event_user_id,
+    fresh_events,
+    remember_event,
+    stage_batch_watermarks,
+)
 from app.models.enterprise import Enterprise
 from app.models.role import BaseRole, Role
 from app.models.scope import BaseScope, DefaultScope, Scope
@@ -78,6 +86,81 @@ class UpdateEvent:
 
         stdout.flush()
 
+    @classmethod
+    async def process_batch(cls, messages: list[str]) -> dict[int, Exception]:
+        """
+        Applies a batch of messages in one transaction, see app.messages.batch.
+
+        When the batch cannot be written (e.g. a user deletion rejected by a
+        foreign key, or another worker having applied newer events of one of
+        its users meanwhile), the events are applied one by one instead, so a
+        single bad event does not fail the whole batch.
+
+        Returns:
+            dict[int, Exception]: errors of the messages that failed, by index,
+            for the listener to retry.
+        """
+        #pylint: disable=broad-exception-caught
+
+        indexed = [
+            (index, event)
+            for index, event in enumerate(map(cls.create_from_message, messages))
+            if event is not None and event._check_valid_user_event()
+        ]
+        events = [event for _, event in indexed]
+
+        if not events:
+            return {}
+
+        fresh: list["UpdateEvent"] = events
+
+        def apply(db: Session) -> tuple[set[int], set[int]]:
+            nonlocal fresh
+            fresh = fresh_events(db, events)
+
+            batch = UserSyncBatch()
+            for event in fresh:
+                batch.add(event)
+
+            upserted, deleted = batch.apply(db)
+
+            # Watermarks of the users written only, committed along with them
+            behind = stage_batch_watermarks(db, fresh, upserted | deleted)
+            if behind:
+                raise RuntimeError(f"newer events of users {sorted(behind)} were applied")
+
+            db.commit()
+            return upserted, deleted
+
+        failures: dict[int, Exception] = {}
+        db = next(get_db())
+        try:
+            upserted, deleted = await asyncio.to_thread(apply, db)
+            for event in fresh:
+                if event_user_id(event) in upserted | deleted:
+                    remember_event(event)
+            print(
+                f"Applied {len(fresh)} events of {len(messages)} messages: "
+                f"{len(upserted)} users upserted, {len(deleted)} deleted"
+            )
+        except Exception as ex:
+            print(f"Batch of {len(fresh)} events failed ({ex}), applying one by one")
+            db.rollback()
+            fresh_ids = set(map(id, fresh))
+            for index, event in indexed:
+                if id(event) not in fresh_ids:
+                    continue
+                try:
+                    await event.update_table()
+                except Exception as event_ex:
+                    print(f"Failed to apply {event.event} event: {event_ex}")
+                    failures[index] = event_ex
+        finally:
+            db.close()
+
+        stdout.flush()
+        return failures
+
     def _check_valid_user_event(self):
         user_events = (
             UserEvents.USER_CREATED,
@@ -91,18 +174,9 @@ class UpdateEvent:
         )
 
         if self.event in (user_events + enterprise_events):
-            check_update_scope = ""
             check_update_scope = (
                 self.update_scope if self.update_scope is not None else ""
             )
-            print(
-                f"""Checking valid event scope:
-                {any((
-                    self.event_scope == DefaultScope.SELLS.value,
-                    check_update_scope == DefaultScope.SELLS.value,
-                    ))}
-                """
-            )
             return any(
                 (
                     self.event_scope == DefaultScope.SELLS.value,
@@ -115,52 +189,43 @@ class UpdateEvent:
         print("Ignoring event for SELLERS.")
         return False
 
-    async def __db_access_loop(self, db_function_callback: Callable, retries: int=5):
-        #pylint: disable=broad-exception-caught,broad-exception-raised
+    async def __db_access(self, db_function_callback: Callable[[Session], bool]):
+        """
+        Runs one attempt of a database write for the event. The callback
+        returns whether it wrote a row; when it did not, it does not commit,
+        so the watermark claimed for the event is rolled back with the
+        session and the event is not remembered as applied.
 
-        db: Session | None = None
-        err: Exception | None = None
-        counter = retries
-        print(f"Start update: Data -- {self.data}")
-        while counter > 0:
-            try:
-                db = next(get_db())
-                if db is None:
-                    print("No database connection")
-                    print("Waiting for 5 seconds...")
-                    await asyncio.sleep(5)
-                    counter -= 1
-                    continue
+        Errors are raised to the listener, which re-publishes the message to a
+        retry queue or to the dead-letter queue (see app.messages.dead_letter)
+        instead of holding the consumer while the write is retried.
+        """
+        #pylint: disable=broad-exception-raised
 
-                db_function_callback(db)
+        print(f"Start update: Data -- {self.data}")
+        db: Session | None = next(get_db())
 
-                if db.is_active:
-                    db.close()
+        if db is None:
+            print("No database connection")
+            stdout.flush()
+            raise Exception("Failed to connect to the database")
 
-                break
+        try:
+            if not claim_event(db, self):
+                return
 
-            except Exception as db_ex:
-                print("Messaging error: ", str(db_ex))
-                err = db_ex
-                if db:
-                    db.rollback()
-                    if db.is_active:
-                        db.close()
-                    await asyncio.sleep(5)
-                    counter -= 1
-                    continue
+            if db_function_callback(db):
+                remember_event(self)
 
-        if counter == 0:
-            print("Failed to update the database")
+        except Exception as db_ex:
+            print("Messaging error: ", str(db_ex))
             print("Data: ", self.data)
-            if db is None:
-                print("No database connection")
-                stdout.flush()
-                raise Exception("Failed to connect to the database")
-            if err:
-                print(f"Error {str(err)}: ", err)
-                stdout.flush()
-                raise err
+            stdout.flush()
+            db.rollback()
+            raise
+
+        finally:
+            db.close()
 
     async def update_table(self):
         if not self._check_valid_user_event():
@@ -181,7 +246,7 @@ class UpdateEvent:
     async def update_user(self):
         #pylint: disable=broad-exception-caught,too-many-branches,too-many-statements
 
-        def db_access(db: Session):
+        def db_access(db: Session) -> bool:
             #pylint: disable=too-many-branches,too-many-statements
 
             name = ""
@@ -221,11 +286,13 @@ class UpdateEvent:
                                 )
                                 session.delete(db_user)
                                 session.commit()
-                                return
+                                return True
 
-                            if self.data["role_id"]:
+                            # Only the fields carried with a value change,
+                            # as in the batches of app.messages.batch
+                            if self.data.get("role_id"):
                                 role = session.get(Role, self.data["role_id"])
-                            elif "role_name" in self.data:
+                            elif self.data.get("role_name"):
                                 role = session.exec(
                                     BaseRole.get_roles_by_names(
                                         self.data["enterprise_id"],
@@ -233,17 +300,15 @@ class UpdateEvent:
                                     )
                                 ).first()
 
-                                if "scope_id" in self.data:
-                                    scope = session.get(Scope, self.data["scope_id"])
-                                elif "scope_name" in self.data:
-                                    scope = session.exec(
-                                        BaseScope.get_roles_by_names(
-                                            self.data["enterprise_id"],
-                                            [self.data["scope_name"]],
-                                        )
-                                    ).first()
-
-                                print("finding user...")
+                            if self.data.get("scope_id"):
+                                scope = session.get(Scope, self.data["scope_id"])
+                            elif self.data.get("scope_name"):
+                                scope = session.exec(
+                                    BaseScope.get_roles_by_names(
+                                        self.data["enterprise_id"],
+                                        [self.data["scope_name"]],
+                                    )
+                                ).first()
 
                             if role is not None:
                                 print("Change role")
@@ -255,15 +320,15 @@ class UpdateEvent:
                                 db_user.scope_id = scope.id
                                 db_user.scope = scope
 
-                            if "username" in self.data:
+                            if self.data.get("username") is not None:
                                 print("Updating Username")
                                 db_user.username = self.data["username"]
 
-                            if "email" in self.data:
+                            if self.data.get("email") is not None:
                                 print("Updating email")
                                 db_user.email = self.data["email"]
 
-                            if "full_name" in self.data:
+                            if self.data.get("full_name") is not None:
                                 print("Updating full_name")
                                 db_user.full_name = self.data["full_name"]
 
@@ -271,11 +336,8 @@ class UpdateEvent:
 
                             session.add(db_user)
                             session.commit()
-
-                            ################## VERIFYING SAVED USER ############
-                            user_v = session.get(User, self.data["id"])
-                            assert user_v is not None
-                            print(f"User updated: {user_v.model_dump()}")
+                            print(f"User updated: {name} - ID {user_id}")
+                            return True
 
                         else:
                             print(f'User with id {self.data["id"]} not found')
@@ -286,15 +348,19 @@ class UpdateEvent:
                             ):
                                 session.add(User(**user_read.model_dump()))
                                 session.commit()
+                                return True
+
+                return False
 
             except Exception as db_ex:
                 print(f"Failed to update user {name} - ID: {user_id} on DB")
                 print(f"Error: {db_ex}")
+                raise
 
-        await self.__db_access_loop(db_access)
+        await self.__db_access(db_access)
 
     async def create_user(self):
-        def db_access(db: Session):
+        def db_access(db: Session) -> bool:
             #pylint: disable=broad-exception-caught
             try:
                 print(f"Start User creation: Data -- {self.data}")
@@ -317,26 +383,30 @@ class UpdateEvent:
                     session.add(user)
 
                     session.commit()
+                    return True
 
             except Exception as db_ex:
                 print("Failed to create user")
                 print(f"Error: {db_ex}")
+                raise
 
-        await self.__db_access_loop(db_access)
+        await self.__db_access(db_access)
 
     async def delete_user(self):
-        def db_access(db: Session):
+        def db_access(db: Session) -> bool:
             print(f"Start User deletion: Data -- {self.data}")
             with db as session:
                 user = session.get(User, self.data["id"])
-                if user is not None:
-                    print("Deleting user...")
-                    session.delete(user)
-                    session.commit()
-                else:
+                if user is None:
                     print(f'User with id {self.data["id"]} not found')
+                    return False
+
+                print("Deleting user...")
+                session.delete(user)
+                session.commit()
+                return True
 
-        await self.__db_access_loop(db_access)
+        await self.__db_access(db_access)
 
     # async def create_enterprise(self):
     #     def db_access(db: Session):
@@ -359,7 +429,7 @@ class UpdateEvent:
     #             session.add(enterprise_table)
     #             session.commit()
     #
-    #     await self.__db_access_loop(db_access)
+    #     await self.__db_access(db_access)
 
     # async def update_enterprise(self):
     #     def db_access(db: Session):
@@ -388,7 +458,7 @@ class UpdateEvent:
     #                 else:
     #                     print(f'Enterprise with id {self.data["id"]} not found')
 
-    #     await self.__db_access_loop(db_access)
+    #     await self.__db_access(db_access)
 
     # async def delete_enterprise(self):
     #     def db_access(db: Session):
@@ -406,4 +476,4 @@ class UpdateEvent:
     #                 else:
     #                     print(f'Enterprise with id {self.data["id"]} not found')
 
-    #     await self.__db_access_loop(db_access)
+    #     await self.__db_access(db_access)
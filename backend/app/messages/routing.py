@@ -0,0 +1,92 @@
+"""
+Routing metadata of the RH event stream.
+
+Publishers copy the top-level `event`, `event_scope` and `update_scope` of an
+event into AMQP headers, so consumers can skip the events they do not handle
+without decoding the payload. For messages sent without these headers the
+same fields are read from the raw body with byte regexes; the message is only
+skipped when each field appears exactly once, anything ambiguous is left to
+the full JSON parse.
+
+Only user events scoped to Sells (by `event_scope` or `update_scope`) reach
+the Sells database, everything else is acknowledged and dropped.
+"""
+
+from collections.abc import Mapping
+import re
+from typing import Any
+
+from app.models.scope import DefaultScope
+from app.router.utils import UserEvents
+
+
+ROUTING_HEADERS = ("event", "event_scope", "update_scope")
+
+SELLS_EVENTS = frozenset(
+    event.value.encode()
+    for event in (UserEvents.USER_CREATED, UserEvents.USER_UPDATED, UserEvents.USER_DELETED)
+)
+SELLS_SCOPE = DefaultScope.SELLS.value.encode()
+
+_FIELD_PATTERNS = {
+    name: re.compile(rb'"' + name.encode() + rb'"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|null)')
+    for name in ROUTING_HEADERS
+}
+
+
+def routing_headers(body: Mapping[str, Any]) -> dict[str, str]:
+    """AMQP headers carrying the routing fields of an event."""
+
+    return {
+        name: str(body[name])
+        for name in ROUTING_HEADERS
+        if body.get(name) is not None
+    }
+
+
+def _as_bytes(value: Any) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+def _fields_from_headers(headers: Mapping[str, Any] | None) -> dict[str, bytes] | None:
+    if not headers or "event" not in headers or "event_scope" not in headers:
+        return None
+
+    return {
+        name: _as_bytes(headers[name])
+        for name in ROUTING_HEADERS
+        if headers.get(name) is not None
+    }
+
+
+def _fields_from_body(body: bytes) -> dict[str, bytes] | None:
+    fields: dict[str, bytes] = {}
+
+    for name, pattern in _FIELD_PATTERNS.items():
+        matches = pattern.findall(body)
+
+        if len(matches) > 1 or (not matches and name != "update_scope"):
+            return None
+
+        if matches and matches[0]:
+            fields[name] = matches[0]
+
+    return fields
+
+
+def is_sells_event(headers: Mapping[str, Any] | None, body: bytes) -> bool:
+    """
+    Whether a message may change the Sells database, without decoding it.
+
+    Returns True when the routing fields cannot be read unambiguously, so the
+    full parse makes the decision.
+    """
+
+    fields = _fields_from_headers(headers) or _fields_from_body(body)
+    if fields is None:
+        return True
+
+    return fields.get("event") in SELLS_EVENTS and SELLS_SCOPE in (
+        fields.get("event_scope"),
+        fields.get("update_scope"),
+    )
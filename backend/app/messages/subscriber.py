@@ -1,47 +1,154 @@
 """
-This module contains the AsyncListener class which is used to asynchronously 
+This module contains the AsyncListener class which is used to asynchronously
 listen to a message queue.
 
 Class AsyncListener:
-    This class is used to asynchronously listen to a message queue. It inherits 
+    This class is used to asynchronously listen to a message queue. It inherits
     from AsyncBroker.
 
     Attributes:
     - queue_name: The name of the queue to which messages will be sent.
     - message_processor: A callable that processes the messages.
+    - batch_processor: A callable that processes a list of messages and returns
+      the errors of the ones that failed by index, used instead of
+      message_processor when BROKER_BATCH_SIZE is above 1.
+    - prefilter: An optional callable reading the headers and raw body of a
+      message; messages it rejects are acknowledged without being decoded.
 
     Methods:
     - callback: Processes a message using the message_processor.
-    - iterate_queue: Iterates over the messages in the queue and processes them using 
+    - handle_message: Processes a message and acknowledges it; when processing
+      fails the message is first re-published to a retry queue or to the
+      dead-letter queue (see app.messages.dead_letter).
+    - iterate_queue: Iterates over the messages in the queue and processes them using
       the message_processor.
-    - listen: Connects to the message broker, declares the exchange and queue, 
+    - iterate_batches: Collects up to BROKER_BATCH_SIZE messages, or what arrives
+      within BROKER_BATCH_WINDOW_MS of the first one, processes them with the
+      batch_processor and acknowledges them all at once. The wait for the next
+      message outlives the window instead of being cancelled: cancelling
+      aio_pika's QueueIterator.__anext__ closes the iterator, cancelling the
+      consumer.
+    - listen: Connects to the message broker, declares the exchange and queue,
       binds the queue to the exchange, and starts iterating over the queue.
 """
 
-from collections.abc import Coroutine
+import asyncio
+from collections.abc import Coroutine, Mapping
 from os import environ
-from typing import Callable
+from typing import Any, Callable
 import aio_pika
 
 from app.messages.async_broker import AsyncBroker
+from app.messages.dead_letter import MAIN_QUEUE, declare_retry_queues, route_failed_message
+from app.metrics import counters
+
+
+BatchProcessor = Callable[[list[str]], Coroutine[None, None, dict[int, Exception]]]
+
+BROKER_BATCH_SIZE = int(environ.get("BROKER_BATCH_SIZE", "1"))
+BROKER_BATCH_WINDOW_MS = float(environ.get("BROKER_BATCH_WINDOW_MS", "50"))
 
 
 class AsyncListener(AsyncBroker):
     def __init__(
-        self, queue_name, processor: Callable[[str], Coroutine[None, None, None]]
+        self,
+        queue_name,
+        processor: Callable[[str], Coroutine[None, None, None]],
+        batch_processor: BatchProcessor | None = None,
+        batch_size: int = BROKER_BATCH_SIZE,
+        batch_window_ms: float = BROKER_BATCH_WINDOW_MS,
+        prefilter: Callable[[Mapping[str, Any] | None, bytes], bool] | None = None,
     ):
+        #pylint: disable=too-many-arguments
+
         self.queue_name = queue_name
         self.message_processor = processor
+        self.batch_processor = batch_processor
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.prefilter = prefilter
+        self.channel: aio_pika.abc.AbstractChannel | None = None
+
+    def accepts(self, message: aio_pika.abc.AbstractIncomingMessage) -> bool:
+        if self.prefilter is None or self.prefilter(message.headers, message.body):
+            return True
+
+        counters.increment("broker.messages_prefiltered")
+        return False
 
     async def callback(self, message: aio_pika.abc.AbstractIncomingMessage):
-        async with message.process():
-            await self.message_processor(message.body.decode())
+        await self.handle_message(message)
+
+    async def handle_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        #pylint: disable=broad-exception-caught
+
+        if self.accepts(message):
+            try:
+                await self.message_processor(message.body.decode())
+            except Exception as ex:
+                await route_failed_message(self.channel, message, ex)
+
+        await message.ack()
 
     async def iterate_queue(self, queue: aio_pika.abc.AbstractQueue):
         async with queue.iterator() as queue_iter:
             async for message in queue_iter:
-                async with message.process():
-                    await self.message_processor(message.body.decode())
+                await self.handle_message(message)
+
+    async def process_batch(self, batch: list[aio_pika.abc.AbstractIncomingMessage]):
+        #pylint: disable=broad-exception-caught
+        assert self.batch_processor is not None
+
+        accepted = [message for message in batch if self.accepts(message)]
+        failed: list[tuple[aio_pika.abc.AbstractIncomingMessage, Exception]] = []
+
+        try:
+            if accepted:
+                failures = await self.batch_processor(
+                    [message.body.decode() for message in accepted]
+                )
+                failed = [(accepted[index], error) for index, error in failures.items()]
+        except Exception as ex:
+            print(f"Failed to process a batch of {len(accepted)} messages: {ex}")
+            failed = [(message, ex) for message in accepted]
+
+        for message, error in failed:
+            await route_failed_message(self.channel, message, error)
+
+        # Deliveries are acknowledged in order, one frame covers the batch
+        await batch[-1].ack(multiple=True)
+
+    async def iterate_batches(self, queue: aio_pika.abc.AbstractQueue):
+        loop = asyncio.get_running_loop()
+
+        async with queue.iterator() as queue_iter:
+            # The pending __anext__, carried over to the next batch on timeout
+            next_message: asyncio.Future | None = None
+            try:
+                while True:
+                    if next_message is None:
+                        next_message = asyncio.ensure_future(queue_iter.__anext__())
+                    batch = [await next_message]
+                    next_message = None
+                    deadline = loop.time() + self.batch_window
+
+                    while len(batch) < self.batch_size:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+
+                        next_message = asyncio.ensure_future(queue_iter.__anext__())
+                        done, _ = await asyncio.wait({next_message}, timeout=remaining)
+                        if not done:
+                            break
+
+                        batch.append(next_message.result())
+                        next_message = None
+
+                    await self.process_batch(batch)
+            finally:
+                if next_message is not None:
+                    next_message.cancel()
 
     async def listen(self, loop):
         connection = await self.default_connect_robust(loop)
@@ -52,8 +159,15 @@ class AsyncListener(AsyncBroker):
             durable=True,
         )
 
-        queue = await channel.declare_queue("sells_events/rh", durable=True)
+        queue = await channel.declare_queue(MAIN_QUEUE, durable=True)
         await queue.bind(exchange, routing_key=self.queue_name)
-        await self.iterate_queue(queue)
+        await declare_retry_queues(channel)
+        self.channel = channel
+
+        if self.batch_processor is not None and self.batch_size > 1:
+            await channel.set_qos(prefetch_count=self.batch_size * 2)
+            await self.iterate_batches(queue)
+        else:
+            await self.iterate_queue(queue)
 
         return connection
@@ -0,0 +1,254 @@
+"""
+Deduplication and ordering guard for the RH user stream.
+
+RH events carry no id or sequence, only the `start_date` of the change, which
+is used as the event version. The newest version applied to each user is kept
+in the `user_event_watermark` table, in the same transaction as the write, and
+mirrored in an in-process LRU.
+
+An event whose version is not newer than the user's watermark is dropped
+before anything is written: an equal version is a redelivery (duplicate), an
+older one arrived out of order (stale). Watermarks only grow, so a cached
+watermark is enough to drop an event without querying the database; a cache
+miss or a newer version is settled by a conditional upsert of the watermark.
+
+A watermark is only kept for an event whose write changed a row (a create
+always does): an update or delete of a user that is not there is a no-op,
+and must not make a later replay of the user's create look already applied.
+
+Settings (environment):
+    USER_EVENT_WATERMARK_CACHE_SIZE: Users kept in the LRU, 0 disables it
+        (default: 10000).
+
+Counters (app.metrics): user_events.dropped_duplicate,
+user_events.dropped_stale.
+"""
+
+from collections import OrderedDict
+from collections.abc import Iterable
+from datetime import datetime, timezone
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from sqlmodel import Session, col, select
+
+from app.db.upsert import insert_for
+from app.metrics import counters
+from app.models.watermark import UserEventWatermark
+
+if TYPE_CHECKING:
+    from app.messages.event import UpdateEvent
+
+
+USER_EVENT_WATERMARK_CACHE_SIZE = int(
+    os.environ.get("USER_EVENT_WATERMARK_CACHE_SIZE", "10000")
+)
+
+DUPLICATE = "duplicate"
+STALE = "stale"
+
+
+def event_version(start_date: datetime) -> datetime:
+    """The event version: its start_date as naive UTC, like the column."""
+
+    if start_date.tzinfo is not None:
+        return start_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return start_date
+
+
+def event_user_id(event: "UpdateEvent") -> int | None:
+    user_id = event.data.get("id") if isinstance(event.data, dict) else None
+    return user_id if isinstance(user_id, int) else None
+
+
+def classify(version: datetime, watermark: datetime | None) -> str | None:
+    """DUPLICATE or STALE when the event must be dropped, None otherwise."""
+
+    if watermark is None or version > watermark:
+        return None
+
+    return DUPLICATE if version == watermark else STALE
+
+
+def count_drop(reason: str):
+    counters.increment(f"user_events.dropped_{reason}")
+
+
+class WatermarkCache:
+    """Thread-safe LRU of the applied watermark by user id."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[int, datetime] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> datetime | None:
+        with self._lock:
+            watermark = self._entries.get(user_id)
+            if watermark is not None:
+                self._entries.move_to_end(user_id)
+            return watermark
+
+    def advance(self, user_id: int, version: datetime):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            current = self._entries.get(user_id)
+            self._entries[user_id] = version if current is None else max(current, version)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+watermark_cache = WatermarkCache(USER_EVENT_WATERMARK_CACHE_SIZE)
+
+
+def stage_watermarks(session: Session, versions: dict[int, datetime]) -> set[int]:
+    """
+    Raises the watermark of each user to its version, in the session transaction.
+
+    Returns:
+        set[int]: users whose watermark was raised; the others already had
+        this version or a newer one.
+    """
+
+    if not versions:
+        return set()
+
+    statement = insert_for(session, UserEventWatermark).values(
+        [
+            {"user_id": user_id, "applied_at": version}
+            for user_id, version in versions.items()
+        ]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"applied_at": statement.excluded.applied_at},
+        where=col(UserEventWatermark.applied_at) < statement.excluded.applied_at,
+    ).returning(col(UserEventWatermark.user_id))
+
+    return set(session.exec(statement).scalars())  # type: ignore
+
+
+def read_watermarks(session: Session, user_ids: Iterable[int]) -> dict[int, datetime]:
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    return dict(
+        session.exec(  # type: ignore
+            select(UserEventWatermark.user_id, UserEventWatermark.applied_at).where(
+                col(UserEventWatermark.user_id).in_(user_ids)
+            )
+        ).all()
+    )
+
+
+def claim_event(session: Session, event: "UpdateEvent") -> bool:
+    """
+    Claims the event version for its user before the event is written.
+
+    The watermark row is written in the session transaction, so it is
+    committed, or rolled back, with the write of the event. A write that
+    changes no row must not commit it, nor call `remember_event`.
+
+    Returns:
+        bool: False when the event is a duplicate or stale and must be dropped.
+    """
+
+    user_id = event_user_id(event)
+    if user_id is None:
+        return True
+
+    version = event_version(event.start_date)
+    reason = classify(version, watermark_cache.get(user_id))
+
+    if reason is None and user_id in stage_watermarks(session, {user_id: version}):
+        return True
+
+    if reason is None:
+        watermark = read_watermarks(session, [user_id]).get(user_id)
+        if watermark is not None:
+            watermark_cache.advance(user_id, watermark)
+        reason = classify(version, watermark) or STALE
+
+    print(f"Dropping {reason} {event.event} event of user {user_id}")
+    count_drop(reason)
+    return False
+
+
+def remember_event(event: "UpdateEvent"):
+    """Mirrors the watermark of an applied event in the cache."""
+
+    user_id = event_user_id(event)
+    if user_id is not None:
+        watermark_cache.advance(user_id, event_version(event.start_date))
+
+
+def fresh_events(session: Session, events: list["UpdateEvent"]) -> list["UpdateEvent"]:
+    """
+    Drops the duplicate and stale events of a batch, against the stored
+    watermarks and the events before them in the batch. The watermarks are
+    staged once the batch is written, see `stage_batch_watermarks`.
+    """
+
+    missing = {
+        user_id
+        for user_id in map(event_user_id, events)
+        if user_id is not None and watermark_cache.get(user_id) is None
+    }
+    stored = read_watermarks(session, missing)
+
+    latest: dict[int, datetime] = {}
+    fresh: list["UpdateEvent"] = []
+
+    for event in events:
+        user_id = event_user_id(event)
+        if user_id is None:
+            fresh.append(event)
+            continue
+
+        version = event_version(event.start_date)
+        watermark = latest.get(user_id) or watermark_cache.get(user_id) or stored.get(user_id)
+        reason = classify(version, watermark)
+
+        if reason is not None:
+            print(f"Dropping {reason} {event.event} event of user {user_id}")
+            count_drop(reason)
+            continue
+
+        latest[user_id] = version
+        fresh.append(event)
+
+    return fresh
+
+
+def stage_batch_watermarks(
+    session: Session, events: list["UpdateEvent"], user_ids: set[int]
+) -> set[int]:
+    """
+    Raises the watermark of each of `user_ids`, the users a batch of fresh
+    `events` wrote, to the version of its last event, in the session
+    transaction.
+
+    Returns:
+        set[int]: users whose watermark was already as new, another worker
+        having applied newer events of theirs meanwhile; the batch must then
+        be rolled back.
+    """
+
+    versions = {
+        user_id: event_version(event.start_date)
+        for event in events
+        if (user_id := event_user_id(event)) in user_ids
+    }
+
+    return set(versions) - stage_watermarks(session, versions)
@@ -0,0 +1,36 @@
+"""
+In-process counters of the service, exposed at GET /check/metrics.
+
+Counters are per worker process and reset when it restarts; names are dotted
+paths such as `user_events.dropped_stale`.
+"""
+
+from collections import defaultdict
+import threading
+
+
+class Counters:
+    """Thread-safe registry of monotonic counters."""
+
+    def __init__(self):
+        self._values: defaultdict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._values.items()))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+counters = Counters()
@@ -0,0 +1,312 @@
+"""
+Admission control: sheds load with 503 instead of letting every request slow
+down when the worker is saturated.
+
+Sync endpoints run in a threadpool and hold a database connection, so beyond
+a point extra concurrent requests only queue there until they time out. This
+ASGI middleware admits at most ADMISSION_MAX_CONCURRENCY requests at a time
+per worker and classifies each request (see ROUTE_CLASSES):
+
+- `write`: sales and other writes, served first;
+- `read`: single item reads;
+- `heavy`: enterprise-wide listings, exports, analytics and bulk operations.
+
+Each class has its own concurrency limit, adapted to the latency it observes
+(AIMD): a request slower than ADMISSION_LATENCY_TOLERANCE times the usual
+latency of its class cuts the limit by 10%, at most once per usual latency,
+while requests within it raise a fully used limit by one per round. The
+usual latency is a moving average that mostly follows the fast requests.
+
+Requests over a limit wait in a bounded queue ordered by class priority. A
+request is shed with 503 and `Retry-After` when it waits longer than
+ADMISSION_QUEUE_TIMEOUT_SECONDS or finds the queue full, in which case a
+queued request of a lower priority class is shed in its place if there is
+one. Queued and shed requests are counted in app.metrics as
+`admission.<class>.queued` and `admission.<class>.shed_<reason>`.
+
+Settings (environment):
+    ADMISSION_ENABLED: 0 lets every request through (default: 1).
+    ADMISSION_MAX_CONCURRENCY: Requests served at a time per worker
+        (default: 40, the threadpool size).
+    ADMISSION_HEAVY_MAX_CONCURRENCY: Upper bound of the heavy class limit
+        (default: 8).
+    ADMISSION_QUEUE_SIZE: Requests waiting at a time per worker (default: 100).
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: Longest wait in the queue (default: 2).
+    ADMISSION_RETRY_AFTER_SECONDS: Retry-After of shed requests (default: 1).
+    ADMISSION_LATENCY_TOLERANCE: Latency, relative to the usual one, above
+        which a class limit is decreased (default: 2).
+"""
+
+import asyncio
+import bisect
+from dataclasses import dataclass, field
+import itertools
+import json
+import os
+import re
+import time
+from typing import Callable
+
+from app.metrics import counters
+
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "40"))
+ADMISSION_HEAVY_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_HEAVY_MAX_CONCURRENCY", "8"))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+ADMISSION_LATENCY_TOLERANCE = float(os.environ.get("ADMISSION_LATENCY_TOLERANCE", "2"))
+
+# (method or None for any, path pattern, class or None to bypass admission),
+# the first match applies; unmatched GETs are reads, other methods writes
+ROUTE_CLASSES: list[tuple[str | None, re.Pattern, str | None]] = [
+    (None, re.compile(r"^/check(/|$)"), None),
+    ("GET", re.compile(r"^/sells/?$"), "heavy"),
+    ("GET", re.compile(r"^/sells/export$"), "heavy"),
+    ("GET", re.compile(r"^/sells/analytics/"), "heavy"),
+    ("GET", re.compile(r"^/sells/client/?$"), "heavy"),
+    ("POST", re.compile(r"^/sells/client/import$"), "heavy"),
+    ("POST", re.compile(r"^/sells/(client/)?delete$"), "heavy"),
+    ("POST", re.compile(r"^/admin/"), "heavy"),
+]
+
+
+def route_class(method: str, path: str) -> str | None:
+    for route_method, pattern, name in ROUTE_CLASSES:
+        if route_method in (None, method) and pattern.match(path):
+            return name
+
+    return "read" if method in ("GET", "HEAD", "OPTIONS") else "write"
+
+
+class Shed(Exception):
+    """The request is refused, `reason` tells why."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimit:
+    """Concurrency limit adapted to the observed latency, see the module."""
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float,
+        maximum: float,
+        tolerance: float = ADMISSION_LATENCY_TOLERANCE,
+        backoff: float = 0.9,
+        smoothing: float = 0.05,
+    ):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.usual_latency: float | None = None
+        self._last_decrease = float("-inf")
+
+    @property
+    def capacity(self) -> int:
+        return int(self.limit)
+
+    def update(self, latency: float, in_flight: int, now: float):
+        """Accounts for a request served in `latency` seconds, `in_flight` others running."""
+
+        if self.usual_latency is None:
+            self.usual_latency = latency
+
+        if latency > self.usual_latency * self.tolerance:
+            # Slow requests move the usual latency slowly, so a lasting change
+            # of the workload is eventually accepted as the new normal
+            self.usual_latency += (latency - self.usual_latency) * self.smoothing / 10
+            if now - self._last_decrease >= self.usual_latency:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+            return
+
+        self.usual_latency += (latency - self.usual_latency) * self.smoothing
+        if in_flight + 1 >= self.capacity:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+@dataclass
+class AdmissionClass:
+    name: str
+    priority: int
+    limit: AdaptiveLimit
+    in_flight: int = 0
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    admission_class: AdmissionClass = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AdmissionController:
+    """
+    Admission state of a worker. Used from its event loop only, so it needs
+    no locking.
+    """
+
+    def __init__(
+        self,
+        classes: list[AdmissionClass],
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.classes = {x.name: x for x in classes}
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.clock = clock
+        self.in_flight = 0
+        self._queue: list[_Waiter] = []
+        self._sequence = itertools.count()
+
+    def _has_room(self, admission_class: AdmissionClass) -> bool:
+        return (
+            self.in_flight < self.max_concurrency
+            and admission_class.in_flight < admission_class.limit.capacity
+        )
+
+    def _admit(self, admission_class: AdmissionClass):
+        self.in_flight += 1
+        admission_class.in_flight += 1
+
+    def _shed(self, admission_class: AdmissionClass, reason: str) -> Shed:
+        counters.increment(f"admission.{admission_class.name}.shed_{reason}")
+        return Shed(reason)
+
+    async def acquire(self, name: str):
+        """Waits for a slot of the class `name`, raises Shed when refused."""
+
+        admission_class = self.classes[name]
+        queued = any(x.admission_class is admission_class for x in self._queue)
+
+        if not queued and self._has_room(admission_class):
+            self._admit(admission_class)
+            return
+
+        if len(self._queue) >= self.queue_size:
+            lowest = self._queue[-1] if self._queue else None
+            if lowest is None or lowest.priority <= admission_class.priority:
+                raise self._shed(admission_class, "queue_full")
+
+            self._queue.pop()
+            lowest.future.set_exception(self._shed(lowest.admission_class, "evicted"))
+
+        waiter = _Waiter(
+            admission_class.priority,
+            next(self._sequence),
+            admission_class,
+            asyncio.get_running_loop().create_future(),
+        )
+        bisect.insort(self._queue, waiter)
+        counters.increment(f"admission.{name}.queued")
+
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError as ex:
+            self._queue.remove(waiter)
+            raise self._shed(admission_class, "timeout") from ex
+        except asyncio.CancelledError:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+            elif not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Admitted right as the client went away: give the slot back
+                self._release_slot(admission_class)
+            raise
+
+    def release(self, name: str, latency: float):
+        """Frees the slot of a request served in `latency` seconds."""
+
+        admission_class = self.classes[name]
+        admission_class.limit.update(latency, admission_class.in_flight - 1, self.clock())
+        self._release_slot(admission_class)
+
+    def _release_slot(self, admission_class: AdmissionClass):
+        self.in_flight -= 1
+        admission_class.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        # Highest priority first, skipping the classes at their limit
+        for waiter in list(self._queue):
+            if self.in_flight >= self.max_concurrency:
+                break
+
+            if self._has_room(waiter.admission_class):
+                self._queue.remove(waiter)
+                self._admit(waiter.admission_class)
+                waiter.future.set_result(None)
+
+
+def default_classes() -> list[AdmissionClass]:
+    heavy = min(ADMISSION_HEAVY_MAX_CONCURRENCY, ADMISSION_MAX_CONCURRENCY)
+
+    return [
+        AdmissionClass(
+            "write", 0, AdaptiveLimit(ADMISSION_MAX_CONCURRENCY / 2, 2, ADMISSION_MAX_CONCURRENCY)
+        ),
+        AdmissionClass(
+            "read", 1, AdaptiveLimit(ADMISSION_MAX_CONCURRENCY / 2, 2, ADMISSION_MAX_CONCURRENCY)
+        ),
+        AdmissionClass("heavy", 2, AdaptiveLimit(max(heavy / 2, 1), 1, heavy)),
+    ]
+
+
+admission = AdmissionController(default_classes())
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController, see the module."""
+
+    def __init__(self, app, controller: AdmissionController | None = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(name)
+        except Shed:
+            await self._send_shed(send)
+            return
+
+        started = self.controller.clock()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, self.controller.clock() - started)
+
+    async def _send_shed(self, send):
+        body = json.dumps({"detail": "Service overloaded, retry later"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,293 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A request carrying an `Idempotency-Key` header claims the key by inserting an
+`idempotency_key` row in the same transaction that performs the write, before
+any product row is locked. The response is stored in that row right before
+the commit, so retries of the same request replay it without touching
+`product` or `sell`.
+
+When two requests with the same key run concurrently, the second INSERT waits
+on the unique constraint until the first transaction ends. If the first one
+committed, the second replays its response, otherwise it proceeds normally.
+
+Settings (environment):
+    IDEMPOTENCY_TTL_SECONDS: How long a key is kept (default: 24h).
+    IDEMPOTENCY_CACHE_SIZE: Entries of the in-process front cache, 0 disables it
+        (default: 1024).
+    IDEMPOTENCY_PURGE_BATCH: Expired keys deleted per statement (default: 1000).
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+import threading
+from typing import NamedTuple
+
+from fastapi import Header, HTTPException, Response, status
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, Session, col, delete, select
+
+from app.models.idempotency import IdempotencyKey
+
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "1024"))
+IDEMPOTENCY_PURGE_BATCH = int(os.environ.get("IDEMPOTENCY_PURGE_BATCH", "1000"))
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def utcnow() -> datetime:
+    """Naive UTC now, matching the `timestamp without time zone` columns."""
+
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: str
+    expires_at: datetime
+
+
+class ResponseCache:
+    """Thread-safe LRU of stored responses keyed by (user_id, key)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[int, str], StoredResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[int, str]) -> StoredResponse | None:
+        if self.maxsize <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry.expires_at <= utcnow():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple[int, str], entry: StoredResponse):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+def get_idempotency_key(
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+) -> str | None:
+    """Reads the optional Idempotency-Key header."""
+
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key must have between 1 and 255 characters",
+        )
+
+    return idempotency_key
+
+
+class IdempotentRequest:
+    """
+    Claims an idempotency key for a write and stores its response.
+
+    Usage inside a handler, with the handler session:
+
+        idempotent = IdempotentRequest(db_session, user_id, key, "POST /sells/me", payload)
+        replay = idempotent.claim()
+        if replay is not None:
+            return replay
+        ...  # the write, flushed
+        idempotent.store(response)
+        db_session.commit()
+        idempotent.remember()
+
+    Every method is a no-op when the request has no key.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        user_id: int,
+        key: str | None,
+        endpoint: str,
+        payload: SQLModel,
+    ):
+        # pylint: disable=too-many-arguments
+
+        self.session = session
+        self.user_id = user_id
+        self.key = key
+        self.endpoint = endpoint
+        self.request_hash = hashlib.sha256(
+            f"{endpoint}\n{payload.model_dump_json()}".encode()
+        ).hexdigest()
+        self.record: IdempotencyKey | None = None
+
+    def _replay(self, stored: StoredResponse) -> Response:
+        if stored.request_hash != self.request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request",
+            )
+
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={REPLAY_HEADER: "true"},
+        )
+
+    def _stored(self) -> IdempotencyKey | None:
+        return self.session.exec(
+            select(IdempotencyKey)
+            .where(col(IdempotencyKey.user_id) == self.user_id)
+            .where(col(IdempotencyKey.key) == self.key)
+        ).first()
+
+    def claim(self, retry_expired: bool = True) -> Response | None:
+        """
+        Claims the key in the current transaction.
+
+        Returns:
+            Response | None: the stored response to replay, or None when the
+            request must be processed.
+        """
+
+        if self.key is None:
+            return None
+
+        cached = response_cache.get((self.user_id, self.key))
+        if cached is not None:
+            return self._replay(cached)
+
+        now = utcnow()
+        self.record = IdempotencyKey(
+            key=self.key,
+            user_id=self.user_id,
+            endpoint=self.endpoint,
+            request_hash=self.request_hash,
+            created_at=now,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        )
+
+        try:
+            # Waits here while a concurrent request holds the same key. The
+            # savepoint keeps a conflict from discarding the whole transaction.
+            with self.session.begin_nested():
+                self.session.add(self.record)
+            return None
+        except IntegrityError:
+            self.record = None
+
+        stored = self._stored()
+
+        if stored is None or stored.expires_at <= utcnow():
+            if stored is not None:
+                self.session.delete(stored)
+                self.session.flush()
+
+            if retry_expired:
+                return self.claim(retry_expired=False)
+
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Request with this Idempotency-Key is being processed",
+            )
+
+        if stored.status_code is None or stored.response_body is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Request with this Idempotency-Key is being processed",
+            )
+
+        entry = StoredResponse(
+            stored.request_hash, stored.status_code, stored.response_body, stored.expires_at
+        )
+        response_cache.put((self.user_id, self.key), entry)
+
+        return self._replay(entry)
+
+    def store(self, response: SQLModel, status_code: int = status.HTTP_200_OK):
+        """Saves the response in the claimed row, before the commit."""
+
+        if self.record is None:
+            return
+
+        self.record.status_code = status_code
+        self.record.response_body = response.model_dump_json()
+        self.session.add(self.record)
+
+    def remember(self):
+        """Adds the committed response to the in-process cache."""
+
+        record = self.record
+
+        if record is None or record.status_code is None or record.response_body is None:
+            return
+
+        response_cache.put(
+            (self.user_id, record.key),
+            StoredResponse(
+                record.request_hash,
+                record.status_code,
+                record.response_body,
+                record.expires_at,
+            ),
+        )
+
+
+def purge_expired_idempotency_keys(
+    session: Session, batch_size: int = IDEMPOTENCY_PURGE_BATCH
+) -> int:
+    """
+    Deletes expired keys in batches, committing after each one.
+
+    Returns:
+        int: number of keys deleted.
+    """
+
+    total = 0
+
+    while True:
+        expired_ids = (
+            select(IdempotencyKey.id)
+            .where(col(IdempotencyKey.expires_at) <= utcnow())
+            .order_by(col(IdempotencyKey.expires_at))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+
+        result = session.exec(  # type: ignore
+            delete(IdempotencyKey).where(col(IdempotencyKey.id).in_(expired_ids))
+        )
+        session.commit()
+
+        total += result.rowcount
+
+        if result.rowcount < batch_size:
+            return total
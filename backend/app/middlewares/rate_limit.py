@@ -0,0 +1,263 @@
+"""
+Token-bucket rate limits per enterprise and per user.
+
+Every authenticated request takes one token from the bucket of its user and
+one from the bucket of its enterprise, for the route class of the request
+(`write`, `read` or `heavy`, see app.middlewares.admission). A request
+finding either bucket empty is answered 429 with `Retry-After`, without
+taking any token. Buckets refill continuously at their rate, up to their
+burst capacity.
+
+The buckets live in the worker process, so the check is a dictionary lookup
+under a lock and never waits on the database. With several workers or pods,
+`sync_rate_limits` (a periodic job, off by default) merges the tokens taken
+locally into the `rate_limit_bucket` table with one upsert and sets the
+local buckets to the shared result, so all the workers converge on one
+bucket per key; between two syncs each worker can overspend by what it
+serves during the interval.
+
+Limits are "<class>=<tokens per second>:<burst>" lists, separated by commas,
+the burst defaulting to one second of tokens; a class missing from a list is
+not limited.
+
+Settings (environment):
+    RATE_LIMIT_ENABLED: 0 disables the limits (default: 1).
+    RATE_LIMIT_USER: Limits per user
+        (default: write=20:40,read=50:100,heavy=1:10).
+    RATE_LIMIT_ENTERPRISE: Limits per enterprise
+        (default: write=100:200,read=200:400,heavy=4:20).
+    RATE_LIMIT_MAX_BUCKETS: Buckets kept per worker before full ones are
+        dropped (default: 100000).
+    RATE_LIMIT_IDLE_SECONDS: Shared buckets untouched for this long are
+        deleted by the sync (default: 3600).
+    RATE_LIMIT_SYNC_INTERVAL_SECONDS: Interval of `sync_rate_limits`, see
+        app.tasks (default: 0, off).
+"""
+
+from dataclasses import dataclass
+import math
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+import sqlalchemy as sa
+from sqlmodel import Session, col, delete
+
+from app.db.upsert import insert_for
+from app.middlewares.admission import route_class
+from app.middlewares.auth import authenticate_user
+from app.models.rate_limit import RateLimitBucket
+from app.models.user import UserRead
+
+
+def parse_limits(value: str) -> dict[str, tuple[float, float]]:
+    """Parses "<class>=<rate>[:<burst>],..." into {class: (rate, burst)}."""
+
+    limits = {}
+    for item in filter(None, (x.strip() for x in value.split(","))):
+        name, _, numbers = item.partition("=")
+        rate, _, burst = numbers.partition(":")
+        limit = (float(rate), float(burst) if burst else max(float(rate), 1.0))
+
+        if limit[0] <= 0 or limit[1] < 1:
+            raise ValueError(f"Invalid rate limit {item!r}")
+
+        limits[name.strip()] = limit
+
+    return limits
+
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_USER = parse_limits(
+    os.environ.get("RATE_LIMIT_USER", "write=20:40,read=50:100,heavy=1:10")
+)
+RATE_LIMIT_ENTERPRISE = parse_limits(
+    os.environ.get("RATE_LIMIT_ENTERPRISE", "write=100:200,read=200:400,heavy=4:20")
+)
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", "100000"))
+RATE_LIMIT_IDLE_SECONDS = int(os.environ.get("RATE_LIMIT_IDLE_SECONDS", "3600"))
+
+
+@dataclass
+class Bucket:
+    rate: float
+    capacity: float
+    tokens: float
+    refilled_at: float
+    # Tokens taken since the last sync
+    taken: int = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+
+class RateLimiter:
+    """Thread-safe store of token buckets keyed by strings."""
+
+    def __init__(
+        self,
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+        clock=time.time,
+    ):
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self._buckets: dict[str, Bucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, rate: float, capacity: float, now: float) -> Bucket:
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._drop_full(now)
+            bucket = self._buckets[key] = Bucket(rate, capacity, capacity, now)
+        else:
+            bucket.refill(now)
+
+        return bucket
+
+    def _drop_full(self, now: float):
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity and not bucket.taken:
+                del self._buckets[key]
+
+    def take(self, limits: list[tuple[str, float, float]]) -> float:
+        """
+        Takes one token from each bucket of `limits`, (key, rate, burst)
+        tuples, or from none when one of them is empty.
+
+        Returns:
+            float: 0 when the tokens were taken, otherwise the seconds until
+            every bucket has a token again.
+        """
+
+        with self._lock:
+            now = self.clock()
+            buckets = [self._bucket(key, rate, burst, now) for key, rate, burst in limits]
+
+            wait = max(((1 - x.tokens) / x.rate for x in buckets if x.tokens < 1), default=0.0)
+            if wait > 0:
+                return wait
+
+            for bucket in buckets:
+                bucket.tokens -= 1
+                bucket.taken += 1
+
+            return 0.0
+
+    def taken(self) -> dict[str, Bucket]:
+        """Copies of the buckets with tokens taken since the last call."""
+
+        with self._lock:
+            now = self.clock()
+            pending = {}
+            for key, bucket in self._buckets.items():
+                if bucket.taken:
+                    bucket.refill(now)
+                    pending[key] = Bucket(**vars(bucket))
+                    bucket.taken = 0
+
+            return pending
+
+    def merge(self, shared: dict[str, tuple[float, float]]):
+        """Sets buckets to their shared (tokens, refilled_at), minus what was taken since."""
+
+        with self._lock:
+            for key, (tokens, refilled_at) in shared.items():
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.tokens = tokens - bucket.taken
+                    bucket.refilled_at = refilled_at
+                    bucket.refill(self.clock())
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter = RateLimiter()
+
+
+async def rate_limit(request: Request, current_user: UserRead = Depends(authenticate_user)):
+    """
+    Router dependency taking the tokens of a request, see the module. Async so
+    it runs on the event loop instead of taking a threadpool slot; the user
+    decoded here is the one the route receives.
+    """
+
+    name = route_class(request.method, request.scope["path"])
+    if not RATE_LIMIT_ENABLED or name is None:
+        return
+
+    limits = [
+        (f"{kind}:{owner}:{name}", *per_class[name])
+        for kind, owner, per_class in (
+            ("user", current_user.id, RATE_LIMIT_USER),
+            ("enterprise", current_user.enterprise_id, RATE_LIMIT_ENTERPRISE),
+        )
+        if name in per_class and owner is not None
+    ]
+
+    wait = rate_limiter.take(limits)
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def sync_rate_limits(session: Session, limiter: RateLimiter = rate_limiter) -> int:
+    """
+    Merges the tokens taken by this worker into the shared buckets and
+    updates the local ones from them, see the module.
+
+    Returns:
+        int: number of buckets synchronized.
+    """
+
+    pending = limiter.taken()
+    shared = RateLimitBucket.__table__  # type: ignore
+    now = limiter.clock()
+
+    if pending:
+        statement = insert_for(session, RateLimitBucket).values(
+            [
+                {
+                    "key": key,
+                    # A new shared bucket starts full, minus the tokens taken
+                    "tokens": bucket.capacity - bucket.taken,
+                    "capacity": bucket.capacity,
+                    "rate": bucket.rate,
+                    "refilled_at": bucket.refilled_at,
+                }
+                for key, bucket in pending.items()
+            ]
+        )
+        new = statement.excluded
+        refilled = shared.c.tokens + (new.refilled_at - shared.c.refilled_at) * new.rate
+        statement = statement.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "tokens": sa.case((refilled < new.capacity, refilled), else_=new.capacity)
+                - (new.capacity - new.tokens),
+                "capacity": new.capacity,
+                "rate": new.rate,
+                "refilled_at": new.refilled_at,
+            },
+        ).returning(shared.c.key, shared.c.tokens, shared.c.refilled_at)
+
+        rows = session.exec(statement).all()  # type: ignore
+        limiter.merge({row.key: (row.tokens, row.refilled_at) for row in rows})
+
+    session.exec(  # type: ignore
+        delete(RateLimitBucket).where(
+            col(RateLimitBucket.refilled_at) < now - RATE_LIMIT_IDLE_SECONDS
+        )
+    )
+    session.commit()
+
+    return len(pending)
@@ -2,21 +2,27 @@
 This module contains middleware for sending messages. It is part of the backend application of the sec-microservice-rh project.
 
 The middleware defined here can be used to send messages to other parts of the application or to external services. This can be useful for logging, notifications, or inter-service communication.
+
+The broker clients are imported on the first message sent.
 """
 
 import asyncio
 from collections.abc import Coroutine
 import threading
-from typing import Any, Callable
+from typing import Any, Callable, TYPE_CHECKING
 
-from app.messages.client import AsyncSender, SyncSender
+if TYPE_CHECKING:
+    from app.messages.client import SyncSender
 
 
-def run_sender(sender: SyncSender, message):
+def run_sender(sender: "SyncSender", message):
     sender.send_message(message)
 
 
 async def send_async_message_loop(message: str) -> None:
+    # pylint: disable=import-outside-toplevel
+    from app.messages.client import AsyncSender
+
     print("Creating task...")
     loop = asyncio.get_event_loop()
     sender = AsyncSender(queue_name="sells.#")
@@ -25,6 +31,9 @@ async def send_async_message_loop(message: str) -> None:
 
 
 def send_async_message(message: str) -> None:
+    # pylint: disable=import-outside-toplevel
+    from app.messages.client import SyncSender
+
     sender = SyncSender(queue_name="sells.#")
     threading.Thread(target=run_sender, args=(sender, message)).start()
 
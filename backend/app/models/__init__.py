@@ -1 +1 @@
-from . import enterprise, role, scope, user
+from . import enterprise, idempotency, rate_limit, reservation, role, scope, user, watermark
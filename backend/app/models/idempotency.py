@@ -0,0 +1,31 @@
+"""
+This module defines the IdempotencyKey model, which stores the response of a
+write request identified by the client `Idempotency-Key` header, so retries
+replay it instead of running the request again.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field
+
+from app.db.base import BaseIDModel
+
+
+class IdempotencyKey(BaseIDModel, table=True):
+    """Represents a request already processed for a user and key."""
+
+    __tablename__ = "idempotency_key"
+    __table_args__ = (UniqueConstraint("user_id", "key"),)
+
+    key: str = Field(description="Idempotency-Key sent by the client.", max_length=255)
+    user_id: int = Field(description="User that sent the request.")
+    endpoint: str = Field(description="Method and route of the request.", max_length=120)
+    request_hash: str = Field(
+        description="SHA-256 of the endpoint and payload.", max_length=64
+    )
+    status_code: Optional[int] = Field(default=None)
+    response_body: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime = Field(index=True)
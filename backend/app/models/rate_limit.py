@@ -0,0 +1,19 @@
+"""
+This module defines the RateLimitBucket model, the token buckets shared by
+the workers of every pod when rate limits are synchronized through the
+database (see app.middlewares.rate_limit).
+"""
+
+from sqlmodel import Field, SQLModel
+
+
+class RateLimitBucket(SQLModel, table=True):
+    """Tokens left in a bucket when it was last refilled."""
+
+    __tablename__ = "rate_limit_bucket"
+
+    key: str = Field(primary_key=True, max_length=120)
+    tokens: float = Field(description="Tokens left, negative when overspent.")
+    capacity: float = Field(description="Tokens of a full bucket.")
+    rate: float = Field(description="Tokens added per second.")
+    refilled_at: float = Field(description="Unix time of the last refill.", index=True)
@@ -0,0 +1,64 @@
+"""
+This module defines the StockReservation model, a hold on product stock while
+a customer pays. A held reservation is either confirmed into a Sell, released
+by the user, or expired by the reaper job once `expires_at` has passed.
+"""
+
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+from app.db.base import BaseIDModel
+
+
+class ReservationStatus(str, Enum):
+    HELD = "held"
+    CONFIRMED = "confirmed"
+    RELEASED = "released"
+    EXPIRED = "expired"
+
+
+class StockReservation(BaseIDModel, table=True):
+    """Represents a quantity of a product held for a user."""
+
+    __tablename__ = "stock_reservation"
+    __table_args__ = (
+        # The reaper looks up held reservations by expiration
+        Index("ix_stock_reservation_status_expires_at", "status", "expires_at"),
+    )
+
+    product_id: int = Field(foreign_key="product.id", index=True)
+    client_id: int | None = Field(foreign_key="client.id", default=None, index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    quantity: int = Field(description="Quantity of the product held.", gt=0)
+    status: str = Field(default=ReservationStatus.HELD.value, max_length=20)
+    sell_id: Optional[int] = Field(
+        default=None, description="Sell created when the reservation is confirmed."
+    )
+    created_at: datetime
+    expires_at: datetime
+
+
+class ReservationCreate(SQLModel):
+    client_id: int
+    product_id: int
+    quantity: int = Field(gt=0)
+
+
+class ReservationRead(SQLModel):
+    id: int
+    product_id: int
+    client_id: int | None
+    user_id: int
+    quantity: int
+    status: ReservationStatus
+    sell_id: Optional[int] = None
+    created_at: datetime
+    expires_at: datetime
+
+
+class ReservationResponse(SQLModel):
+    data: ReservationRead
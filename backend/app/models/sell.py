@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint, text
 from sqlalchemy.orm import RelationshipProperty
 from sqlmodel import Field, Relationship, SQLModel
 from app.db.base import BaseIDModel
@@ -83,14 +83,87 @@ class BaseProduct(ProductBase, table=True):
         )
     )
     enterprise: "Enterprise" = Relationship(back_populates="products")
+    stock_shards: int = Field(
+        default=0,
+        ge=0,
+        description=(
+            "Number of ProductStockShard rows holding the stock, "
+            "0 when the stock is kept in this row."
+        ),
+    )
+    reserved: int = Field(
+        default=0,
+        ge=0,
+        description="Units held by open reservations, already taken out of the stock.",
+    )
 
     __tablename__ = "product"
-    __table_args__ = (UniqueConstraint("name", "enterprise_id"),)
+    __table_args__ = (
+        UniqueConstraint("name", "enterprise_id"),
+        # Lookups only see products not soft-deleted, see app.db.products
+        Index(
+            "ix_product_live_enterprise_id_id",
+            "enterprise_id",
+            "id",
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_product_live_enterprise_id_name",
+            "enterprise_id",
+            "name",
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_product_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+            sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+        # The sharded products rebalanced by app.db.stock
+        Index(
+            "ix_product_sharded_id",
+            "id",
+            postgresql_where=text("stock_shards > 0"),
+            sqlite_where=text("stock_shards > 0"),
+        ),
+    )
+
+
+class ProductStockShard(BaseIDModel, table=True):
+    """
+    Represents a slice of the stock of a product in hot-product mode.
+
+    Sales decrement a random shard instead of the product row, so concurrent
+    sales of the same product do not serialize on a single row lock.
+    """
+
+    __tablename__ = "product_stock_shard"
+    __table_args__ = (UniqueConstraint("product_id", "shard"),)
+    product_id: int = Field(foreign_key="product.id", index=True)
+    shard: int = Field(description="Shard number, from 0 to stock_shards - 1.")
+    stock: int = Field(description="Stock held by the shard.", ge=0, default=0)
+
+
+class StockShardsUpdate(SQLModel):
+    shards: int = Field(ge=0, le=64)
+
+
+class ProductStock(SQLModel):
+    product_id: int
+    stock: int = Field(description="Units available for sale or reservation.")
+    reserved: int = Field(description="Units held by open reservations.")
+    stock_shards: int
+
+
+class ProductStockResponse(SQLModel):
+    data: ProductStock
 
 
 class BaseSell(BaseIDModel):
-    product_id: int = Field(foreign_key="product.id")
-    client_id: int | None = Field(foreign_key="client.id")
+    product_id: int = Field(foreign_key="product.id", index=True)
+    client_id: int | None = Field(foreign_key="client.id", index=True)
     quantity: int = Field(description="Quantity of the product sold.", ge=0)
     user_id: int = Field(foreign_key="user.id")
     created_at: Optional[datetime] = Field(
@@ -99,9 +172,22 @@ class BaseSell(BaseIDModel):
 
 
 class Sell(BaseSell, table=True):
-    """Represents a sell stored in the database."""
+    """
+    Represents a sell stored in the database.
+
+    `enterprise_id` is the enterprise of the user who made the sell, copied
+    on insert so tenant checks and enterprise listings read `sell` alone.
+    Rows from before the column are filled by `python -m app.db.migrate
+    --backfill`, which then makes the column NOT NULL.
+    """
 
     __tablename__ = "sell"
+    __table_args__ = (
+        Index("ix_sell_enterprise_id_created_at", "enterprise_id", "created_at"),
+    )
+    enterprise_id: int | None = Field(
+        default=None, foreign_key="enterprise.id", nullable=False
+    )
     user: Optional["User"] = Relationship(back_populates="sells")
     client: Optional["Client"] = Relationship(back_populates="sells")
 
@@ -143,6 +229,57 @@ class ClientCreate(SQLModel):
     person_code: Optional[str] = None
 
 
+class ClientImport(ClientCreate):
+    """A row of POST /sells/client/import, with the limits of the columns."""
+
+    name: str = Field(min_length=1, max_length=120)
+    description: Optional[str] = Field(default=None, max_length=120)
+    enterprise_code: Optional[str] = Field(default=None, min_length=6, max_length=40)
+    person_code: Optional[str] = Field(default=None, min_length=6, max_length=40)
+
+
+class ClientImportError(SQLModel):
+    line: int
+    error: str
+
+
+class ClientImportReport(SQLModel):
+    read: int
+    inserted: int
+    errors: list[ClientImportError]
+
+
+class ClientImportResponse(SQLModel):
+    data: ClientImportReport
+
+
+class SellBulkDelete(SQLModel):
+    """Sells deleted by POST /sells/delete, matching every given filter."""
+
+    ids: Optional[list[int]] = Field(default=None, max_length=10000)
+    user_ids: Optional[list[int]] = Field(default=None, max_length=1000)
+    client_id: Optional[int] = None
+    product_id: Optional[int] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+
+class ClientBulkDelete(SQLModel):
+    """Clients deleted by POST /sells/client/delete, matching any given list."""
+
+    ids: Optional[list[int]] = Field(default=None, max_length=10000)
+    person_codes: Optional[list[str]] = Field(default=None, max_length=10000)
+    enterprise_codes: Optional[list[str]] = Field(default=None, max_length=10000)
+
+
+class BulkDeleteReport(SQLModel):
+    deleted: int
+
+
+class BulkDeleteResponse(SQLModel):
+    data: BulkDeleteReport
+
+
 class ClientRead(SQLModel):
     id: int
     name: str
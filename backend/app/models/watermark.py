@@ -0,0 +1,20 @@
+"""
+This module defines the UserEventWatermark model, which keeps the version of
+the latest RH event applied to each user, so redelivered and out-of-order
+events can be dropped before they are written.
+"""
+
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class UserEventWatermark(SQLModel, table=True):
+    """The `start_date` of the newest event applied to a user."""
+
+    __tablename__ = "user_event_watermark"
+
+    # No foreign key: the watermark outlives the user, so a stale create or
+    # update arriving after a delete is still recognized.
+    user_id: int = Field(primary_key=True)
+    applied_at: datetime = Field(description="start_date of the newest applied event, UTC.")
@@ -0,0 +1,37 @@
+"""
+JSON responses for the API.
+
+orjson backs the default response class of the application and
+`json_response`.
+
+Handlers on read-heavy routes build plain dicts from column selects and return
+`json_response(...)` directly. FastAPI then skips the `response_model`
+validation and serialization it runs on returned models, which are kept on the
+route only for the OpenAPI schema.
+"""
+
+from typing import Any
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+import orjson
+
+
+DefaultJSONResponse = ORJSONResponse
+
+
+def dump_json(content: Any) -> bytes:
+    """Serializes dicts, lists and datetimes to JSON bytes."""
+
+    #pylint: disable=no-member
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """A JSON response of already valid content, sent without revalidation."""
+
+    return Response(
+        content=dump_json(content),
+        status_code=status_code,
+        media_type="application/json",
+    )
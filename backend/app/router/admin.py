@@ -0,0 +1,90 @@
+"""
+FastAPI router for operating the service.
+
+The dead-letter queue holds RH events that failed every retry tier (see
+app.messages.dead_letter). It is shared by every enterprise, so its routes
+require an Owner with the All scope.
+"""
+
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+
+from app.messages.dead_letter import DeadLetters
+from app.middlewares.auth import authenticate_user, authorize_user
+from app.models.role import DefaultRole
+from app.models.scope import DefaultScope
+from app.models.user import UserRead
+
+
+router = APIRouter(prefix="/admin")
+
+
+class DeadLetterMessage(BaseModel):
+    body: str
+    headers: dict[str, Any]
+
+
+class DeadLetterList(BaseModel):
+    count: int
+    data: list[DeadLetterMessage]
+
+
+class DeadLetterReplay(BaseModel):
+    replayed: int
+
+
+def authorize_admin(current_user: UserRead):
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(DefaultRole.OWNER),
+    )
+
+
+@router.get("/dlq", response_model=DeadLetterList)
+async def inspect_dead_letters(
+    limit: int = Query(default=50, ge=1, le=1000),
+    current_user: UserRead = Depends(authenticate_user),
+) -> DeadLetterList:
+    """
+    Reads the oldest dead-lettered events, leaving them in the queue.
+
+    Returns:
+        DeadLetterList: Messages in the queue and up to `limit` of them.
+    """
+
+    authorize_admin(current_user)
+
+    try:
+        count, messages = await DeadLetters().peek(limit)
+    except ConnectionError as ex:
+        raise HTTPException(status_code=503, detail="Broker unavailable") from ex
+
+    return DeadLetterList(
+        count=count, data=[DeadLetterMessage(**message) for message in messages]
+    )
+
+
+@router.post("/dlq/replay", response_model=DeadLetterReplay)
+async def replay_dead_letters(
+    limit: int = Query(default=100, ge=1, le=10000),
+    current_user: UserRead = Depends(authenticate_user),
+) -> DeadLetterReplay:
+    """
+    Moves the oldest dead-lettered events back to the main queue, with their
+    retry count reset.
+
+    Returns:
+        DeadLetterReplay: Number of messages replayed.
+    """
+
+    authorize_admin(current_user)
+
+    try:
+        replayed = await DeadLetters().replay(limit)
+    except ConnectionError as ex:
+        raise HTTPException(status_code=503, detail="Broker unavailable") from ex
+
+    return DeadLetterReplay(replayed=replayed)
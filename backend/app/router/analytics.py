@@ -0,0 +1,160 @@
+"""
+FastAPI router for the sell analytics of an enterprise, see app.db.analytics.
+
+Every route takes an optional `start_date`/`end_date` range on the creation
+of the sells (half-open, like GET /sells/) and requires a Manager with the
+Sells or All scope.
+"""
+
+from datetime import datetime
+import math
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlmodel import Session
+
+from app.db.analytics import (
+    AnalyticsUnavailable,
+    SellColumns,
+    daily_revenue,
+    day_number,
+    day_strings,
+    days_before,
+    fetch_columns,
+    moving_average,
+    revenue_by_product_day,
+    revenue_percentiles,
+    top_sellers,
+)
+from app.db.conn import get_db
+from app.middlewares.auth import authenticate_user, authorize_user
+from app.middlewares.rate_limit import rate_limit
+from app.models.role import DefaultRole
+from app.models.user import UserRead
+from app.responses import json_response
+from app.router.sell import naive_utc
+
+
+router = APIRouter(prefix="/sells/analytics", dependencies=[Depends(rate_limit)])
+
+
+def sell_columns(
+    db_session: Session,
+    current_user: UserRead,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    product_id: int | None = None,
+) -> SellColumns:
+    authorize_user(
+        user=current_user,
+        operation_scopes=["Sells", "All"],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.MANAGER
+        ),
+    )
+
+    try:
+        return fetch_columns(
+            db_session.connection(),
+            current_user.enterprise_id,
+            naive_utc(start_date) if start_date is not None else None,
+            naive_utc(end_date) if end_date is not None else None,
+            product_id,
+        )
+    except AnalyticsUnavailable as ex:
+        raise HTTPException(status_code=503, detail=str(ex)) from ex
+
+
+@router.get("/revenue")
+def get_revenue(
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    product_id: int | None = None,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> Response:
+    """Quantity sold and revenue per product and day."""
+
+    columns = sell_columns(db_session, current_user, start_date, end_date, product_id)
+
+    return json_response({"data": revenue_by_product_day(columns)})
+
+
+@router.get("/moving-average")
+def get_revenue_moving_average(
+    window: int = Query(default=7, ge=1, le=366),
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    product_id: int | None = None,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> Response:
+    """
+    Revenue of every day of the range and its trailing average over `window`
+    days, null until the window is full.
+    """
+
+    columns = sell_columns(db_session, current_user, start_date, end_date, product_id)
+    first_day, revenue = daily_revenue(
+        columns,
+        day_number(naive_utc(start_date)) if start_date is not None else None,
+        days_before(naive_utc(end_date)) if end_date is not None else None,
+    )
+    averages = moving_average(revenue, window)
+
+    return json_response(
+        {
+            "data": [
+                {
+                    "day": day,
+                    "revenue": amount,
+                    "moving_average": None if math.isnan(average) else average,
+                }
+                for day, amount, average in zip(
+                    day_strings(range(first_day, first_day + len(revenue))),
+                    revenue.tolist(),
+                    averages.tolist(),
+                )
+            ]
+        }
+    )
+
+
+@router.get("/top-sellers")
+def get_top_sellers(
+    limit: int = Query(default=10, ge=1, le=1000),
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> Response:
+    """The users of the enterprise with the highest revenue."""
+
+    columns = sell_columns(db_session, current_user, start_date, end_date)
+
+    return json_response({"data": top_sellers(columns, limit)})
+
+
+@router.get("/percentiles")
+def get_revenue_percentiles(
+    q: str = "50,90,99",
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    product_id: int | None = None,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> Response:
+    """Percentiles `q` (comma separated, 0 to 100) of the revenue per sell."""
+
+    try:
+        percentiles = [float(value) for value in q.split(",")]
+    except ValueError as ex:
+        raise HTTPException(status_code=422, detail="q must be comma separated numbers") from ex
+
+    if not all(0 <= value <= 100 for value in percentiles):
+        raise HTTPException(status_code=422, detail="Percentiles must be between 0 and 100")
+
+    columns = sell_columns(db_session, current_user, start_date, end_date, product_id)
+
+    return json_response(
+        {"data": {"sells": len(columns), **revenue_percentiles(columns, percentiles)}}
+    )
@@ -6,6 +6,8 @@ This module contains endpoints for creating, retrieving, updating, and deleting
 
 from fastapi import APIRouter
 
+from app.metrics import counters
+
 router = APIRouter(prefix="/check")
 
 
@@ -19,3 +21,15 @@ async def liveness():
     """
 
     return {"message": "Success"}
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Reads the counters of this worker process.
+
+    Returns:
+        dict: Counter values by name.
+    """
+
+    return {"data": counters.snapshot()}
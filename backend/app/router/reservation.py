@@ -0,0 +1,217 @@
+"""
+FastAPI router for stock reservations.
+
+A reservation holds stock for the current user while the customer pays. It is
+confirmed into a Sell, released, or expired by the reaper job after
+RESERVATION_TTL_SECONDS (default: 15 minutes).
+
+Reserving, confirming and releasing need the Sells (or All) scope and a
+collaborator role or above, and a reservation is only made for a client of
+the enterprise of the user.
+"""
+
+from datetime import timedelta
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+
+from app.db import statements
+from app.db.conn import get_db
+from app.db.stock import hold_stock, release_held_stock
+from app.middlewares.auth import authenticate_user, authorize_user
+from app.middlewares.idempotency import utcnow
+from app.middlewares.rate_limit import rate_limit
+from app.models.reservation import (
+    ReservationCreate,
+    ReservationRead,
+    ReservationResponse,
+    ReservationStatus,
+    StockReservation,
+)
+from app.models.role import DefaultRole
+from app.models.scope import DefaultScope
+from app.models.sell import BaseProduct, Sell
+from app.models.user import UserRead
+
+
+RESERVATION_TTL_SECONDS = int(os.environ.get("RESERVATION_TTL_SECONDS", "900"))
+
+
+router = APIRouter(prefix="/sells/reservations", dependencies=[Depends(rate_limit)])
+
+
+def authorize_reservations(current_user: UserRead):
+    """Raises 403 unless the user may sell, see the module."""
+
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.SELLS.value, "All"],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.COLLABORATOR
+        ),
+    )
+
+
+def get_held_reservation(
+    db_session: Session, reservation_id: int, current_user: UserRead
+) -> tuple[StockReservation, BaseProduct]:
+    """Locks a reservation of the current user, which must still be held."""
+
+    reservation = db_session.exec(
+        statements.RESERVATION_FOR_UPDATE,
+        params={"reservation_id": reservation_id, "user_id": current_user.id},
+    ).first()
+
+    if reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+
+    if reservation.status != ReservationStatus.HELD.value:
+        raise HTTPException(
+            status_code=409, detail=f"Reservation is {reservation.status}"
+        )
+
+    product = db_session.get(BaseProduct, reservation.product_id)
+
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    return reservation, product
+
+
+@router.post("/", response_model=ReservationResponse)
+def create_reservation(
+    reservation: ReservationCreate,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ReservationResponse:
+    authorize_reservations(current_user)
+
+    client = db_session.exec(
+        statements.CLIENT,
+        params={
+            "client_id": reservation.client_id,
+            "enterprise_id": current_user.enterprise_id,
+        },
+    ).first()
+
+    if client is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    product = db_session.exec(
+        statements.PRODUCT,
+        params={
+            "product_id": reservation.product_id,
+            "enterprise_id": current_user.enterprise_id,
+        },
+    ).first()
+
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    if product.price is None:
+        raise HTTPException(status_code=400, detail="Product has no price")
+
+    if not hold_stock(db_session, product, reservation.quantity):
+        raise HTTPException(status_code=400, detail="Not enough stock")
+
+    now = utcnow()
+    db_reservation = StockReservation(
+        **reservation.model_dump(),
+        user_id=current_user.id,
+        created_at=now,
+        expires_at=now + timedelta(seconds=RESERVATION_TTL_SECONDS),
+    )
+    db_session.add(db_reservation)
+    db_session.flush()
+
+    response = ReservationResponse(
+        data=ReservationRead(**db_reservation.model_dump())
+    )
+
+    return response
+
+
+@router.get("/{reservation_id}", response_model=ReservationResponse)
+def read_reservation(
+    reservation_id: int,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ReservationResponse:
+    reservation = db_session.exec(
+        statements.RESERVATION,
+        params={"reservation_id": reservation_id, "user_id": current_user.id},
+    ).first()
+
+    if reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+
+    return ReservationResponse(data=ReservationRead(**reservation.model_dump()))
+
+
+@router.post("/{reservation_id}/confirm", response_model=ReservationResponse)
+def confirm_reservation(
+    reservation_id: int,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ReservationResponse:
+    """Turns a held reservation into a Sell, the stock was already taken."""
+
+    authorize_reservations(current_user)
+
+    reservation, product = get_held_reservation(
+        db_session, reservation_id, current_user
+    )
+
+    if product.deleted_at is not None:
+        # Not sold anymore, the hold is given back when it expires
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    if reservation.expires_at <= utcnow():
+        # Expired but not reaped yet: give the stock back right away
+        release_held_stock(db_session, product, reservation.quantity)
+        reservation.status = ReservationStatus.EXPIRED.value
+        db_session.add(reservation)
+        # Committed before raising, the error rolls the request back
+        db_session.commit()
+        raise HTTPException(status_code=409, detail="Reservation is expired")
+
+    db_sell = Sell(
+        product_id=reservation.product_id,
+        client_id=reservation.client_id,
+        quantity=reservation.quantity,
+        user_id=current_user.id,  # type: ignore
+        enterprise_id=current_user.enterprise_id,
+    )
+    db_session.add(db_sell)
+    db_session.flush()
+
+    release_held_stock(db_session, product, reservation.quantity, sold=True)
+    reservation.status = ReservationStatus.CONFIRMED.value
+    reservation.sell_id = db_sell.id
+    db_session.add(reservation)
+
+    response = ReservationResponse(data=ReservationRead(**reservation.model_dump()))
+
+    return response
+
+
+@router.post("/{reservation_id}/release", response_model=ReservationResponse)
+def release_reservation(
+    reservation_id: int,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ReservationResponse:
+    authorize_reservations(current_user)
+
+    reservation, product = get_held_reservation(
+        db_session, reservation_id, current_user
+    )
+
+    release_held_stock(db_session, product, reservation.quantity)
+    reservation.status = ReservationStatus.RELEASED.value
+    db_session.add(reservation)
+
+    response = ReservationResponse(data=ReservationRead(**reservation.model_dump()))
+
+    return response
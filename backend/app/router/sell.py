@@ -1,29 +1,102 @@
-from fastapi import APIRouter, Depends, HTTPException
+from collections.abc import Iterator
+import csv
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlmodel import Session, and_, col, select
+from sqlmodel import Session
+from app.db import statements
+from app.db.archive import ArchiveUnavailable, read_archived_sells
+from app.db.bulk_delete import delete_clients, delete_sells
+from app.db.client_import import csv_records, import_clients, ndjson_records
 from app.db.conn import get_db
+from app.db.stock import get_total_stock, put_stock, set_stock_shards, take_stock
 from app.middlewares.auth import authenticate_user, authorize_user
+from app.middlewares.idempotency import IdempotentRequest, get_idempotency_key
+from app.middlewares.rate_limit import rate_limit
 from app.models.role import DefaultRole
 from app.models.scope import DefaultScope
 from app.models.sell import (
-    BaseProduct,
     BaseSell,
+    BulkDeleteReport,
+    BulkDeleteResponse,
     Client,
+    ClientBulkDelete,
     ClientCreate,
+    ClientImportReport,
+    ClientImportResponse,
     ClientRead,
     ClientResponse,
+    ProductStock,
+    ProductStockResponse,
     Sell,
+    SellBulkDelete,
     SellCreate,
     SellCreateMe,
     SellDetailResponse,
     SellsResponse,
-    UserSells,
+    StockShardsUpdate,
     UserSellsListResponse,
 )
-from app.models.user import User, UserRead
+from app.models.user import UserRead
+from app.responses import dump_json, json_response
 
 
-router = APIRouter(prefix="/sells")
+router = APIRouter(prefix="/sells", dependencies=[Depends(rate_limit)])
+
+# Sells read per query by GET /sells/export
+EXPORT_CHUNK_ROWS = 5000
+
+# Formats of POST /sells/client/import by file extension
+IMPORT_FORMATS: dict[str, Literal["csv", "ndjson"]] = {
+    "csv": "csv",
+    "ndjson": "ndjson",
+    "jsonl": "ndjson",
+}
+
+
+def naive_utc(value: datetime) -> datetime:
+    # created_at is stored as naive UTC
+    if value.tzinfo is None:
+        return value
+
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def date_params(start_date: datetime | None, end_date: datetime | None) -> dict:
+    """Parameters of the created_at bounds of app.db.statements sell queries."""
+
+    return {
+        "start_date": naive_utc(start_date) if start_date is not None else None,
+        "end_date": naive_utc(end_date) if end_date is not None else None,
+    }
+
+
+def archived_sells(
+    db_session: Session,
+    enterprise_id: int,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    user_ids: list[int] | None,
+) -> Iterator[dict]:
+    """Sells moved to the archive (see app.db.archive), when `start_date` is set."""
+
+    if start_date is None:
+        return iter(())
+
+    try:
+        return read_archived_sells(
+            enterprise_id,
+            naive_utc(start_date),
+            naive_utc(end_date) if end_date is not None else None,
+            user_ids,
+            db_session,
+        )
+    except ArchiveUnavailable as ex:
+        raise HTTPException(status_code=503, detail=str(ex)) from ex
 
 
 class DefaultResponse(BaseModel):
@@ -52,15 +125,54 @@ def create_client(
     if current_user.enterprise_id is None:
         raise HTTPException(status_code=400, detail="User has no enterprise")
 
-    with db_session:
-        db_client = Client(
-            **client.model_dump(), enterprise_id=current_user.enterprise_id
+    db_client = Client(
+        **client.model_dump(), enterprise_id=current_user.enterprise_id
+    )
+    db_session.add(db_client)
+    db_session.flush()
+
+    return ClientResponse(data=ClientRead(**db_client.model_dump()))
+
+
+@router.post("/client/import", response_model=ClientImportResponse)
+def import_clients_file(
+    file: UploadFile,
+    file_format: Literal["csv", "ndjson"] | None = Query(default=None, alias="format"),
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ClientImportResponse:
+    """
+    Creates the clients of a CSV (with a header line) or NDJSON file, with the
+    fields of ClientCreate. The format is taken from the file name when not
+    given. Rows that cannot be created are reported, the others are created.
+    """
+
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.COLLABORATOR
+        ),
+    )
+
+    if current_user.enterprise_id is None:
+        raise HTTPException(status_code=400, detail="User has no enterprise")
+
+    if file_format is None:
+        file_format = IMPORT_FORMATS.get((file.filename or "").rsplit(".", 1)[-1].lower())
+    if file_format is None:
+        raise HTTPException(
+            status_code=400, detail="Unknown file format, use format=csv or format=ndjson"
         )
-        db_session.add(db_client)
-        db_session.commit()
-        db_session.refresh(db_client)
 
-        return ClientResponse(data=ClientRead(**db_client.model_dump()))
+    records = csv_records(file.file) if file_format == "csv" else ndjson_records(file.file)
+
+    try:
+        report = import_clients(db_session.connection(), current_user.enterprise_id, records)
+    except (UnicodeDecodeError, csv.Error) as ex:
+        raise HTTPException(status_code=400, detail=f"Unreadable file: {ex}") from ex
+
+    return ClientImportResponse(data=ClientImportReport(**asdict(report)))
 
 
 @router.get("/client/{client_id}", response_model=ClientResponse)
@@ -70,30 +182,28 @@ def get_client(
     current_user: UserRead = Depends(authenticate_user),
 ) -> ClientResponse:
 
-    with db_session:
-        db_client = db_session.exec(
-            select(Client)
-            .where(col(Client.id) == client_id)
-            .where(col(Client.enterprise_id) == current_user.enterprise_id)
-        ).first()
-
-        if db_client is None:
-            raise HTTPException(status_code=404, detail="Client not found")
-
-        authorize_user(
-            user=current_user,
-            operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
-            operation_hierarchy_order=DefaultRole.get_default_hierarchy(
-                DefaultRole.COLLABORATOR
-            ),
-            custom_checks=(
-                current_user.role.hierarchy
-                <= DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
-                or db_client.created_by == current_user.id
-            ),
-        )
+    db_client = db_session.exec(
+        statements.CLIENT,
+        params={"client_id": client_id, "enterprise_id": current_user.enterprise_id},
+    ).first()
+
+    if db_client is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.COLLABORATOR
+        ),
+        custom_checks=(
+            current_user.role.hierarchy
+            <= DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
+            or db_client.created_by == current_user.id
+        ),
+    )
 
-        return ClientResponse(data=ClientRead(**db_client.model_dump()))
+    return ClientResponse(data=ClientRead(**db_client.model_dump()))
 
 
 @router.get("/client", response_model=ClientReadList)
@@ -103,7 +213,7 @@ def query_clients(
     enterprise_code: str | None = None,
     db_session: Session = Depends(get_db),
     current_user: UserRead = Depends(authenticate_user),
-) -> ClientReadList:
+) -> Response:
 
     authorize_user(
         user=current_user,
@@ -113,41 +223,36 @@ def query_clients(
         ),
     )
 
-    with db_session:
-        query = select(Client).where(
-            col(Client.enterprise_id) == current_user.enterprise_id
-        )
-
-        if name is not None:
-            query = query.where(col(Client.name) == name)
-        if person_code is not None:
-            query = query.where(col(Client.person_code) == person_code)
-        if enterprise_code is not None:
-            query = query.where(col(Client.enterprise_code) == enterprise_code)
-
-        db_clients = db_session.exec(query).all()
-
-        if db_clients is None:
-            raise HTTPException(status_code=404, detail="No clients found")
-
-        resp = ClientReadList(
-            data=[ClientRead(**db_client.model_dump()) for db_client in db_clients]
-        )
+    query = statements.clients(
+        name is not None, person_code is not None, enterprise_code is not None
+    )
+    db_clients = db_session.exec(
+        query,
+        params={
+            "enterprise_id": current_user.enterprise_id,
+            "name": name,
+            "person_code": person_code,
+            "enterprise_code": enterprise_code,
+        },
+    ).all()
+
+    if db_clients is None:
+        raise HTTPException(status_code=404, detail="No clients found")
 
-        authorize_user(
-            user=current_user,
-            operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
-            operation_hierarchy_order=DefaultRole.get_default_hierarchy(
-                DefaultRole.COLLABORATOR
-            ),
-            custom_checks=(
-                current_user.role.hierarchy
-                <= DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
-                or all(x.created_by == current_user.id for x in db_clients)
-            ),
-        )
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.COLLABORATOR
+        ),
+        custom_checks=(
+            current_user.role.hierarchy
+            <= DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
+            or all(x.created_by == current_user.id for x in db_clients)
+        ),
+    )
 
-        return resp
+    return json_response({"data": [row._asdict() for row in db_clients]})
 
 
 @router.delete("/client/{client_id}", response_model=DefaultResponse)
@@ -163,20 +268,111 @@ def delete_client(
             DefaultRole.MANAGER
         ),
     )
-    with db_session:
-        db_client = db_session.exec(
-            select(Client)
-            .where(col(Client.id) == client_id)
-            .where(col(Client.enterprise_id) == current_user.enterprise_id)
-        ).first()
+    db_client = db_session.exec(
+        statements.CLIENT,
+        params={"client_id": client_id, "enterprise_id": current_user.enterprise_id},
+    ).first()
+
+    if db_client is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    db_session.delete(db_client)
+
+    return DefaultResponse()
 
-        if db_client is None:
-            raise HTTPException(status_code=404, detail="Client not found")
 
-        db_session.delete(db_client)
-        db_session.commit()
+@router.post("/client/delete", response_model=BulkDeleteResponse)
+def delete_clients_bulk(
+    filters: ClientBulkDelete,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> BulkDeleteResponse:
+    """
+    Deletes the clients of the enterprise matching any of the given id or code
+    lists, in chunks (see app.db.bulk_delete). Their sells are kept.
+    """
 
-        return DefaultResponse()
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.MANAGER
+        ),
+    )
+    deleted = delete_clients(
+        db_session, current_user.enterprise_id, **filters.model_dump()
+    )
+
+    return BulkDeleteResponse(data=BulkDeleteReport(deleted=deleted))
+
+
+@router.get("/product/{product_id}/stock", response_model=ProductStockResponse)
+def read_product_stock(
+    product_id: int,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ProductStockResponse:
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.COLLABORATOR
+        ),
+    )
+
+    product = db_session.exec(
+        statements.PRODUCT,
+        params={"product_id": product_id, "enterprise_id": current_user.enterprise_id},
+    ).first()
+
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    return ProductStockResponse(
+        data=ProductStock(
+            product_id=product_id,
+            stock=get_total_stock(db_session, product),
+            reserved=product.reserved,
+            stock_shards=product.stock_shards,
+        )
+    )
+
+
+@router.put("/product/{product_id}/stock-shards", response_model=ProductStockResponse)
+def update_product_stock_shards(
+    product_id: int,
+    shards: StockShardsUpdate,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> ProductStockResponse:
+    """Turns hot-product mode on (shards > 0), resizes it or turns it off (0)."""
+
+    authorize_user(
+        user=current_user,
+        operation_scopes=[DefaultScope.ALL.value, DefaultScope.SELLS.value],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.MANAGER
+        ),
+    )
+
+    product = db_session.exec(
+        statements.PRODUCT_FOR_UPDATE,
+        params={"product_id": product_id, "enterprise_id": current_user.enterprise_id},
+    ).first()
+
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    total = set_stock_shards(db_session, product, shards.shards)
+
+    return ProductStockResponse(
+        data=ProductStock(
+            product_id=product_id,
+            stock=total,
+            reserved=product.reserved,
+            stock_shards=shards.shards,
+        )
+    )
 
 
 @router.post("/", response_model=SellDetailResponse)
@@ -184,6 +380,7 @@ def create_sell(
     sell: SellCreate,
     db_session: Session = Depends(get_db),
     current_user: UserRead = Depends(authenticate_user),
+    idempotency_key: str | None = Depends(get_idempotency_key),
 ) -> SellDetailResponse:
     print("Sell detail")
 
@@ -195,45 +392,51 @@ def create_sell(
         ),
     )
 
-    with db_session:
-        stock_product_user = db_session.exec(
-            select(BaseProduct, User)
-            .where(col(BaseProduct.id) == sell.product_id)
-            .join(User, onclause=col(BaseProduct.created_by) == col(User.id))
-            .with_for_update(),
-        ).first()
+    idempotent = IdempotentRequest(
+        db_session, current_user.id, idempotency_key, "POST /sells/", sell
+    )
+
+    replay = idempotent.claim()
+    if replay is not None:
+        return replay  # type: ignore
+
+    stock_product_user = db_session.exec(
+        statements.PRODUCT_AND_CREATOR, params={"product_id": sell.product_id}
+    ).first()
 
-        if stock_product_user is None:
-            print(f"Stock product not found product_id: {sell.product_id}")
-            raise HTTPException(status_code=404, detail="Product not found")
+    if stock_product_user is None:
+        print(f"Stock product not found product_id: {sell.product_id}")
+        raise HTTPException(status_code=404, detail="Product not found")
 
-        stock_product, user = stock_product_user
+    stock_product, user = stock_product_user
 
-        if user.enterprise_id != current_user.enterprise_id:
-            print(
-                "Enterprise id:",
-                user.enterprise_id,
-                "Current user enterprise id:",
-                current_user.enterprise_id,
-            )
-            raise HTTPException(status_code=404, detail="Product not found")
+    if user.enterprise_id != current_user.enterprise_id:
+        print(
+            "Enterprise id:",
+            user.enterprise_id,
+            "Current user enterprise id:",
+            current_user.enterprise_id,
+        )
+        raise HTTPException(status_code=404, detail="Product not found")
 
-        if stock_product.price is None:
-            raise HTTPException(status_code=400, detail="Product has no price")
+    if stock_product.price is None:
+        raise HTTPException(status_code=400, detail="Product has no price")
 
-        if stock_product.stock < sell.quantity:
-            raise HTTPException(status_code=400, detail="Not enough stock")
+    if not take_stock(db_session, stock_product, sell.quantity):
+        raise HTTPException(status_code=400, detail="Not enough stock")
 
-        stock_product.stock -= sell.quantity
-        db_session.add(stock_product)
+    db_sell = Sell(**sell.model_dump(), enterprise_id=current_user.enterprise_id)
 
-        db_sell = Sell(**sell.model_dump())
+    db_session.add(db_sell)
+    db_session.flush()
 
-        db_session.add(db_sell)
-        db_session.commit()
-        db_session.refresh(db_sell)
+    response = SellDetailResponse(data=BaseSell(**db_sell.model_dump()))
+    idempotent.store(response)
+    # Committed here as the response may only be cached once stored
+    db_session.commit()
+    idempotent.remember()
 
-        return SellDetailResponse(data=BaseSell(**db_sell.model_dump()))
+    return response
 
 
 @router.post("/me", response_model=SellDetailResponse)
@@ -241,69 +444,80 @@ def create_my_sell(
     sell: SellCreateMe,
     db_session: Session = Depends(get_db),
     current_user: UserRead = Depends(authenticate_user),
+    idempotency_key: str | None = Depends(get_idempotency_key),
 ) -> SellDetailResponse:
-    with db_session:
+    idempotent = IdempotentRequest(
+        db_session, current_user.id, idempotency_key, "POST /sells/me", sell
+    )
 
-        print(
-            f"Sell id: {sell.product_id}, Enterprise id: {current_user.enterprise_id}"
-        )
-        stock_product = db_session.exec(
-            select(BaseProduct)
-            .where(col(BaseProduct.id) == sell.product_id)
-            .with_for_update(),
-        ).first()
+    replay = idempotent.claim()
+    if replay is not None:
+        return replay  # type: ignore
+
+    print(
+        f"Sell id: {sell.product_id}, Enterprise id: {current_user.enterprise_id}"
+    )
+    stock_product = db_session.exec(
+        statements.PRODUCT,
+        params={"product_id": sell.product_id, "enterprise_id": current_user.enterprise_id},
+    ).first()
 
-        if (
-            stock_product is None
-            or stock_product.enterprise_id != current_user.enterprise_id
-        ):
-            raise HTTPException(status_code=404, detail="Product not found")
+    if stock_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
 
-        if stock_product.price is None:
-            raise HTTPException(status_code=400, detail="Product has no price")
+    if stock_product.price is None:
+        raise HTTPException(status_code=400, detail="Product has no price")
 
-        if stock_product.stock < sell.quantity:
-            raise HTTPException(status_code=400, detail="Not enough stock")
+    if not take_stock(db_session, stock_product, sell.quantity):
+        raise HTTPException(status_code=400, detail="Not enough stock")
 
-        stock_product.stock -= sell.quantity
-        db_session.add(stock_product)
+    db_sell = Sell(
+        **sell.model_dump(),
+        user_id=current_user.id,
+        enterprise_id=current_user.enterprise_id,
+    )
+    db_session.add(db_sell)
+    db_session.flush()
 
-        db_sell = Sell(**sell.model_dump(), user_id=current_user.id)
-        db_session.add(db_sell)
-        db_session.commit()
-        db_session.refresh(db_sell)
+    response = SellDetailResponse(data=BaseSell(**db_sell.model_dump()))
+    idempotent.store(response)
+    # Committed here as the response may only be cached once stored
+    db_session.commit()
+    idempotent.remember()
 
-        return SellDetailResponse(data=BaseSell(**db_sell.model_dump()))
+    return response
 
 
 @router.get("/me", response_model=SellsResponse)
 def get_my_sells(
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
     db_session: Session = Depends(get_db),
     current_user: UserRead = Depends(authenticate_user),
-) -> SellsResponse:
-    with db_session:
-        db_user = db_session.get(User, current_user.id)
+) -> Response:
+    db_user_id = db_session.exec(
+        statements.USER_ID, params={"user_id": current_user.id}
+    ).first()
 
-        if db_user is None:
-            raise HTTPException(status_code=404, detail="User not found")
+    if db_user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-        print("DB User sells:", db_user.sells)
+    sells = db_session.exec(
+        statements.my_sells(start_date is not None, end_date is not None),
+        params={"user_id": current_user.id, **date_params(start_date, end_date)},
+    ).all()
 
-        sells = list(
-            map(
-                lambda x: BaseSell(**x.model_dump()),
-                db_user.sells if db_user.sells is not None else [],
-            )
-        )
-        return SellsResponse(data=sells)
+    return json_response({"data": [row._asdict() for row in sells]})
 
 
 @router.get("/", response_model=UserSellsListResponse)
 def query_sells(
     user_ids: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
     db_session: Session = Depends(get_db),
     current_user: UserRead = Depends(authenticate_user),
-) -> UserSellsListResponse:
+) -> Response:
 
     authorize_user(
         user=current_user,
@@ -313,39 +527,125 @@ def query_sells(
         ),
     )
 
-    with db_session:
-        user_query = select(User).where(
-            col(User.enterprise_id) == current_user.enterprise_id
-        )
-        if user_ids is not None:
-            ids = map(int, user_ids.split(","))
-
-            #pylint: disable=no-member
-            user_query = user_query.where(col(User.id).in_(ids))
-
-        resp = db_session.exec(user_query).all()
-
-        if resp is None:
-            raise HTTPException(status_code=404, detail="No sells found")
-
-        def sells_from_user(x: User):
-            return list(
-                map(
-                    lambda y: BaseSell(**y.model_dump()),
-                    x.sells if x.sells is not None else [],
-                )
-            )
-
-        user_sells = list(
-            map(
-                lambda x: UserSells(
-                    id=x.id, username=x.username, sells=sells_from_user(x)
-                ),
-                resp,
-            )
-        )
+    ids = list(map(int, user_ids.split(","))) if user_ids is not None else None
+    params = {
+        "enterprise_id": current_user.enterprise_id,
+        "user_ids": ids,
+        **date_params(start_date, end_date),
+    }
 
-        return UserSellsListResponse(data=user_sells)
+    users = db_session.exec(
+        statements.enterprise_users(ids is not None), params=params
+    ).all()
+
+    sells_by_user: dict[int, list[dict]] = {user.id: [] for user in users}
+    archived = archived_sells(
+        db_session, current_user.enterprise_id, start_date, end_date, ids
+    )
+    for sell in archived:
+        sells_by_user.setdefault(sell["user_id"], []).append(sell)
+    sell_query = statements.enterprise_sells(
+        start_date is not None, end_date is not None, ids is not None
+    )
+    for row in db_session.exec(sell_query, params=params):
+        sells_by_user.setdefault(row.user_id, []).append(row._asdict())
+
+    return json_response(
+        {
+            "data": [
+                {"id": user.id, "username": user.username, "sells": sells_by_user[user.id]}
+                for user in users
+            ]
+        }
+    )
+
+
+@router.get("/export")
+def export_sells(
+    user_ids: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> StreamingResponse:
+    """
+    Streams the sells of the enterprise as NDJSON, archived sells first when
+    `start_date` reaches them, then the sells of the database by id.
+    """
+
+    authorize_user(
+        user=current_user,
+        operation_scopes=["Sells", "All"],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.MANAGER
+        ),
+    )
+
+    ids = list(map(int, user_ids.split(","))) if user_ids is not None else None
+    enterprise_id = current_user.enterprise_id
+    sell_query = statements.enterprise_sells(
+        start_date is not None, end_date is not None, ids is not None, chunked=True
+    )
+    params = {
+        "enterprise_id": enterprise_id,
+        "user_ids": ids,
+        "limit": EXPORT_CHUNK_ROWS,
+        **date_params(start_date, end_date),
+    }
+    archived = archived_sells(db_session, enterprise_id, start_date, end_date, ids)
+
+    def lines() -> Iterator[bytes]:
+        # Runs after the request dependencies are closed, the session opens
+        # a new transaction for the stream
+        with db_session:
+            for sell in archived:
+                yield dump_json(sell) + b"\n"
+
+            last_id = 0
+            while rows := db_session.exec(
+                sell_query, params={**params, "last_id": last_id}
+            ).all():
+                for row in rows:
+                    yield dump_json(row._asdict()) + b"\n"
+                last_id = rows[-1].id
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/delete", response_model=BulkDeleteResponse)
+def delete_sells_bulk(
+    filters: SellBulkDelete,
+    db_session: Session = Depends(get_db),
+    current_user: UserRead = Depends(authenticate_user),
+) -> BulkDeleteResponse:
+    """
+    Deletes the sells of the enterprise matching every given filter, in chunks
+    (see app.db.bulk_delete), giving their quantities back to the stock.
+    """
+
+    authorize_user(
+        user=current_user,
+        operation_scopes=["Sells", "All"],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.MANAGER
+        ),
+    )
+
+    if not filters.model_dump(exclude_none=True):
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+
+    deleted = delete_sells(
+        db_session,
+        current_user.enterprise_id,
+        ids=filters.ids,
+        user_ids=filters.user_ids,
+        client_id=filters.client_id,
+        product_id=filters.product_id,
+        start_date=naive_utc(filters.start_date) if filters.start_date else None,
+        end_date=naive_utc(filters.end_date) if filters.end_date else None,
+    )
+
+    return BulkDeleteResponse(data=BulkDeleteReport(deleted=deleted))
 
 
 @router.get("/{user_id}/{client_id}/{product_id}", response_model=SellDetailResponse)
@@ -356,39 +656,33 @@ def read_sell(
     db_session: Session = Depends(get_db),
     current_user: UserRead = Depends(authenticate_user),
 ) -> SellDetailResponse:
-    with db_session:
-        clause = and_(
-            col(User.id) == current_user.id,
-            col(User.enterprise_id) == current_user.enterprise_id,
-        )
+    sell = db_session.exec(
+        statements.SELL,
+        params={
+            "user_id": user_id,
+            "client_id": client_id,
+            "product_id": product_id,
+            "enterprise_id": current_user.enterprise_id,
+        },
+    ).first()
+
+    if sell is None:
+        raise HTTPException(status_code=404, detail="Sell not found")
 
-        sell_ex = db_session.exec(
-            select(Sell, col(User.enterprise_id))
-            .where(col(Sell.user_id) == user_id)
-            .where(col(Sell.client_id) == client_id)
-            .where(col(Sell.product_id) == product_id)
-            .join(User, onclause=clause)
-        ).first()
-
-        if sell_ex is None:
-            raise HTTPException(status_code=404, detail="Sell not found")
-
-        sell, _ = sell_ex
-
-        authorize_user(
-            user=current_user,
-            operation_scopes=["Sells", "All"],
-            operation_hierarchy_order=DefaultRole.get_default_hierarchy(
-                DefaultRole.COLLABORATOR
-            ),
-            custom_checks=(
-                current_user.role.hierarchy
-                <= DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
-                or sell.user_id == current_user.id
-            ),
-        )
+    authorize_user(
+        user=current_user,
+        operation_scopes=["Sells", "All"],
+        operation_hierarchy_order=DefaultRole.get_default_hierarchy(
+            DefaultRole.COLLABORATOR
+        ),
+        custom_checks=(
+            current_user.role.hierarchy
+            <= DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
+            or sell.user_id == current_user.id
+        ),
+    )
 
-        return SellDetailResponse(data=sell)
+    return SellDetailResponse(data=sell)
 
 
 @router.delete("/{user_id}/{client_id}/{product_id}", response_model=DefaultResponse)
@@ -406,34 +700,25 @@ def delete_sell(
             DefaultRole.MANAGER
         ),
     )
-    with db_session:
-        sell_product = db_session.exec(
-            select(Sell, BaseProduct)
-            .where(
-                and_(
-                    col(Sell.user_id) == user_id,
-                    col(Sell.product_id) == product_id,
-                    col(Sell.client_id) == client_id,
-                )
-            )
-            .where(User.enterprise_id == current_user.enterprise_id)
-            .join(BaseProduct, onclause=col(Sell.product_id) == col(BaseProduct.id))
-            .join(User, onclause=col(Sell.user_id) == col(User.id))
-            .with_for_update(),
-        ).first()
-
-        if sell_product is None:
-            raise HTTPException(status_code=404, detail="Sell not found")
-
-        sell, prod = sell_product
-
-        if sell is None or prod is None:
-            raise HTTPException(status_code=404, detail="Sell not found")
-
-        prod.stock += sell.quantity
-
-        db_session.add(prod)
-        db_session.delete(sell)
-        db_session.commit()
+    sell_product = db_session.exec(
+        statements.SELL_AND_PRODUCT_FOR_UPDATE,
+        params={
+            "user_id": user_id,
+            "client_id": client_id,
+            "product_id": product_id,
+            "enterprise_id": current_user.enterprise_id,
+        },
+    ).first()
+
+    if sell_product is None:
+        raise HTTPException(status_code=404, detail="Sell not found")
+
+    sell, prod = sell_product
+
+    if sell is None or prod is None:
+        raise HTTPException(status_code=404, detail="Sell not found")
+
+    put_stock(db_session, prod, sell.quantity)
+    db_session.delete(sell)
 
     return DefaultResponse()
@@ -0,0 +1,144 @@
+"""Production entry point for the Sells API.
+
+Runs the application through uvicorn without the file watcher used in development,
+with one worker process per available CPU. uvloop and httptools are dependencies
+of the project; when one of them is not installed a warning is logged and uvicorn
+falls back to asyncio or h11.
+
+All settings are read from the environment:
+
+    SERVER_HOST: Interface to bind (default: 0.0.0.0).
+    SERVER_PORT: Port to bind (default: 80).
+    WEB_CONCURRENCY: Number of worker processes (default: available CPUs).
+    SERVER_KEEPALIVE: Seconds to keep idle connections open (default: 5).
+    SERVER_BACKLOG: Maximum number of pending connections (default: 2048).
+    SERVER_LIMIT_CONCURRENCY: Concurrent connections per worker before
+        answering 503 (default: unlimited).
+    SERVER_LIMIT_MAX_REQUESTS: Requests served before a worker is recycled
+        (default: unlimited).
+    SERVER_GRACEFUL_TIMEOUT: Seconds to drain in-flight requests after
+        SIGTERM before the worker is stopped (default: 25).
+
+Usage:
+    python -m app.server
+"""
+
+from importlib.util import find_spec
+import logging
+import math
+import os
+
+import uvicorn
+
+
+APP = "app.main:app"
+
+logger = logging.getLogger(__name__)
+
+HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+PORT = int(os.environ.get("SERVER_PORT", "80"))
+KEEPALIVE = int(os.environ.get("SERVER_KEEPALIVE", "5"))
+BACKLOG = int(os.environ.get("SERVER_BACKLOG", "2048"))
+GRACEFUL_TIMEOUT = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "25"))
+
+
+def _optional_int(name: str) -> int | None:
+    value = os.environ.get(name, "")
+    return int(value) if value else None
+
+
+def available_cpus() -> float:
+    """
+    Returns the number of CPUs this process may use.
+
+    The container CPU quota (cgroup v2 or v1) takes precedence over the CPU
+    affinity mask, so a pod limited to 300m is not sized as the whole node.
+    """
+
+    cpus = float(len(os.sched_getaffinity(0)))
+
+    quota_files = (
+        ("/sys/fs/cgroup/cpu.max", None),
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    )
+
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file, encoding="ascii") as f:
+                values = f.read().split()
+
+            if period_file is not None:
+                with open(period_file, encoding="ascii") as f:
+                    values.append(f.read().strip())
+
+            quota, period = values[0], values[1]
+        except (OSError, IndexError):
+            continue
+
+        if quota not in ("max", "-1") and int(period) > 0:
+            return min(cpus, int(quota) / int(period))
+
+        break
+
+    return cpus
+
+
+def worker_count() -> int:
+    """Returns WEB_CONCURRENCY or one worker per available CPU."""
+
+    workers = _optional_int("WEB_CONCURRENCY")
+
+    if workers is not None:
+        return max(1, workers)
+
+    return max(1, math.ceil(available_cpus()))
+
+
+def _installed(module: str, fallback: str) -> bool:
+    if find_spec(module) is not None:
+        return True
+
+    logger.warning("%s is not installed, falling back to %s", module, fallback)
+    return False
+
+
+def event_loop() -> str:
+    return "uvloop" if _installed("uvloop", "asyncio") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if _installed("httptools", "h11") else "h11"
+
+
+def server_options() -> dict:
+    """Builds the uvicorn keyword arguments from the environment."""
+
+    return {
+        "host": HOST,
+        "port": PORT,
+        "workers": worker_count(),
+        "loop": event_loop(),
+        "http": http_protocol(),
+        "lifespan": "on",
+        "reload": False,
+        "access_log": False,
+        "proxy_headers": True,
+        "timeout_keep_alive": KEEPALIVE,
+        "backlog": BACKLOG,
+        "limit_concurrency": _optional_int("SERVER_LIMIT_CONCURRENCY"),
+        "limit_max_requests": _optional_int("SERVER_LIMIT_MAX_REQUESTS"),
+        "timeout_graceful_shutdown": GRACEFUL_TIMEOUT,
+    }
+
+
+def main():
+    options = server_options()
+    print(
+        f"Starting {options['workers']} worker(s) "
+        f"with {options['loop']}/{options['http']} on {HOST}:{PORT}"
+    )
+    uvicorn.run(APP, **options)
+
+
+if __name__ == "__main__":
+    main()
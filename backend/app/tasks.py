@@ -0,0 +1,143 @@
+"""
+Periodic maintenance jobs run in the background of each worker.
+
+Jobs are plain synchronous functions taking a database session. They run in a
+thread so they never block the event loop, and a failing run is logged and
+retried on the next interval instead of stopping the job.
+
+Every worker runs every job, so jobs must be safe to run concurrently (batched
+statements using SKIP LOCKED where rows are claimed). Jobs in SINGLE_WORKER_JOBS
+scan tables on every run whatever they find; on PostgreSQL a run of those first
+takes a session advisory lock named after the job with pg_try_advisory_lock, and
+is skipped when another worker, of any pod, holds it.
+"""
+
+import asyncio
+from collections.abc import Callable
+import os
+from sys import stdout
+import zlib
+
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from app.db.archive import archive_old_sells
+from app.db.conn import engine
+from app.db.partitions import maintain_sell_partitions
+from app.db.products import compact_deleted_products
+from app.db.stock import expire_stock_reservations, rebalance_stock_shards
+from app.middlewares.idempotency import purge_expired_idempotency_keys
+from app.middlewares.rate_limit import sync_rate_limits
+
+
+PeriodicJob = tuple[str, Callable[[Session], int], float]
+
+
+PERIODIC_JOBS: list[PeriodicJob] = [
+    (
+        "purge_idempotency_keys",
+        purge_expired_idempotency_keys,
+        float(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "300")),
+    ),
+    (
+        "rebalance_stock_shards",
+        rebalance_stock_shards,
+        float(os.environ.get("STOCK_REBALANCE_INTERVAL_SECONDS", "5")),
+    ),
+    (
+        "expire_stock_reservations",
+        expire_stock_reservations,
+        float(os.environ.get("RESERVATION_EXPIRE_INTERVAL_SECONDS", "10")),
+    ),
+    (
+        "maintain_sell_partitions",
+        maintain_sell_partitions,
+        float(os.environ.get("SELL_PARTITIONS_INTERVAL_SECONDS", "3600")),
+    ),
+    (
+        "compact_deleted_products",
+        compact_deleted_products,
+        float(os.environ.get("PRODUCT_COMPACT_INTERVAL_SECONDS", "3600")),
+    ),
+    (
+        # Off by default, the archive needs a persistent directory
+        "archive_old_sells",
+        archive_old_sells,
+        float(os.environ.get("SELL_ARCHIVE_INTERVAL_SECONDS", "0")),
+    ),
+    (
+        # Off by default, each worker then enforces the rate limits alone
+        "sync_rate_limits",
+        sync_rate_limits,
+        float(os.environ.get("RATE_LIMIT_SYNC_INTERVAL_SECONDS", "0")),
+    ),
+]
+
+
+# Run by one worker at a time, see the module
+SINGLE_WORKER_JOBS = {"rebalance_stock_shards", "expire_stock_reservations"}
+
+
+def job_lock_id(name: str) -> int:
+    return zlib.crc32(f"periodic_job:{name}".encode())
+
+
+def run_job(job: Callable[[Session], int], lock_name: str | None = None) -> int:
+    """
+    Runs `job` in a new session. With `lock_name`, the job runs on PostgreSQL
+    only if the advisory lock of that name is free, and 0 is returned
+    otherwise. The lock is held by the connection of the session, across the
+    transactions the job commits, and released when it returns.
+    """
+
+    if lock_name is None or engine.dialect.name != "postgresql":
+        with Session(engine) as session:
+            return job(session)
+
+    lock_id = job_lock_id(lock_name)
+
+    with engine.connect() as connection:
+        locked = connection.execute(
+            sa.text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}
+        ).scalar()
+        connection.commit()
+
+        if not locked:
+            return 0
+
+        try:
+            with Session(bind=connection) as session:
+                return job(session)
+        finally:
+            connection.execute(sa.text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+            connection.commit()
+
+
+async def run_periodically(name: str, job: Callable[[Session], int], interval: float):
+    #pylint: disable=broad-exception-caught
+
+    lock_name = name if name in SINGLE_WORKER_JOBS else None
+
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            affected = await asyncio.to_thread(run_job, job, lock_name)
+            if affected:
+                print(f"Job {name}: {affected} row(s) affected")
+        except Exception as ex:
+            print(f"Job {name} failed: {ex}")
+
+        stdout.flush()
+
+
+def start_periodic_jobs() -> list[asyncio.Task]:
+    """Schedules PERIODIC_JOBS on the running loop. Cancel the tasks to stop them."""
+
+    loop = asyncio.get_running_loop()
+
+    return [
+        loop.create_task(run_periodically(name, job, interval), name=name)
+        for name, job, interval in PERIODIC_JOBS
+        if interval > 0
+    ]
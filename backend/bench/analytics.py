@@ -0,0 +1,240 @@
+"""
+Benchmark of the sell analytics (app.db.analytics) over large sells tables.
+
+Two stages are timed:
+
+- fetch: loading the analysed columns of `--rows` sells with fetch_columns
+  (COPY to CSV parsed into NumPy arrays) against loading `--orm-rows` of them
+  as ORM objects turned into BaseSell models, as GET /sells/ used to, reported
+  per row and extrapolated to `--rows`;
+- compute: each aggregate of the /sells/analytics routes over the fetched
+  arrays, against a dict based Python loop for the revenue per product and
+  day.
+
+The sells are inserted with generate_series for a new enterprise with
+`--users` users and `--products` products, spread over `--days` days, so
+point it at a scratch PostgreSQL database. The database variables must be
+set, as for the application itself. `--synthetic` skips the database and
+times the compute stage over random arrays.
+
+Usage:
+    python -m bench.analytics --rows 10000000
+    python -m bench.analytics --synthetic --rows 10000000
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import date
+import json
+import time
+import uuid
+
+import numpy as np
+import sqlalchemy as sa
+from sqlmodel import Session, col, create_engine, select
+
+from app.db.analytics import (
+    SellColumns,
+    daily_revenue,
+    day_number,
+    fetch_columns,
+    moving_average,
+    revenue_by_product_day,
+    revenue_percentiles,
+    top_sellers,
+)
+from app.db.conn import SQLALCHEMY_DATABASE_URL
+from app.db.migrate import migrate
+from app.models.enterprise import Enterprise
+from app.models.role import Role
+from app.models.scope import Scope
+from app.models.sell import BaseProduct, BaseSell, Client, Sell
+from app.models.user import User
+
+
+FIRST_DAY = date(2024, 1, 1)
+
+
+def seed(engine, rows: int, users: int, products: int, days: int) -> int:
+    suffix = uuid.uuid4().hex[:8]
+
+    with Session(engine) as session:
+        enterprise = Enterprise(
+            name=f"bench-{suffix}", accountable_email=f"bench-{suffix}@loadtest.com"
+        )
+        session.add(enterprise)
+        session.flush()
+
+        role = Role(name="Owner", hierarchy=1, enterprise_id=enterprise.id, description=None)
+        scope = Scope(name="All", enterprise_id=enterprise.id, description=None)
+        session.add_all([role, scope])
+        session.flush()
+
+        sellers = [
+            User(
+                username=f"bench-{suffix}-{index}",
+                email=f"bench-{suffix}-{index}@loadtest.com",
+                role_id=role.id,
+                scope_id=scope.id,
+                enterprise_id=enterprise.id,
+            )
+            for index in range(users)
+        ]
+        client = Client(name="bench", enterprise_id=enterprise.id)  # type: ignore
+        catalog = [
+            BaseProduct(
+                name=f"bench-{suffix}-{index}",
+                cost=1.0,
+                price=1.0 + index % 50,
+                enterprise_id=enterprise.id,
+            )
+            for index in range(products)
+        ]
+        session.add_all([*sellers, client, *catalog])
+        session.commit()
+
+        user_ids = [user.id for user in sellers]
+        product_ids = [product.id for product in catalog]
+        enterprise_id = enterprise.id
+        client_id = client.id
+
+    with engine.begin() as connection:
+        connection.execute(
+            sa.text(
+                "INSERT INTO sell (product_id, client_id, quantity, user_id, created_at, "
+                "enterprise_id) "
+                "SELECT (:product_ids)[1 + i % :products], :client_id, 1 + i % 5, "
+                "(:user_ids)[1 + (i * 7) % :users], "
+                ":first_day + (i % :days) * interval '1 day' + (i % 86400) * interval '1 second', "
+                ":enterprise_id "
+                "FROM generate_series(1, :rows) AS i"
+            ),
+            {
+                "product_ids": product_ids,
+                "products": products,
+                "client_id": client_id,
+                "enterprise_id": enterprise_id,
+                "user_ids": user_ids,
+                "users": users,
+                "first_day": FIRST_DAY,
+                "days": days,
+                "rows": rows,
+            },
+        )
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(sa.text("ANALYZE sell"))
+
+    assert enterprise_id is not None
+    return enterprise_id
+
+
+def timed(function, *args) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def synthetic_columns(rows: int, users: int, products: int, days: int) -> SellColumns:
+    generator = np.random.default_rng(0)
+    product_id = generator.integers(1, products + 1, rows)
+    quantity = generator.integers(1, 6, rows)
+
+    return SellColumns(
+        day=day_number(FIRST_DAY) + generator.integers(0, days, rows),
+        product_id=product_id,
+        user_id=generator.integers(1, users + 1, rows),
+        quantity=quantity,
+        revenue=quantity * (1.0 + product_id % 50),
+    )
+
+
+def python_revenue_by_product_day(sells: list[BaseSell], prices: dict[int, float]) -> int:
+    revenue: dict[tuple[int, date], float] = defaultdict(float)
+    for sell in sells:
+        assert sell.created_at is not None
+        key = (sell.product_id, sell.created_at.date())
+        revenue[key] += sell.quantity * prices[sell.product_id]
+
+    return len(revenue)
+
+
+def compute_stage(columns: SellColumns) -> dict[str, float]:
+    results = {}
+    results["revenue_by_product_day"], _ = timed(revenue_by_product_day, columns)
+
+    def moving_average_7():
+        _, revenue = daily_revenue(columns)
+        return moving_average(revenue, 7)
+
+    results["moving_average[7]"], _ = timed(moving_average_7)
+    results["top_sellers[10]"], _ = timed(top_sellers, columns, 10)
+    results["percentiles[50,90,99]"], _ = timed(revenue_percentiles, columns, [50, 90, 99])
+
+    return {name: round(seconds, 3) for name, seconds in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the sell analytics")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--orm-rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    report: dict[str, object] = {"rows": args.rows}
+
+    if args.synthetic:
+        columns = synthetic_columns(args.rows, args.users, args.products, args.days)
+        report["compute_seconds"] = compute_stage(columns)
+        print(json.dumps(report, indent=2))
+        return
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    migrate(engine)
+    report["seed_seconds"], enterprise_id = timed(
+        seed, engine, args.rows, args.users, args.products, args.days
+    )
+
+    with engine.connect() as connection:
+        fetch_seconds, columns = timed(fetch_columns, connection, enterprise_id)
+    assert isinstance(columns, SellColumns) and len(columns) == args.rows
+
+    with Session(engine) as session:
+        started = time.perf_counter()
+        sells = [
+            BaseSell(**sell.model_dump())
+            for sell in session.exec(
+                select(Sell)
+                .join(User, onclause=col(Sell.user_id) == col(User.id))
+                .where(col(User.enterprise_id) == enterprise_id)
+                .limit(args.orm_rows)
+            )
+        ]
+        orm_seconds = time.perf_counter() - started
+        prices = {
+            product.id: product.price
+            for product in session.exec(
+                select(BaseProduct).where(col(BaseProduct.enterprise_id) == enterprise_id)
+            )
+        }
+
+    python_seconds, _ = timed(python_revenue_by_product_day, sells, prices)
+    orm_rows = len(sells)
+
+    report["fetch"] = {
+        "columns_seconds": round(fetch_seconds, 3),
+        "columns_ns_per_row": round(fetch_seconds / args.rows * 1e9),
+        "orm_ns_per_row": round(orm_seconds / orm_rows * 1e9),
+        "orm_seconds_extrapolated": round(orm_seconds / orm_rows * args.rows, 1),
+    }
+    report["compute_seconds"] = compute_stage(columns)
+    report["python_revenue_by_product_day_seconds_extrapolated"] = round(
+        python_seconds / orm_rows * args.rows, 1
+    )
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
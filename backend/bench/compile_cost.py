@@ -0,0 +1,194 @@
+"""
+Python-side cost of the statements of each endpoint, built per request as
+the routes used to do against the constants of app.db.statements.
+
+For each endpoint statement, in nanoseconds per call (best of `--repeat`):
+
+- `<endpoint>.built.key`: building the select() and its cache key, what a
+  request paid before the compiled SQL could be found in the cache;
+- `<endpoint>.prebuilt.key`: the cache key of the constant, memoized;
+- `<endpoint>.compile`: compiling the SQL for PostgreSQL, what a miss of
+  the compiled cache costs (see DB_QUERY_CACHE_SIZE);
+- `<endpoint>.built.exec` and `<endpoint>.prebuilt.exec` with `--exec`:
+  running the statement through a Session on an empty in-memory SQLite
+  database, so the whole ORM execution path with the least database time.
+
+Usage:
+    python -m bench.compile_cost [--exec] [--filter sell] [--repeat 5]
+"""
+
+import argparse
+from collections.abc import Callable
+from datetime import datetime
+import timeit
+from typing import Any
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, col, create_engine, select
+
+from app.db import statements
+from app.models.reservation import StockReservation
+from app.models.sell import BaseProduct, Client, Sell
+from app.models.user import User
+
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 2, 1)
+
+# (endpoint, statement built as the route did, prebuilt statement, its params)
+Case = tuple[str, Callable[[], Any], Any, dict[str, Any]]
+
+
+def cases() -> list[Case]:
+    return [
+        (
+            "get_client",
+            lambda: select(Client)
+            .where(col(Client.id) == 1)
+            .where(col(Client.enterprise_id) == 1),
+            statements.CLIENT,
+            {"client_id": 1, "enterprise_id": 1},
+        ),
+        (
+            "query_clients",
+            lambda: select(*statements.CLIENT_COLUMNS)
+            .where(col(Client.enterprise_id) == 1)
+            .where(col(Client.name) == "name"),
+            statements.clients(True, False, False),
+            {"enterprise_id": 1, "name": "name"},
+        ),
+        (
+            "create_sell",
+            lambda: select(BaseProduct, User)
+            .where(col(BaseProduct.id) == 1)
+            .join(User, onclause=col(BaseProduct.created_by) == col(User.id)),
+            statements.PRODUCT_AND_CREATOR,
+            {"product_id": 1},
+        ),
+        (
+            "create_my_sell",
+            lambda: select(BaseProduct).where(col(BaseProduct.id) == 1),
+            statements.PRODUCT,
+            {"product_id": 1, "enterprise_id": 1},
+        ),
+        (
+            "update_product_stock_shards",
+            lambda: select(BaseProduct)
+            .where(col(BaseProduct.id) == 1)
+            .where(col(BaseProduct.enterprise_id) == 1)
+            .with_for_update(),
+            statements.PRODUCT_FOR_UPDATE,
+            {"product_id": 1, "enterprise_id": 1},
+        ),
+        (
+            "get_my_sells",
+            lambda: select(*statements.SELL_COLUMNS)
+            .where(col(Sell.user_id) == 1)
+            .order_by(col(Sell.id))
+            .where(col(Sell.created_at) >= START)
+            .where(col(Sell.created_at) < END),
+            statements.my_sells(True, True),
+            {"user_id": 1, "start_date": START, "end_date": END},
+        ),
+        (
+            "query_sells",
+            lambda: select(*statements.SELL_COLUMNS)
+            .where(col(Sell.enterprise_id) == 1)
+            .order_by(col(Sell.id))
+            .where(col(Sell.user_id).in_([1, 2])),  # pylint: disable=no-member
+            statements.enterprise_sells(False, False, True),
+            {"enterprise_id": 1, "user_ids": [1, 2]},
+        ),
+        (
+            "read_sell",
+            lambda: select(Sell)
+            .where(col(Sell.user_id) == 1)
+            .where(col(Sell.client_id) == 1)
+            .where(col(Sell.product_id) == 1)
+            .where(col(Sell.enterprise_id) == 1),
+            statements.SELL,
+            {"user_id": 1, "client_id": 1, "product_id": 1, "enterprise_id": 1},
+        ),
+        (
+            "delete_sell",
+            lambda: select(Sell, BaseProduct)
+            .where(col(Sell.user_id) == 1)
+            .where(col(Sell.client_id) == 1)
+            .where(col(Sell.product_id) == 1)
+            .where(col(Sell.enterprise_id) == 1)
+            .join(BaseProduct, onclause=col(Sell.product_id) == col(BaseProduct.id))
+            .with_for_update(of=Sell),
+            statements.SELL_AND_PRODUCT_FOR_UPDATE,
+            {"user_id": 1, "client_id": 1, "product_id": 1, "enterprise_id": 1},
+        ),
+        (
+            "confirm_reservation",
+            lambda: select(StockReservation)
+            .where(col(StockReservation.id) == 1)
+            .where(col(StockReservation.user_id) == 1)
+            .with_for_update(),
+            statements.RESERVATION_FOR_UPDATE,
+            {"reservation_id": 1, "user_id": 1},
+        ),
+    ]
+
+
+def best_ns(function: Callable[[], Any], repeat: int) -> float:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def measure(
+    selected: list[Case], repeat: int, execute: bool
+) -> dict[str, float]:
+    dialect = postgresql.psycopg2.dialect()  # type: ignore
+    results = {}
+
+    session = None
+    if execute:
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(engine)
+        session = Session(engine)
+
+    for name, build, prebuilt, params in selected:
+        # pylint: disable=protected-access,cell-var-from-loop
+        results[f"{name}.built.key"] = best_ns(lambda: build()._generate_cache_key(), repeat)
+        results[f"{name}.prebuilt.key"] = best_ns(lambda: prebuilt._generate_cache_key(), repeat)
+        results[f"{name}.compile"] = best_ns(lambda: prebuilt.compile(dialect=dialect), repeat)
+
+        if session is not None:
+            # SQLite has no FOR UPDATE, the statements only differ by it there
+            results[f"{name}.built.exec"] = best_ns(
+                lambda: session.exec(build()).all(), repeat
+            )
+            results[f"{name}.prebuilt.exec"] = best_ns(
+                lambda: session.exec(prebuilt, params=params).all(), repeat
+            )
+
+    if session is not None:
+        session.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--exec", action="store_true", dest="execute")
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    selected = [case for case in cases() if args.filter in case[0]]
+    results = measure(selected, args.repeat, args.execute)
+
+    width = max(map(len, results), default=0)
+    for name, value in results.items():
+        print(f"{name:<{width}}  {value:>14,.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+EXPLAIN comparison of the tenant checks on sells: through the user of each
+sell (joined to `user`, as the routes used to) against `sell.enterprise_id`
+and its (enterprise_id, created_at) index.
+
+`--rows` sells are inserted with generate_series for `--enterprises` new
+enterprises of `--users` users, `--clients` clients and `--products`
+products each, spread over `--days` days, so point it
+at a scratch PostgreSQL database. The database variables must be set, as for
+the application itself. For one sell of one of those enterprises, each
+statement runs twice under EXPLAIN (ANALYZE, BUFFERS), the second run with
+warm caches being reported, each in a transaction rolled back afterwards:
+
+- read_sell: GET /sells/{user_id}/{client_id}/{product_id};
+- delete_sell: the lookup of DELETE /sells/{user_id}/{client_id}/{product_id};
+- query_sells: GET /sells/ over the month of `--month-day`.
+
+Each is reported with its execution time and the shared buffers it hit or
+read, and with its whole plan under `--plans`.
+
+Usage:
+    python -m bench.explain_tenant --rows 2000000
+    python -m bench.explain_tenant --rows 2000000 --plans
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+import re
+import time
+import uuid
+
+import sqlalchemy as sa
+from sqlmodel import Session, and_, col, create_engine, select
+
+from app.db import statements
+from app.db.conn import SQLALCHEMY_DATABASE_URL
+from app.db.migrate import migrate
+from app.models.enterprise import Enterprise
+from app.models.role import Role
+from app.models.scope import Scope
+from app.models.sell import BaseProduct, Client, Sell
+from app.models.user import User
+
+
+FIRST_DAY = date(2024, 1, 1)
+
+
+def seed(
+    engine, rows: int, enterprises: int, users: int, clients: int, products: int, days: int
+) -> list[int]:
+    suffix = uuid.uuid4().hex[:8]
+    user_ids: list[int] = []
+    product_ids: list[int] = []
+    client_ids: list[int] = []
+    enterprise_ids: list[int] = []
+
+    with Session(engine) as session:
+        for number in range(enterprises):
+            name = f"tenant-{suffix}-{number}"
+            enterprise = Enterprise(name=name, accountable_email=f"{name}@loadtest.com")
+            session.add(enterprise)
+            session.flush()
+
+            role = Role(name="Owner", hierarchy=1, enterprise_id=enterprise.id, description=None)
+            scope = Scope(name="All", enterprise_id=enterprise.id, description=None)
+            session.add_all([role, scope])
+            session.flush()
+
+            sellers = [
+                User(
+                    username=f"{name}-{index}",
+                    email=f"{name}-{index}@loadtest.com",
+                    role_id=role.id,
+                    scope_id=scope.id,
+                    enterprise_id=enterprise.id,
+                )
+                for index in range(users)
+            ]
+            customers = [
+                Client(name=f"{name}-{index}", enterprise_id=enterprise.id)  # type: ignore
+                for index in range(clients)
+            ]
+            catalog = [
+                BaseProduct(name=f"{name}-{index}", cost=1.0, enterprise_id=enterprise.id)
+                for index in range(products)
+            ]
+            session.add_all([*sellers, *customers, *catalog])
+            session.flush()
+
+            enterprise_ids.append(enterprise.id)  # type: ignore
+            user_ids.extend(user.id for user in sellers)  # type: ignore
+            client_ids.extend(client.id for client in customers)  # type: ignore
+            product_ids.extend(product.id for product in catalog)  # type: ignore
+        session.commit()
+
+    # Sell i belongs to enterprise i % enterprises, n = i / enterprises picks
+    # its user, client and product among those of the enterprise
+    with engine.begin() as connection:
+        connection.execute(
+            sa.text(
+                "INSERT INTO sell (product_id, client_id, quantity, user_id, created_at, "
+                "enterprise_id) "
+                "SELECT (:product_ids)[1 + e * :products + (n * 13) % :products], "
+                "(:client_ids)[1 + e * :clients + n % :clients], 1, "
+                "(:user_ids)[1 + e * :users + (n * 7) % :users], "
+                ":first_day + (i % :days) * interval '1 day' + (i % 86400) * interval '1 second', "
+                "(:enterprise_ids)[1 + e] "
+                "FROM generate_series(1, :rows) AS i, "
+                "LATERAL (SELECT i % :enterprises AS e, i / :enterprises AS n) AS picks"
+            ),
+            {
+                "product_ids": product_ids,
+                "client_ids": client_ids,
+                "user_ids": user_ids,
+                "enterprise_ids": enterprise_ids,
+                "enterprises": enterprises,
+                "users": users,
+                "clients": clients,
+                "products": products,
+                "first_day": FIRST_DAY,
+                "days": days,
+                "rows": rows,
+            },
+        )
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(sa.text("ANALYZE sell"))
+
+    return enterprise_ids
+
+
+def joined_statements(sell: Sell, start: datetime, end: datetime) -> dict:
+    """The statements as they were before sell.enterprise_id, bound to `sell`."""
+
+    enterprise_id = sell.enterprise_id
+    return {
+        "read_sell": select(Sell, col(User.enterprise_id))
+        .where(col(Sell.user_id) == sell.user_id)
+        .where(col(Sell.client_id) == sell.client_id)
+        .where(col(Sell.product_id) == sell.product_id)
+        .join(
+            User,
+            onclause=and_(col(User.id) == sell.user_id, col(User.enterprise_id) == enterprise_id),
+        ),
+        "delete_sell": select(Sell, BaseProduct)
+        .where(col(Sell.user_id) == sell.user_id)
+        .where(col(Sell.client_id) == sell.client_id)
+        .where(col(Sell.product_id) == sell.product_id)
+        .where(col(User.enterprise_id) == enterprise_id)
+        .join(BaseProduct, onclause=col(Sell.product_id) == col(BaseProduct.id))
+        .join(User, onclause=col(Sell.user_id) == col(User.id))
+        .with_for_update(of=Sell),
+        "query_sells": select(*statements.SELL_COLUMNS)
+        .join(User, onclause=col(Sell.user_id) == col(User.id))
+        .where(col(User.enterprise_id) == enterprise_id)
+        .where(col(Sell.created_at) >= start)
+        .where(col(Sell.created_at) < end)
+        .order_by(col(Sell.id)),
+    }
+
+
+def tenant_statements(sell: Sell, start: datetime, end: datetime) -> dict:
+    """The statements of app.db.statements, bound to `sell`."""
+
+    params = {
+        "user_id": sell.user_id,
+        "client_id": sell.client_id,
+        "product_id": sell.product_id,
+        "enterprise_id": sell.enterprise_id,
+        "start_date": start,
+        "end_date": end,
+    }
+    return {
+        "read_sell": statements.SELL.params(params),
+        "delete_sell": statements.SELL_AND_PRODUCT_FOR_UPDATE.params(params),
+        "query_sells": statements.enterprise_sells(True, True, False).params(params),
+    }
+
+
+def explain(connection: sa.Connection, statement) -> str:
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    for _ in range(2):
+        transaction = connection.begin()
+        try:
+            plan = "\n".join(
+                connection.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS) {compiled.string}", compiled.params
+                ).scalars()
+            )
+        finally:
+            transaction.rollback()
+
+    return plan
+
+
+def summary(plan: str) -> str:
+    # The first Buffers line is the one of the top node, which includes the others
+    execution = re.search(r"Execution Time: ([\d.]+) ms", plan)
+    buffers = re.search(r"Buffers: shared(?: hit=(\d+))?(?: read=(\d+))?", plan)
+    hit, read = buffers.groups(default="0") if buffers else ("0", "0")
+
+    return f"{float(execution.group(1)) if execution else 0:>10.3f} ms  hit={hit} read={read}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN of the sell tenant checks")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--enterprises", type=int, default=20)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--month-day", type=int, default=180)
+    parser.add_argument("--plans", action="store_true", help="print the full plans")
+    args = parser.parse_args()
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    migrate(engine)
+    started = time.perf_counter()
+    enterprise_ids = seed(
+        engine, args.rows, args.enterprises, args.users, args.clients, args.products, args.days
+    )
+    print(f"Seeded {args.rows} sells in {time.perf_counter() - started:.1f}s")
+
+    month = FIRST_DAY + timedelta(days=args.month_day)
+    start = datetime(month.year, month.month, 1)
+    end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    with Session(engine) as session:
+        sell = session.exec(
+            select(Sell)
+            .where(col(Sell.enterprise_id) == enterprise_ids[len(enterprise_ids) // 2])
+            .order_by(col(Sell.id))
+            .limit(1)
+        ).one()
+        session.expunge(sell)
+
+    with engine.connect() as connection:
+        for kind, built in (
+            ("joined", joined_statements(sell, start, end)),
+            ("enterprise_id", tenant_statements(sell, start, end)),
+        ):
+            for name, statement in built.items():
+                plan = explain(connection, statement)
+                if args.plans:
+                    print(f"\n-- {name} ({kind})\n{plan}")
+                print(f"{name:<12} {kind:<14} {summary(plan)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+Load generator for the Sells API with a weighted mix of real endpoints.
+
+It seeds `--enterprises` enterprises, each with `--users` users, `--clients`
+clients and `--products` products, mints an RS256 access token for every user
+and runs `--concurrency` virtual users for `--duration` seconds, each picking
+an operation from `--mix` and a random user of the seeded set:
+
+    post_sell_me  POST /sells/me with a random client and product
+    get_sells_me  GET  /sells/me
+    get_sells     GET  /sells/
+    get_clients   GET  /sells/client
+
+Latency percentiles, requests per second and error rate (any status >= 400 or
+transport error) are printed as JSON, per operation and overall, so two runs
+can be compared with `bench.loadgen --compare old.json new.json`.
+
+Targets:
+- in process (default): the app is served through httpx.ASGITransport. With
+  `--database-url sqlite:///bench.db` SQLite stands in for PostgreSQL; without
+  it the database variables of the application are used. The rate limits and
+  the admission control of the app are off unless `--limits` is given: a few
+  seeded users sending requests back to back exhaust their buckets, and the
+  run would measure 429 answers instead of the endpoints.
+- `--target http://host:port`: a running server. Seeding writes directly to
+  `--database-url` (default: the application database), which must be the
+  database of that server; run it with RATE_LIMIT_ENABLED=0 and
+  ADMISSION_ENABLED=0 for the same reason.
+
+Tokens are signed with JWT_SECRET_ENCODE_KEY, or with the private test key of
+the test suite when it is not set; the server must accept them
+(JWT_SECRET_DECODE_KEY, JWT_ALGORITHM=RS256).
+
+Usage:
+    python -m bench.loadgen --database-url sqlite:///bench.db --duration 20
+    python -m bench.loadgen --target http://127.0.0.1:8000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import time
+import uuid
+
+import httpx
+import jwt
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, create_engine
+
+from app.db.conn import SQLALCHEMY_DATABASE_URL
+from app.db.migrate import migrate
+from app.models.enterprise import Enterprise, EnterpriseRelation
+from app.models.role import Role, RoleRelation
+from app.models.scope import Scope, ScopeRelation
+from app.models.sell import BaseProduct, Client
+from app.models.user import User, UserRead
+
+
+DEFAULT_MIX = "post_sell_me=4,get_sells_me=3,get_sells=2,get_clients=1"
+
+
+@dataclass
+class VirtualUser:
+    token: str
+    client_ids: list[int]
+    product_ids: list[int]
+
+
+def signing_key() -> str:
+    key = os.environ.get("JWT_SECRET_ENCODE_KEY")
+
+    if key:
+        return key
+
+    # pylint: disable=import-outside-toplevel
+    from tests.token_endpoint_test import TEST_KEY
+
+    return TEST_KEY
+
+
+def mint_token(user: UserRead, key: str, expires_minutes: int = 120) -> str:
+    now = datetime.now()
+
+    return jwt.encode(
+        {
+            "exp": (now + timedelta(minutes=expires_minutes)).timestamp(),
+            "iat": now,
+            "iss": "openferp.org",
+            "sub": user.model_dump_json(),
+        },
+        key,
+        "RS256",
+    )
+
+
+def build_engine(database_url: str) -> Engine:
+    if database_url.startswith("sqlite"):
+        return create_engine(
+            database_url, connect_args={"check_same_thread": False, "timeout": 30}
+        )
+
+    return create_engine(database_url, pool_size=20, max_overflow=20, pool_pre_ping=True)
+
+
+def seed(engine: Engine, args) -> list[VirtualUser]:
+    """Creates the enterprises, users, clients and products of the run."""
+
+    key = signing_key()
+    suffix = uuid.uuid4().hex[:8]
+    virtual_users: list[VirtualUser] = []
+
+    with Session(engine) as session:
+        for e in range(args.enterprises):
+            name = f"load-{suffix}-{e}"
+            enterprise = Enterprise(name=name, accountable_email=f"{name}@loadtest.com")
+            session.add(enterprise)
+            session.flush()
+
+            role = Role(
+                name="Owner", hierarchy=1, enterprise_id=enterprise.id, description=None
+            )
+            scope = Scope(name="All", enterprise_id=enterprise.id, description=None)
+            session.add(role)
+            session.add(scope)
+            session.flush()
+
+            users = [
+                User(
+                    username=f"{name}-{u}",
+                    email=f"{name}-{u}@loadtest.com",
+                    role_id=role.id,
+                    scope_id=scope.id,
+                    enterprise_id=enterprise.id,
+                )
+                for u in range(args.users)
+            ]
+            session.add_all(users)
+            session.flush()
+
+            clients = [
+                Client(
+                    name=f"client-{c}",
+                    description=f"Load test client {c}",
+                    enterprise_id=enterprise.id,  # type: ignore
+                )
+                for c in range(args.clients)
+            ]
+            products = [
+                BaseProduct(
+                    name=f"product-{p}",
+                    cost=1.0,
+                    price=2.0,
+                    stock=args.stock,
+                    enterprise_id=enterprise.id,
+                    created_by=users[0].id,
+                    last_updated_by=None,
+                )
+                for p in range(args.products)
+            ]
+            session.add_all(clients + products)
+            session.flush()
+
+            client_ids = [c.id for c in clients]
+            product_ids = [p.id for p in products]
+
+            for user in users:
+                user_read = UserRead(
+                    **user.model_dump(),
+                    role=RoleRelation(id=role.id, name=role.name, hierarchy=role.hierarchy),
+                    scope=ScopeRelation(id=scope.id, name=scope.name),
+                    enterprise=EnterpriseRelation(
+                        id=enterprise.id,
+                        name=enterprise.name,
+                        accountable_email=enterprise.accountable_email,
+                    ),
+                )
+                virtual_users.append(
+                    VirtualUser(mint_token(user_read, key), client_ids, product_ids)  # type: ignore
+                )
+
+        session.commit()
+
+    return virtual_users
+
+
+def request_for(operation: str, user: VirtualUser) -> tuple[str, str, dict | None]:
+    if operation == "post_sell_me":
+        return "POST", "/sells/me", {
+            "client_id": random.choice(user.client_ids),
+            "product_id": random.choice(user.product_ids),
+            "quantity": 1,
+        }
+    if operation == "get_sells_me":
+        return "GET", "/sells/me", None
+    if operation == "get_sells":
+        return "GET", "/sells/", None
+    if operation == "get_clients":
+        return "GET", "/sells/client", None
+
+    raise ValueError(f"Unknown operation {operation}")
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        request_for(name.strip(), VirtualUser("", [0], [0]))
+        weights[name.strip()] = float(weight)
+
+    return weights
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+
+    if not ordered:
+        return 0.0
+
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "rps": round(count / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+async def run_load(
+    client: httpx.AsyncClient, users: list[VirtualUser], weights: dict[str, float], args
+) -> dict:
+    operations = list(weights)
+    cumulative = list(weights.values())
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    status_codes: dict[int, int] = defaultdict(int)
+
+    async def virtual_user(deadline: float, record: bool):
+        while time.perf_counter() < deadline:
+            operation = random.choices(operations, cumulative)[0]
+            user = random.choice(users)
+            method, path, body = request_for(operation, user)
+
+            start = time.perf_counter()
+            try:
+                response = await client.request(
+                    method,
+                    path,
+                    json=body,
+                    headers={"Authorization": f"Bearer {user.token}"},
+                )
+                failed = response.status_code >= 400
+                code = response.status_code
+            except httpx.HTTPError:
+                failed = True
+                code = 0
+
+            if record:
+                latencies[operation].append(time.perf_counter() - start)
+                errors[operation] += failed
+                status_codes[code] += 1
+
+    if args.warmup > 0:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(virtual_user(deadline, False) for _ in range(args.concurrency)))
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(virtual_user(deadline, True) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    every = [x for values in latencies.values() for x in values]
+
+    return {
+        "overall": summarize(every, sum(errors.values()), elapsed),
+        "operations": {
+            name: summarize(latencies[name], errors[name], elapsed) for name in operations
+        },
+        "status_codes": {str(k): v for k, v in sorted(status_codes.items())},
+    }
+
+
+async def main_async(args) -> dict:
+    database_url = args.database_url or SQLALCHEMY_DATABASE_URL
+    engine = build_engine(database_url)
+    migrate(engine)
+    users = seed(engine, args)
+    weights = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    if args.target:
+        async with httpx.AsyncClient(
+            base_url=args.target, limits=limits, timeout=args.timeout
+        ) as client:
+            report = await run_load(client, users, weights, args)
+    else:
+        # pylint: disable=import-outside-toplevel
+        from app.db.conn import get_db, unit_of_work
+        from app.main import app
+        from app.middlewares import admission, rate_limit
+
+        # The unit of work of get_db, on the engine of the run
+        def get_bench_db():
+            yield from unit_of_work(engine)
+
+        app.dependency_overrides[get_db] = get_bench_db
+        # Unhandled errors are counted as 500s instead of stopping the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)  # type: ignore
+
+        # Read on every request, so they can be set after the import of the app
+        enabled = (rate_limit.RATE_LIMIT_ENABLED, admission.ADMISSION_ENABLED)
+        rate_limit.RATE_LIMIT_ENABLED = enabled[0] and args.limits
+        admission.ADMISSION_ENABLED = enabled[1] and args.limits
+        try:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=args.timeout
+            ) as client:
+                report = await run_load(client, users, weights, args)
+        finally:
+            rate_limit.RATE_LIMIT_ENABLED, admission.ADMISSION_ENABLED = enabled
+
+    return {
+        "target": args.target or f"in-process ({engine.dialect.name})",
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "enterprises": args.enterprises,
+            "users": args.users,
+            "mix": weights,
+        },
+        **report,
+    }
+
+
+def compare(old_path: str, new_path: str) -> dict:
+    """Relative change of the overall and per-operation numbers of two reports."""
+
+    with open(old_path, encoding="utf-8") as old_file, open(new_path, encoding="utf-8") as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+
+    def delta(before: dict, after: dict) -> dict:
+        return {
+            metric: round((after[metric] - before[metric]) / before[metric] * 100, 1)
+            for metric in ("rps", "p50_ms", "p95_ms", "p99_ms")
+            if before.get(metric)
+        } | {"error_rate": round(after["error_rate"] - before["error_rate"], 4)}
+
+    return {
+        "overall_change_pct": delta(old["overall"], new["overall"]),
+        "operations_change_pct": {
+            name: delta(old["operations"][name], values)
+            for name, values in new["operations"].items()
+            if name in old["operations"]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the Sells API")
+    parser.add_argument("--target", help="base URL of a running server")
+    parser.add_argument("--database-url", help="database to seed (and serve in process)")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--enterprises", type=int, default=2)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--stock", type=int, default=1_000_000)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument(
+        "--limits",
+        action="store_true",
+        help="keep the rate limits and admission control on (in process)",
+    )
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+        return
+
+    report = asyncio.run(main_async(args))
+    output = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
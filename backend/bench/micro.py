@@ -0,0 +1,327 @@
+"""
+Micro-benchmarks of the functions on the request and message hot paths.
+
+Each case is timed with `timeit` (autoranged, best of `--repeat` runs) and
+reported in nanoseconds per call:
+
+- auth: decode_jwt_token, authenticate_user, authorize_user
+- messages: UpdateEvent.create_from_message
+- messages.mix[1000]: selecting the Sells events of a 1000 message mix where
+  90% are for other scopes or event types, by full parse (`parse`), by the
+  pre-filter on the raw body (`prefilter_body`) and on AMQP headers
+  (`prefilter_headers`)
+- models: UserRead(**payload)
+- responses: building and dumping SellDetailResponse and
+  UserSellsListResponse with 1, 100 and 10k sells
+- responses.sells[10000]: GET /sells/me with 10k sells, through the
+  response_model validation FastAPI runs on returned models (`validated`)
+  against the json_response built from column rows (`direct`)
+
+Results can be saved as a baseline and later runs compared against it; the
+comparison exits with status 1 when a case is slower than the baseline by
+more than `--threshold` (relative, default 0.15).
+
+Prints from the measured functions are discarded while timing. JWT_ALGORITHM
+must be RS256 with the test keys, as for the test suite.
+
+Usage:
+    python -m bench.micro --save bench/baseline.json
+    python -m bench.micro --compare bench/baseline.json [--threshold 0.15]
+    python -m bench.micro --filter responses
+"""
+
+import argparse
+import asyncio
+from collections.abc import Callable
+import contextlib
+from datetime import datetime, timezone
+import io
+import json
+import platform
+import sys
+import timeit
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.auth.jwt_utils import decode_jwt_token
+from app.messages.event import UpdateEvent
+from app.messages.routing import is_sells_event, routing_headers
+from app.middlewares.auth import authenticate_user, authorize_user
+from app.models.role import DefaultRole
+from app.models.scope import DefaultScope
+from app.models.sell import (
+    BaseSell,
+    SellDetailResponse,
+    SellsResponse,
+    UserSells,
+    UserSellsListResponse,
+)
+from app.models.user import UserRead
+from app.responses import DefaultJSONResponse, json_response
+from bench.loadgen import mint_token, signing_key
+
+
+SIZES = (1, 100, 10_000)
+SELLS_PER_USER = 100
+MIX_SIZE = 1000
+
+Case = tuple[str, Callable[[], Any]]
+
+
+def user_payload() -> dict[str, Any]:
+    return {
+        "id": 1,
+        "username": "bench",
+        "email": "bench@loadtest.com",
+        "full_name": "Bench User",
+        "is_active": True,
+        "created_at": "2024-01-01T00:00:00",
+        "enterprise_id": 1,
+        "role": {"id": 1, "name": DefaultRole.MANAGER.value, "hierarchy": 2},
+        "scope": {"id": 1, "name": DefaultScope.SELLS.value},
+        "enterprise": {"id": 1, "name": "bench", "accountable_email": "bench@loadtest.com"},
+    }
+
+
+def message_mix(count: int) -> list[tuple[dict[str, str], bytes]]:
+    """(headers, body) of RH events, one in ten a user event for Sells."""
+
+    payload = user_payload()
+    kinds = [
+        ("USER_UPDATED", DefaultScope.SELLS.value, DefaultScope.SELLS.value),
+        ("USER_UPDATED", DefaultScope.ALL.value, "PT"),
+        ("USER_UPDATED", "PT", "PT"),
+        ("USER_CREATED", "PT", None),
+        ("USER_LOGIN", DefaultScope.ALL.value, None),
+        ("USER_LOGIN", DefaultScope.ALL.value, None),
+        ("USER_LOGIN", DefaultScope.ALL.value, None),
+        ("USER_LOGIN", DefaultScope.ALL.value, None),
+        ("ENTERPRISE_UPDATED", "PT", None),
+        ("ENTERPRISE_UPDATED", DefaultScope.ALL.value, None),
+    ]
+
+    mix = []
+    for i in range(count):
+        event, event_scope, update_scope = kinds[i % len(kinds)]
+        body = {
+            "event": event,
+            "event_scope": event_scope,
+            "update_scope": update_scope,
+            "data": {"id": i, "enterprise_id": 1, "username": f"user-{i}"},
+            "user": payload,
+            "start_date": "2024-01-01T00:00:00",
+            "origin": "rh",
+        }
+        mix.append((routing_headers(body), json.dumps(body).encode()))
+
+    return mix
+
+
+def parse_mix(mix: list[tuple[dict[str, str], bytes]]) -> list[UpdateEvent]:
+    events = []
+    for _, body in mix:
+        event = UpdateEvent.create_from_message(body.decode())
+        if event is not None and event._check_valid_user_event():  # pylint: disable=protected-access
+            events.append(event)
+
+    return events
+
+
+def prefilter_mix(mix: list[tuple[dict[str, str], bytes]], headers: bool) -> list[UpdateEvent]:
+    return parse_mix(
+        [message for message in mix if is_sells_event(message[0] if headers else None, message[1])]
+    )
+
+
+def sell_rows(count: int) -> list[dict[str, Any]]:
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return [
+        {
+            "id": i,
+            "product_id": i % 50 + 1,
+            "client_id": i % 20 + 1,
+            "quantity": i % 7 + 1,
+            "user_id": i // SELLS_PER_USER + 1,
+            "created_at": created_at,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def user_sells_list(rows: list[dict[str, Any]]) -> UserSellsListResponse:
+    by_user: dict[int, list[BaseSell]] = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(BaseSell(**row))
+
+    return UserSellsListResponse(
+        data=[
+            UserSells(id=user_id, username=f"user-{user_id}", sells=sells)
+            for user_id, sells in by_user.items()
+        ]
+    )
+
+
+def validated_sells_response(rows: list[dict[str, Any]], field) -> bytes:
+    """The former GET /sells/me: models built per row, then revalidated by FastAPI."""
+
+    response = SellsResponse(data=[BaseSell(**row) for row in rows])
+    content = asyncio.run(serialize_response(field=field, response_content=response))
+    return JSONResponse(content).body
+
+
+def build_cases() -> list[Case]:
+    payload = user_payload()
+    user = UserRead(**payload)
+    token = mint_token(user, signing_key())
+    message = json.dumps(
+        {
+            "event": "USER_UPDATED",
+            "event_scope": DefaultScope.SELLS.value,
+            "update_scope": DefaultScope.SELLS.value,
+            "data": {"id": 1, "enterprise_id": 1, "username": "bench"},
+            "user": payload,
+            "start_date": "2024-01-01T00:00:00",
+            "origin": "rh_service",
+        }
+    )
+    scopes = [DefaultScope.ALL.value, DefaultScope.SELLS.value]
+    hierarchy = DefaultRole.get_default_hierarchy(DefaultRole.MANAGER)
+
+    cases: list[Case] = [
+        ("auth.decode_jwt_token", lambda: decode_jwt_token(token)),
+        ("auth.authenticate_user", lambda: authenticate_user(token)),
+        (
+            "auth.authorize_user",
+            lambda: authorize_user(
+                user, operation_scopes=scopes, operation_hierarchy_order=hierarchy
+            ),
+        ),
+        ("messages.create_from_message", lambda: UpdateEvent.create_from_message(message)),
+        ("models.user_read", lambda: UserRead(**payload)),
+    ]
+
+    mix = message_mix(MIX_SIZE)
+    cases += [
+        (f"messages.mix[{MIX_SIZE}].parse", lambda: parse_mix(mix)),
+        (f"messages.mix[{MIX_SIZE}].prefilter_body", lambda: prefilter_mix(mix, headers=False)),
+        (f"messages.mix[{MIX_SIZE}].prefilter_headers", lambda: prefilter_mix(mix, headers=True)),
+    ]
+
+    detail = SellDetailResponse(data=BaseSell(**sell_rows(1)[0]))
+    row = sell_rows(1)[0]
+    cases += [
+        ("responses.sell_detail.build", lambda: SellDetailResponse(data=BaseSell(**row))),
+        ("responses.sell_detail.dump", detail.model_dump_json),
+    ]
+
+    for size in SIZES:
+        rows = sell_rows(size)
+        response = user_sells_list(rows)
+        cases += [
+            (f"responses.user_sells_list[{size}].build", lambda rows=rows: user_sells_list(rows)),
+            (f"responses.user_sells_list[{size}].dump", response.model_dump_json),
+        ]
+
+    naive_rows = [
+        {**row, "created_at": row["created_at"].replace(tzinfo=None)}
+        for row in sell_rows(10_000)
+    ]
+    field = create_response_field(name="Response", type_=SellsResponse, mode="serialization")
+    cases += [
+        (
+            "responses.sells[10000].validated",
+            lambda: validated_sells_response(naive_rows, field),
+        ),
+        (
+            "responses.sells[10000].direct",
+            lambda: json_response({"data": naive_rows}).body,
+        ),
+        (
+            f"responses.sells[10000].{DefaultJSONResponse.__name__}",
+            lambda: DefaultJSONResponse({"data": naive_rows}).body,
+        ),
+    ]
+
+    return cases
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    """Best time per call in nanoseconds."""
+
+    timer = timeit.Timer(func)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number))
+
+    return best / number * 1e9
+
+
+def run(name_filter: str | None, repeat: int) -> dict[str, float]:
+    return {
+        name: round(measure(func, repeat), 1)
+        for name, func in build_cases()
+        if name_filter is None or name_filter in name
+    }
+
+
+def compare(baseline: dict[str, float], current: dict[str, float], threshold: float) -> dict:
+    cases = {}
+
+    for name, ns in current.items():
+        before = baseline.get(name)
+        if before is None:
+            cases[name] = {"ns": ns, "baseline_ns": None, "change": None, "regression": False}
+            continue
+
+        change = (ns - before) / before
+        cases[name] = {
+            "ns": ns,
+            "baseline_ns": before,
+            "change": round(change, 3),
+            "regression": change > threshold,
+        }
+
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of hot functions")
+    parser.add_argument("--filter", help="only run cases containing this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    report: dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results_ns": results,
+    }
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results_ns"]
+
+        cases = compare(baseline, results, args.threshold)
+        regressions = sorted(name for name, case in cases.items() if case["regression"])
+        report = {"threshold": args.threshold, "cases": cases, "regressions": regressions}
+        print(json.dumps(report, indent=2))
+        sys.exit(1 if regressions else 0)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Stand-in for the RH user snapshot, for app.db.resync.
+
+Generates `--users` users of an enterprise as NDJSON, in the UserRead shape
+of the RH events, either to a file or streamed over HTTP on every GET, so
+large snapshots never sit in memory. Users get ids from `--first-id` on and
+share one Collaborator role and one Sells scope, created by the resync under
+`--role-id` and `--scope-id` when missing; every `--changed-every`th user gets a
+different full name, to exercise updates against an earlier run.
+
+Usage:
+    python -m bench.rh_snapshot --enterprise-id 1 --users 1000000 --output users.ndjson
+    python -m bench.rh_snapshot --enterprise-id 1 --serve 8090
+"""
+
+import argparse
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+
+from app.models.role import DefaultRole
+from app.models.scope import DefaultScope
+
+
+def snapshot_lines(args: argparse.Namespace) -> Iterator[bytes]:
+    enterprise = {
+        "id": args.enterprise_id,
+        "name": f"enterprise-{args.enterprise_id}",
+        "accountable_email": f"owner{args.enterprise_id}@loadtest.com",
+    }
+    role = {"id": args.role_id, "name": DefaultRole.COLLABORATOR.value, "hierarchy": 3}
+    scope = {"id": args.scope_id, "name": DefaultScope.SELLS.value}
+
+    for user_id in range(args.first_id, args.first_id + args.users):
+        changed = args.changed_every and user_id % args.changed_every == 0
+        user = {
+            "id": user_id,
+            "username": f"rh-user-{user_id}",
+            "email": f"rh-user-{user_id}@loadtest.com",
+            "full_name": f"RH User {user_id}{' (changed)' if changed else ''}",
+            "is_active": True,
+            "created_at": "2024-01-01T00:00:00",
+            "enterprise_id": args.enterprise_id,
+            "role": role,
+            "scope": scope,
+            "enterprise": enterprise,
+        }
+        yield json.dumps(user).encode() + b"\n"
+
+
+def serve(args: argparse.Namespace):
+    class SnapshotHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for line in snapshot_lines(args):
+                self.wfile.write(line)
+
+    print(f"Serving the snapshot on http://localhost:{args.serve}/")
+    ThreadingHTTPServer(("", args.serve), SnapshotHandler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RH user snapshot stand-in")
+    parser.add_argument("--enterprise-id", type=int, required=True)
+    parser.add_argument("--role-id", type=int, default=1_000_000)
+    parser.add_argument("--scope-id", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--first-id", type=int, default=1_000_000)
+    parser.add_argument("--changed-every", type=int, default=0)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="write the snapshot to this file")
+    target.add_argument("--serve", type=int, metavar="PORT", help="serve the snapshot over HTTP")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    with open(args.output, "wb") as file:
+        file.writelines(snapshot_lines(args))
+
+
+if __name__ == "__main__":
+    main()
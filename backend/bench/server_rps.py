@@ -0,0 +1,123 @@
+"""
+Compares requests per second of the production entry point (app.server)
+against the legacy `uvicorn app.main:app --reload` launch command.
+
+Each command is started as a subprocess with the current environment (the
+database and JWT variables must be set, as for the application itself),
+warmed up, and then hammered on the liveness route with a fixed number of
+concurrent connections.
+
+Usage:
+    python -m bench.server_rps --duration 15 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+LEGACY_COMMAND = [
+    sys.executable, "-m", "uvicorn", "app.main:app",
+    "--host", "127.0.0.1", "--port", "{port}", "--reload", "--lifespan", "on",
+]
+PRODUCTION_COMMAND = [sys.executable, "-m", "app.server"]
+
+
+async def wait_ready(url: str, timeout: float) -> float:
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - start < timeout:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+
+    raise TimeoutError(f"Server at {url} did not become ready")
+
+
+async def hammer(url: str, duration: float, concurrency: int) -> dict:
+    done = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+
+        async def worker():
+            nonlocal done, errors
+            while time.perf_counter() < deadline:
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.TransportError:
+                    errors += 1
+                done += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {"requests": done, "errors": errors, "rps": round(done / elapsed, 1)}
+
+
+def run_command(name: str, command: list[str], args) -> dict:
+    port = args.port
+    env = {**os.environ, "SERVER_HOST": "127.0.0.1", "SERVER_PORT": str(port)}
+    url = f"http://127.0.0.1:{port}/check/"
+
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [part.format(port=port) for part in command],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    try:
+        ready = asyncio.run(wait_ready(url, args.startup_timeout))
+        asyncio.run(hammer(url, 1.0, args.concurrency))
+        result = asyncio.run(hammer(url, args.duration, args.concurrency))
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=60)
+
+    return {"command": name, "startup_seconds": round(ready, 3), **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    results = [
+        run_command("legacy", LEGACY_COMMAND, args),
+        run_command("production", PRODUCTION_COMMAND, args),
+    ]
+
+    legacy, production = results
+    print(
+        json.dumps(
+            {
+                "results": results,
+                "speedup": round(production["rps"] / max(legacy["rps"], 1e-9), 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
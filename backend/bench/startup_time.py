@@ -0,0 +1,157 @@
+"""
+Measures the cold start of the Sells API.
+
+Three numbers are reported as JSON:
+
+- import: `python -X importtime -c "import app.main"`, with the cumulative
+  import time of the heaviest top-level packages and of the broker/crypto
+  stacks that are candidates for lazy loading (pika, aio_pika, passlib).
+- first_request: a fresh interpreter importing app.main, running the lifespan
+  startup and answering GET /check/ in process.
+- server_ready: `python -m app.server` with a single worker, from process
+  spawn until GET /check/ answers 200.
+
+The database and JWT variables must be set, as for the application itself.
+
+Usage:
+    python -m bench.startup_time [--skip-server]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from bench.server_rps import wait_ready
+
+
+TRACKED_IMPORTS = ("pika", "aio_pika", "aiormq", "passlib", "bcrypt")
+
+
+FIRST_REQUEST_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+import httpx
+from app.main import app
+imported = time.perf_counter()
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/check/")
+        answered = time.perf_counter()
+        return response.status_code, started, answered
+
+status, started, answered = asyncio.run(first_request())
+print(json.dumps({
+    "status": status,
+    "import_seconds": round(imported - start, 4),
+    "lifespan_seconds": round(started - imported, 4),
+    "total_seconds": round(answered - start, 4),
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Returns the cumulative import time in microseconds of each module."""
+
+    cumulative: dict[str, int] = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative_us, name = line.split("|")
+        module = name.strip()
+        cumulative[module] = max(cumulative.get(module, 0), int(cumulative_us))
+
+    return cumulative
+
+
+def measure_imports(top: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = parse_importtime(result.stderr)
+    top_level = {k: v for k, v in cumulative.items() if "." not in k}
+
+    return {
+        "app_main_ms": round(cumulative.get("app.main", cumulative.get("app", 0)) / 1000, 1),
+        "tracked_ms": {
+            name: round(cumulative[name] / 1000, 1)
+            for name in TRACKED_IMPORTS
+            if name in cumulative
+        },
+        "heaviest_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(top_level.items(), key=lambda kv: -kv[1])[:top]
+        },
+    }
+
+
+def measure_first_request() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_server_ready(port: int, timeout: float) -> dict:
+    env = {
+        **os.environ,
+        "SERVER_HOST": "127.0.0.1",
+        "SERVER_PORT": str(port),
+        "WEB_CONCURRENCY": "1",
+    }
+    start = time.perf_counter()
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "app.server"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    try:
+        asyncio.run(wait_ready(f"http://127.0.0.1:{port}/check/", timeout))
+        ready = time.perf_counter() - start
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=60)
+
+    return {"seconds": round(ready, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--skip-server", action="store_true")
+    args = parser.parse_args()
+
+    report = {
+        "import": measure_imports(args.top),
+        "first_request": measure_first_request(),
+    }
+
+    if not args.skip_server:
+        report["server_ready"] = measure_server_ready(args.port, args.startup_timeout)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
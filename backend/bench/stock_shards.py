@@ -0,0 +1,193 @@
+"""
+Load test of hot-product mode: sales per second of a single product while
+scaling its number of stock shards.
+
+Each round resets the product stock, sets the shard count (0 keeps the stock in
+the product row) and runs `--workers` threads selling one unit at a time for
+`--duration` seconds, each sale in its own transaction as in `POST /sells/me`:
+read the product, take the stock, insert the sell, commit. `--hold-ms` keeps
+the transaction open after the stock is taken, standing in for the rest of the
+request (idempotency row, network round trips), which is what makes a single
+locked row the bottleneck.
+
+It needs PostgreSQL (SQLite has no row locks) and creates its own enterprise,
+user, client and product rows, so point it at a scratch database. The
+database variables must be set, as for the application itself.
+
+Usage:
+    python -m bench.stock_shards --shards 0,1,2,4,8,16 --workers 32 --hold-ms 5
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from sqlmodel import Session, create_engine, func, select
+
+from app.db.conn import SQLALCHEMY_DATABASE_URL
+from app.db.migrate import migrate
+from app.db.stock import get_total_stock, set_stock_shards, take_stock
+from app.models.enterprise import Enterprise
+from app.models.role import Role
+from app.models.scope import Scope
+from app.models.sell import BaseProduct, Client, Sell
+from app.models.user import User
+
+
+def seed(engine) -> dict[str, int]:
+    suffix = uuid.uuid4().hex[:8]
+
+    with Session(engine) as session:
+        enterprise = Enterprise(
+            name=f"bench-{suffix}", accountable_email=f"bench-{suffix}@loadtest.com"
+        )
+        session.add(enterprise)
+        session.flush()
+
+        role = Role(name="Owner", hierarchy=1, enterprise_id=enterprise.id, description=None)
+        scope = Scope(name="All", enterprise_id=enterprise.id, description=None)
+        session.add(role)
+        session.add(scope)
+        session.flush()
+
+        user = User(
+            username=f"bench-{suffix}",
+            email=f"bench-{suffix}@loadtest.com",
+            role_id=role.id,
+            scope_id=scope.id,
+            enterprise_id=enterprise.id,
+        )
+        session.add(user)
+        session.flush()
+
+        client = Client(name="bench", enterprise_id=enterprise.id)  # type: ignore
+        product = BaseProduct(
+            name=f"hot-{suffix}",
+            cost=1.0,
+            price=2.0,
+            enterprise_id=enterprise.id,
+            created_by=user.id,
+            last_updated_by=None,
+        )
+        session.add(client)
+        session.add(product)
+        session.commit()
+
+        return {
+            "user_id": user.id,
+            "client_id": client.id,
+            "product_id": product.id,
+            "enterprise_id": enterprise.id,
+        }  # type: ignore
+
+
+def reset_product(engine, product_id: int, stock: int, shards: int):
+    with Session(engine) as session:
+        product = session.exec(
+            select(BaseProduct).where(BaseProduct.id == product_id).with_for_update()
+        ).one()
+        set_stock_shards(session, product, 0)
+        product.stock = stock
+        set_stock_shards(session, product, shards)
+        session.commit()
+
+
+def sell_once(engine, ids: dict[str, int], hold: float) -> bool:
+    with Session(engine) as session:
+        product = session.exec(
+            select(BaseProduct).where(BaseProduct.id == ids["product_id"])
+        ).one()
+
+        if not take_stock(session, product, 1):
+            return False
+
+        if hold:
+            time.sleep(hold)
+
+        session.add(
+            Sell(
+                product_id=ids["product_id"],
+                client_id=ids["client_id"],
+                user_id=ids["user_id"],
+                enterprise_id=ids["enterprise_id"],
+                quantity=1,
+            )
+        )
+        session.commit()
+        return True
+
+
+def run_round(engine, ids: dict[str, int], shards: int, args) -> dict:
+    reset_product(engine, ids["product_id"], args.stock, shards)
+
+    with Session(engine) as session:
+        sells_before = session.exec(
+            select(func.count()).where(Sell.product_id == ids["product_id"])
+        ).one()
+
+    sold = [0] * args.workers
+    errors = [0] * args.workers
+    deadline = time.perf_counter() + args.duration
+
+    def worker(index: int):
+        #pylint: disable=broad-exception-caught
+        while time.perf_counter() < deadline:
+            try:
+                if sell_once(engine, ids, args.hold_ms / 1000):
+                    sold[index] += 1
+                else:
+                    errors[index] += 1
+            except Exception:
+                errors[index] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with Session(engine) as session:
+        product = session.get(BaseProduct, ids["product_id"])
+        remaining = get_total_stock(session, product)  # type: ignore
+        sells_after = session.exec(
+            select(func.count()).where(Sell.product_id == ids["product_id"])
+        ).one()
+
+    return {
+        "shards": shards,
+        "sales": sum(sold),
+        "errors": sum(errors),
+        "sales_per_second": round(sum(sold) / elapsed, 1),
+        "consistent": remaining == args.stock - sum(sold)
+        and sells_after - sells_before == sum(sold),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", default="0,1,2,4,8,16")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--hold-ms", type=float, default=5.0)
+    parser.add_argument("--stock", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=args.workers, max_overflow=0)
+
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("The stock shards load test needs PostgreSQL")
+
+    migrate(engine)
+    ids = seed(engine)
+
+    rounds = [run_round(engine, ids, int(n), args) for n in args.shards.split(",")]
+    report = {"workers": args.workers, "hold_ms": args.hold_ms, "rounds": rounds}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
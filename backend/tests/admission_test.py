@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+
+from app.metrics import counters
+from app.middlewares.admission import (
+    AdaptiveLimit,
+    AdmissionClass,
+    AdmissionController,
+    AdmissionMiddleware,
+    Shed,
+    route_class,
+)
+
+
+def fixed_classes() -> list[AdmissionClass]:
+    return [
+        AdmissionClass("write", 0, AdaptiveLimit(1, 1, 1)),
+        AdmissionClass("heavy", 2, AdaptiveLimit(1, 1, 1)),
+    ]
+
+
+def test_route_classes():
+    assert route_class("POST", "/sells/me") == "write"
+    assert route_class("GET", "/sells/me") == "read"
+    assert route_class("GET", "/sells/") == "heavy"
+    assert route_class("GET", "/sells/export") == "heavy"
+    assert route_class("POST", "/sells/delete") == "heavy"
+    assert route_class("GET", "/check/metrics") is None
+
+
+def test_adaptive_limit():
+    limit = AdaptiveLimit(10, 2, 12)
+
+    # Fully used and fast: one more slot per round of 10 requests
+    for _ in range(11):
+        limit.update(0.1, 9, now=0)
+    assert limit.capacity == 11
+
+    # Not fully used: unchanged
+    limit.update(0.1, 2, now=0)
+    assert limit.capacity == 11
+
+    # Slow: decreased once per usual latency
+    limit.update(1.0, 10, now=1)
+    limit.update(1.0, 10, now=1.01)
+    assert limit.capacity == 9
+    limit.update(1.0, 10, now=2)
+    assert limit.capacity == 8
+
+    for second in range(3, 50):
+        limit.update(1.0, 0, now=second)
+    assert limit.capacity == limit.minimum
+
+
+def test_priority_queue_and_shedding():
+    counters.clear()
+
+    async def scenario():
+        controller = AdmissionController(
+            fixed_classes(), max_concurrency=1, queue_size=1, queue_timeout=0.05
+        )
+        await controller.acquire("heavy")
+
+        heavy = asyncio.create_task(controller.acquire("heavy"))
+        await asyncio.sleep(0)
+        write = asyncio.create_task(controller.acquire("write"))
+        await asyncio.sleep(0)
+
+        # The write took the place of the queued heavy read
+        with pytest.raises(Shed, match="evicted"):
+            await heavy
+        with pytest.raises(Shed, match="queue_full"):
+            await controller.acquire("heavy")
+
+        controller.release("heavy", 0.01)
+        await write
+        assert controller.classes["write"].in_flight == 1
+
+        with pytest.raises(Shed, match="timeout"):
+            await controller.acquire("heavy")
+
+        controller.release("write", 0.01)
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+    assert counters.get("admission.heavy.shed_evicted") == 1
+    assert counters.get("admission.heavy.shed_queue_full") == 1
+    assert counters.get("admission.heavy.shed_timeout") == 1
+
+
+def test_middleware_sheds_with_retry_after():
+    app = FastAPI()
+
+    @app.get("/sells/")
+    def query_sells():
+        return {"data": []}
+
+    @app.get("/check/")
+    def liveness():
+        return {"message": "Success"}
+
+    controller = AdmissionController(fixed_classes(), max_concurrency=0, queue_size=0)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    test_client = TestClient(app)
+
+    response = test_client.get("/sells/")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "1"
+
+    assert test_client.get("/check/").status_code == status.HTTP_200_OK
+
+    controller.max_concurrency = 1
+    assert test_client.get("/sells/").status_code == status.HTTP_200_OK
+    assert controller.in_flight == 0
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Any
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from app.db.analytics import (
+    SellColumns,
+    daily_revenue,
+    fetch_columns,
+    moving_average,
+    revenue_percentiles,
+    top_sellers,
+)
+from app.models.sell import BaseProduct, Client, Sell
+from tests.message_receive_test import setup_db, setup_db_defaults  # pylint: disable=unused-import
+
+
+np = pytest.importorskip("numpy")
+
+
+def columns(rows: list[tuple[int, int, int, int, float]]) -> SellColumns:
+    table = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return SellColumns(
+        day=table[:, 0].astype(np.int64),
+        product_id=table[:, 1].astype(np.int64),
+        user_id=table[:, 2].astype(np.int64),
+        quantity=table[:, 3].astype(np.int64),
+        revenue=table[:, 4],
+    )
+
+
+def test_vectorized_aggregates():
+    # day, product, user, quantity, revenue
+    sells = columns(
+        [(0, 1, 10, 1, 5.0), (0, 2, 11, 2, 21.0), (2, 1, 10, 3, 15.0), (3, 1, 12, 1, 40.0)]
+    )
+
+    first_day, revenue = daily_revenue(sells)
+    assert first_day == 0
+    assert revenue.tolist() == [26.0, 0.0, 15.0, 40.0]
+
+    averages = moving_average(revenue, 2)
+    assert np.isnan(averages[0])
+    assert averages[1:].tolist() == [13.0, 7.5, 27.5]
+
+    assert [seller["user_id"] for seller in top_sellers(sells, 2)] == [12, 11]
+    assert top_sellers(sells, 5)[2] == {"user_id": 10, "sells": 2, "quantity": 4, "revenue": 20.0}
+
+    assert revenue_percentiles(sells, [0, 50, 100]) == {"p0": 5.0, "p50": 18.0, "p100": 40.0}
+    assert revenue_percentiles(columns([]), [50]) == {"p50": None}
+
+
+def test_analytics_routes(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    sells: list[Sell] = create_default_user["sells"]
+    prices = {
+        product.id: product.price if product.price is not None else product.cost
+        for product in create_default_user["products"]
+    }
+    expected: dict[tuple[int, str], float] = defaultdict(float)
+    for index, sell in enumerate(sells):
+        sell.quantity = index + 1
+        sell.created_at = datetime(2024, 5, 1 + index % 3, 12)
+        key = (sell.product_id, sell.created_at.date().isoformat())
+        expected[key] += sell.quantity * prices[sell.product_id]
+    db_session.commit()
+    total = sum(expected.values())
+    user_id = create_default_user["user"].id
+
+    test_client = test_client_authenticated_default
+    params = {"start_date": "2024-05-01T00:00:00", "end_date": "2024-05-05T00:00:00"}
+
+    response = test_client.get("/sells/analytics/revenue", params=params)
+    assert response.status_code == status.HTTP_200_OK
+    assert {
+        (row["product_id"], row["day"]): row["revenue"] for row in response.json()["data"]
+    } == pytest.approx(expected)
+
+    response = test_client.get("/sells/analytics/moving-average", params={**params, "window": 4})
+    assert response.status_code == status.HTTP_200_OK
+    days = response.json()["data"]
+    assert [day["day"] for day in days] == ["2024-05-01", "2024-05-02", "2024-05-03", "2024-05-04"]
+    assert days[2]["moving_average"] is None
+    assert days[3]["moving_average"] == pytest.approx(total / 4)
+
+    response = test_client.get("/sells/analytics/top-sellers", params=params)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"] == [
+        {
+            "user_id": user_id,
+            "sells": len(sells),
+            "quantity": sum(range(1, len(sells) + 1)),
+            "revenue": pytest.approx(total),
+        }
+    ]
+
+    response = test_client.get("/sells/analytics/percentiles", params={**params, "q": "0,100"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["sells"] == len(sells)
+
+    response = test_client.get("/sells/analytics/percentiles", params={"q": "150"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_fetch_columns_without_copy(setup_db: Engine):
+    with Session(setup_db) as session:
+        user, enterprise = setup_db_defaults(session)
+        product = BaseProduct(name="Product", cost=2.0, price=3.0, enterprise_id=enterprise.id)
+        client = Client(name="Client", enterprise_id=enterprise.id)
+        session.add_all([product, client])
+        session.commit()
+        for day in (1, 2):
+            session.add(
+                Sell(
+                    product_id=product.id,
+                    client_id=client.id,
+                    quantity=day,
+                    user_id=user.id,
+                    enterprise_id=enterprise.id,
+                    created_at=datetime(1970, 1, 1 + day, 23, 59),
+                )
+            )
+        session.commit()
+
+        fetched = fetch_columns(session.connection(), enterprise.id, datetime(1970, 1, 3))
+
+    assert fetched.day.tolist() == [2]
+    assert fetched.revenue.tolist() == [6.0]
@@ -0,0 +1,96 @@
+import json
+import sys
+from datetime import datetime
+from typing import Any
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, select
+
+from app.db import archive
+from app.models.sell import Sell
+
+
+pytest.importorskip("pyarrow")
+
+
+def age_sells(db_session: Session, sells: list[Sell]) -> list[dict[str, Any]]:
+    """Moves every sell but the last one back to 2023, one month apart."""
+
+    for month, sell in enumerate(sells[:-1], start=1):
+        sell.created_at = datetime(2023, month, 15)
+    db_session.commit()
+
+    return [
+        {"id": sell.id, "user_id": sell.user_id, "created_at": sell.created_at}
+        for sell in sells
+    ]
+
+
+def test_archive_sells_and_read_back(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.setattr(archive, "SELL_ARCHIVE_DIR", str(tmp_path))
+    test_client = test_client_authenticated_default
+    sells = age_sells(db_session, create_default_user["sells"])
+    enterprise_id = create_default_user["user"].enterprise_id
+    user_id = create_default_user["user"].id
+    old_ids = [sell["id"] for sell in sells[:-1]]
+    assert old_ids
+
+    assert archive.archive_sells(db_session, datetime(2024, 1, 1), batch_rows=2) == len(old_ids)
+
+    assert db_session.exec(select(col(Sell.id)).where(col(Sell.id).in_(old_ids))).all() == []
+    assert (tmp_path / f"enterprise_id={enterprise_id}" / "2023-01").is_dir()
+
+    # Only the months of the range are read
+    february = archive.read_archived_sells(
+        enterprise_id, datetime(2023, 2, 1), datetime(2023, 3, 1), [user_id]
+    )
+    assert [sell["id"] for sell in february] == old_ids[1:2]
+
+    # Without a start date only the database is read
+    response = test_client.get("/sells/")
+    assert response.status_code == status.HTTP_200_OK
+    assert [sell["id"] for sell in response.json()["data"][0]["sells"]] == [sells[-1]["id"]]
+
+    response = test_client.get("/sells/", params={"start_date": "2023-01-01T00:00:00"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [sell["id"] for sell in response.json()["data"][0]["sells"]] == [
+        sell["id"] for sell in sells
+    ]
+
+    response = test_client.get("/sells/export", params={"start_date": "2023-01-01T00:00:00"})
+    assert response.status_code == status.HTTP_200_OK
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [sell["id"] for sell in exported] == [sell["id"] for sell in sells]
+    assert exported[0]["created_at"].startswith("2023-01-15T00:00:00")
+
+
+def test_archived_range_without_pyarrow(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.setattr(archive, "SELL_ARCHIVE_DIR", str(tmp_path))
+    age_sells(db_session, create_default_user["sells"])
+    archive.archive_sells(db_session, datetime(2024, 1, 1))
+
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    response = test_client_authenticated_default.get(
+        "/sells/", params={"start_date": "2023-01-01T00:00:00"}
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    # Ranges without archived files do not need pyarrow
+    response = test_client_authenticated_default.get(
+        "/sells/", params={"start_date": "2024-01-01T00:00:00"}
+    )
+    assert response.status_code == status.HTTP_200_OK
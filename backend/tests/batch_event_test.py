@@ -0,0 +1,223 @@
+import datetime
+import json
+from typing import Any
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from app.messages.event import UpdateEvent
+from app.models.enterprise import EnterpriseRelation
+from app.models.role import DefaultRole, RoleRelation
+from app.models.scope import DefaultScope, ScopeRelation
+from app.models.user import User, UserRead
+from app.router.utils import (
+    UserCreateEvent,
+    UserDeleteEvent,
+    UserDeleteWithId,
+    UserUpdateEvent,
+    UserUpdateWithId,
+)
+from tests.message_receive_test import gen_db, setup_db, setup_db_defaults  # pylint: disable=unused-import
+
+
+def user_read(user_id: int, enterprise_id: int, role_id: int, scope_id: int) -> UserRead:
+    return UserRead(
+        id=user_id,
+        username=f"batchuser{user_id}",
+        email=f"batchuser{user_id}@test.mail.com",
+        full_name=f"Batch User {user_id}",
+        role=RoleRelation(id=role_id, name=DefaultRole.OWNER.value, hierarchy=1),
+        scope=ScopeRelation(id=scope_id, name=DefaultScope.ALL.value),
+        enterprise=EnterpriseRelation(
+            id=enterprise_id,
+            name="TestEnterprise",
+            accountable_email="testenterprise@test.mail.com",
+        ),
+        created_at=datetime.datetime.now(),
+    )
+
+
+def to_message(event) -> str:
+    message_dict: dict[str, Any] = {
+        **json.loads(event.model_dump_json()),
+        "start_date": datetime.datetime.now().isoformat(),
+        "origin": "rh_service",
+    }
+
+    return json.dumps(message_dict)
+
+
+@pytest.mark.asyncio
+@patch("app.messages.event.get_db")
+async def test_batch_folds_events_per_user(mock_get: Mock, setup_db: Engine):
+    local_db_session = Session(autocommit=False, autoflush=False, bind=setup_db)
+    saved_user, enterprise = setup_db_defaults(local_db_session)
+
+    assert enterprise.id is not None and enterprise.roles and enterprise.scopes
+    saved_id = saved_user.id
+    enterprise_id = enterprise.id
+    role_id = enterprise.roles[0].id
+    scope_id = enterprise.scopes[1].id
+    assert saved_id is not None and role_id is not None and scope_id is not None
+
+    created = user_read(5, enterprise_id, role_id, scope_id)
+    messages = [
+        to_message(UserCreateEvent(event_scope=DefaultScope.SELLS.value, data=created)),
+        to_message(
+            UserCreateEvent(
+                event_scope=DefaultScope.SELLS.value,
+                data=user_read(6, enterprise_id, role_id, scope_id),
+            )
+        ),
+        to_message(
+            UserUpdateEvent(
+                event_scope=DefaultScope.SELLS.value,
+                update_scope=DefaultScope.ALL.value,
+                user=created,
+                data=UserUpdateWithId(
+                    id=5, enterprise_id=enterprise_id, username="renamed"
+                ),
+            )
+        ),
+        to_message(
+            UserDeleteEvent(
+                event_scope=DefaultScope.SELLS.value,
+                data=UserDeleteWithId(id=saved_id, enterprise_id=enterprise_id),
+            )
+        ),
+        to_message(
+            UserDeleteEvent(
+                event_scope=DefaultScope.SELLS.value,
+                data=UserDeleteWithId(id=6, enterprise_id=enterprise_id),
+            )
+        ),
+    ]
+
+    local_db_session.close()
+    mock_get.return_value = gen_db(local_db_session)
+
+    # Act
+    await UpdateEvent.process_batch(messages)
+
+    # Assert
+    mock_get.assert_called_once()
+
+    with Session(bind=setup_db) as session:
+        users = {user.id: user for user in session.exec(select(User))}
+
+        assert set(users) == {5}
+        assert users[5].username == "renamed"
+        assert users[5].email == "batchuser5@test.mail.com"
+        assert users[5].full_name == "Batch User 5"
+        assert users[5].role_id == role_id
+        assert users[5].scope_id == scope_id
+        assert users[5].enterprise_id == enterprise_id
+
+
+@pytest.mark.asyncio
+@patch("app.messages.event.UserSyncBatch.apply", side_effect=RuntimeError("batch failed"))
+@patch("app.messages.event.get_db")
+async def test_batch_falls_back_to_single_events(
+    mock_get: Mock, _mock_apply: Mock, setup_db: Engine
+):
+    local_db_session = Session(autocommit=False, autoflush=False, bind=setup_db)
+    _, enterprise = setup_db_defaults(local_db_session)
+
+    assert enterprise.id is not None and enterprise.roles and enterprise.scopes
+    enterprise_id = enterprise.id
+    role_id = enterprise.roles[0].id
+    scope_id = enterprise.scopes[1].id
+    assert role_id is not None and scope_id is not None
+
+    local_db_session.close()
+    mock_get.side_effect = lambda: gen_db(
+        Session(autocommit=False, autoflush=False, bind=setup_db)
+    )
+
+    # Act
+    await UpdateEvent.process_batch(
+        [
+            to_message(
+                UserCreateEvent(
+                    event_scope=DefaultScope.SELLS.value,
+                    data=user_read(7, enterprise_id, role_id, scope_id),
+                )
+            ),
+            "not a message",
+        ]
+    )
+
+    # Assert
+    with Session(bind=setup_db) as session:
+        user = session.get(User, 7)
+
+        assert user is not None
+        assert user.username == "batchuser7"
+
+
+@pytest.mark.asyncio
+@patch("app.messages.event.get_db")
+async def test_batch_and_single_updates_agree(mock_get: Mock, setup_db: Engine):
+    local_db_session = Session(autocommit=False, autoflush=False, bind=setup_db)
+    _, enterprise = setup_db_defaults(local_db_session)
+
+    assert enterprise.id is not None and enterprise.roles and enterprise.scopes
+    enterprise_id = enterprise.id
+    role_id = enterprise.roles[0].id
+    scope_id = enterprise.scopes[1].id
+    assert role_id is not None and scope_id is not None
+
+    created_at = datetime.datetime(2024, 1, 1)
+    for user_id in (11, 12):
+        stored = user_read(user_id, enterprise_id, role_id, scope_id)
+        local_db_session.add(
+            User(
+                id=user_id,
+                username=stored.username,
+                email=stored.email,
+                full_name="Kept Name",
+                created_at=created_at,
+                role_id=role_id,
+                scope_id=scope_id,
+                enterprise_id=enterprise_id,
+            )
+        )
+    local_db_session.commit()
+    local_db_session.close()
+
+    def update(user_id: int) -> str:
+        # The user snapshot of the event differs from the stored user on the
+        # fields the update does not carry
+        snapshot = user_read(user_id, enterprise_id, role_id, scope_id)
+        snapshot.full_name = "Snapshot Name"
+        return to_message(
+            UserUpdateEvent(
+                event_scope=DefaultScope.SELLS.value,
+                update_scope=DefaultScope.ALL.value,
+                user=snapshot,
+                data=UserUpdateWithId(
+                    id=user_id, enterprise_id=enterprise_id, email=f"new{user_id}@test.mail.com"
+                ),
+            )
+        )
+
+    mock_get.side_effect = lambda: gen_db(
+        Session(autocommit=False, autoflush=False, bind=setup_db)
+    )
+
+    # Act
+    await UpdateEvent.process_message(update(11))
+    await UpdateEvent.process_batch([update(12)])
+
+    # Assert
+    with Session(bind=setup_db) as session:
+        single, batched = session.get(User, 11), session.get(User, 12)
+
+        assert single is not None and batched is not None
+        for user in (single, batched):
+            assert user.email == f"new{user.id}@test.mail.com"
+            assert user.full_name == "Kept Name"
+            assert user.created_at == created_at
+            assert (user.role_id, user.scope_id) == (role_id, scope_id)
@@ -0,0 +1,86 @@
+from typing import Any
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, func, select
+
+from app.db.bulk_delete import delete_sells
+from app.models.sell import BaseProduct, Client, ProductStockShard, Sell
+
+
+def add_sells(db_session: Session, sell: Sell, quantities: list[int]):
+    for quantity in quantities:
+        db_session.add(
+            Sell(
+                product_id=sell.product_id,
+                client_id=sell.client_id,
+                quantity=quantity,
+                user_id=sell.user_id,
+                enterprise_id=sell.enterprise_id,
+            )
+        )
+    db_session.commit()
+
+
+def test_bulk_delete_sells(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+    first, second = create_default_user["sells"]
+    first_product, second_product = (sell.product_id for sell in (first, second))
+    user_id = create_default_user["user"].id
+    add_sells(db_session, first, [2, 2, 2])
+
+    response = test_client.put(
+        f"/sells/product/{second_product}/stock-shards", json={"shards": 4}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = test_client.post("/sells/delete", json={})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = test_client.post("/sells/delete", json={"user_ids": [user_id]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"] == {"deleted": 5}
+
+    db_session.expire_all()
+    assert db_session.exec(select(func.count(col(Sell.id)))).one() == 0
+    assert db_session.get(BaseProduct, first_product).stock == 10 + 1 + 6  # type: ignore
+    assert db_session.exec(
+        select(func.sum(col(ProductStockShard.stock))).where(
+            col(ProductStockShard.product_id) == second_product
+        )
+    ).one() == 10 + 1
+
+
+def test_delete_sells_in_chunks(db_session: Session, create_default_user: dict[str, Any]):
+    first, second = create_default_user["sells"]
+    add_sells(db_session, first, [1, 2, 3, 4])
+    enterprise_id = create_default_user["user"].enterprise_id
+
+    assert delete_sells(db_session, enterprise_id, product_id=first.product_id, chunk_rows=2) == 5
+    assert delete_sells(db_session, enterprise_id + 1, ids=[second.id]) == 0
+
+    db_session.expire_all()
+    assert db_session.exec(select(col(Sell.id))).all() == [second.id]
+    assert db_session.get(BaseProduct, first.product_id).stock == 10 + 11  # type: ignore
+
+
+def test_bulk_delete_clients(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    first, second = (client.id for client in create_default_user["clients"])
+
+    response = test_client_authenticated_default.post(
+        "/sells/client/delete", json={"ids": [first], "person_codes": ["PER123", "PER999"]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"] == {"deleted": 2}
+
+    db_session.expire_all()
+    assert db_session.exec(select(Client).where(col(Client.id).in_([first, second]))).all() == []
+    assert db_session.exec(select(col(Sell.client_id))).all() == [None, None]
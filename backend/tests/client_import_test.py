@@ -0,0 +1,101 @@
+import json
+from typing import Any
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, select
+
+from app.models.sell import Client
+
+
+def test_import_clients_csv(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    enterprise_id = create_default_user["user"].enterprise_id
+    content = "\n".join(
+        [
+            "name,description,enterprise_code,person_code",
+            "Imported 1,First,ENT900,",
+            "Imported 2,,,PER900",
+            "Imported 3,Short code,E1,",
+            "Imported 4,Same code,ENT900,",
+            "Imported 5,Existing code,ENT123,PER901",
+            "Imported 6,No codes,,",
+            "",
+        ]
+    )
+
+    response = test_client_authenticated_default.post(
+        "/sells/client/import",
+        files={"file": ("clients.csv", content.encode(), "text/csv")},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    report = response.json()["data"]
+    assert (report["read"], report["inserted"]) == (6, 3)
+    assert [error["line"] for error in report["errors"]] == [4, 5, 6]
+    assert report["errors"][0]["error"].startswith("enterprise_code:")
+    assert report["errors"][1]["error"] == "Duplicate enterprise_code of line 2"
+    assert "already exists" in report["errors"][2]["error"]
+
+    imported = db_session.exec(
+        select(col(Client.name), col(Client.description), col(Client.enterprise_id))
+        .where(col(Client.name).startswith("Imported"))
+        .order_by(col(Client.name))
+    ).all()
+    assert [tuple(row) for row in imported] == [
+        ("Imported 1", "First", enterprise_id),
+        ("Imported 2", None, enterprise_id),
+        ("Imported 6", "No codes", enterprise_id),
+    ]
+
+
+def test_import_clients_ndjson(test_client_authenticated_default: TestClient):
+    content = "\n".join(
+        [
+            json.dumps({"name": "Imported 1", "person_code": "PER123"}),
+            "{not json",
+            "",
+            json.dumps({"description": "No name"}),
+            json.dumps({"name": "Imported 2", "enterprise_code": "ENT901"}),
+        ]
+    )
+
+    response = test_client_authenticated_default.post(
+        "/sells/client/import", files={"file": ("clients.ndjson", content.encode())}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    report = response.json()["data"]
+    assert (report["read"], report["inserted"]) == (4, 1)
+    assert [error["line"] for error in report["errors"]] == [1, 2, 4]
+    assert report["errors"][0]["error"] == "A client with this person_code already exists"
+
+    response = test_client_authenticated_default.post(
+        "/sells/client/import", files={"file": ("clients.txt", content.encode())}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_import_clients_with_used_codes(
+    test_client_authenticated_default: TestClient,
+    create_default_user: dict[str, Any],
+):
+    # pylint: disable=unused-argument
+    content = "\n".join(
+        [
+            json.dumps({"name": "Imported 1", "person_code": "PER123"}),
+            json.dumps({"name": "Imported 2", "enterprise_code": "ENT123"}),
+            json.dumps({"name": "Imported 3", "enterprise_code": "ENT902"}),
+        ]
+    )
+
+    response = test_client_authenticated_default.post(
+        "/sells/client/import", files={"file": ("clients.ndjson", content.encode())}
+    )
+
+    report = response.json()["data"]
+    assert (report["read"], report["inserted"]) == (3, 1)
+    assert [error["line"] for error in report["errors"]] == [1, 2]
@@ -12,6 +12,7 @@ from sqlmodel import SQLModel, Session
 from app.db.conn import get_db
 from app.main import app
 from app.middlewares.auth import authenticate_user
+from app.middlewares.rate_limit import rate_limiter
 from app.middlewares.send_message import get_async_message_sender_on_loop
 from app.models.enterprise import Enterprise, EnterpriseRelation
 from app.models.role import DefaultRole, DefaultRoleSchema, Role, RoleRelation
@@ -69,6 +70,13 @@ def override_get_async_message_sender_on_loop():
     return test_sender_on_loop
 
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Every test starts with full rate limit buckets."""
+
+    rate_limiter.clear()
+
+
 @pytest.fixture(scope="function")
 def db_session():
     """Create a new database session with a rollback at the end of the test."""
@@ -94,6 +102,7 @@ def get_test_client_authenticated(user: UserRead):
 
     def override_get_session():
         yield session
+        session.commit()
 
     def override_authenticate_user(token: str = "") -> Any:
         # pylint: disable=unused-argument
@@ -117,10 +126,9 @@ def test_client(db_session: Session):
     """Create a test client that uses the override_get_db fixture to return a session."""
 
     def override_get_session():
-        # try:
+        # Commits at the end of the request, like get_db
         yield db_session
-        # finally:
-        #     db_session.close()
+        db_session.commit()
 
     app.dependency_overrides[get_db] = override_get_session
     app.router.lifespan_context = override_lifespan
@@ -283,7 +291,12 @@ def create_default_user(db_session: Session, enterprise_role_scope: dict[str, An
 
         r_sells.append(
             Sell(
-                id=None, product_id=rp.id, client_id=rc.id, quantity=1, user_id=user.id
+                id=None,
+                product_id=rp.id,
+                client_id=rc.id,
+                quantity=1,
+                user_id=user.id,
+                enterprise_id=user.enterprise_id,
             )
         )
 
@@ -331,10 +344,9 @@ def test_client_authenticated_default(
     )
 
     def override_get_session():
-        # try:
+        # Commits at the end of the request, like get_db
         yield db_session
-        # finally:
-        #     db_session.close()
+        db_session.commit()
 
     def override_authenticate_user(token: str = "") -> Any:
         # pylint: disable=unused-argument
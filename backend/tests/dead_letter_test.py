@@ -0,0 +1,171 @@
+import asyncio
+from typing import Any
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+import pytest
+
+from app.messages.dead_letter import (
+    DEAD_LETTER_QUEUE,
+    LAST_ERROR_HEADER,
+    RETRY_COUNT_HEADER,
+    failure_route,
+    retry_queue_name,
+)
+from app.messages.subscriber import AsyncListener
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published: list[tuple[str, Any]] = []
+
+    async def publish(self, message, routing_key: str):
+        self.published.append((routing_key, message))
+
+
+class FakeChannel:
+    def __init__(self):
+        self.default_exchange = FakeExchange()
+
+
+class FakeMessage:
+    def __init__(self, body: bytes, headers: dict[str, Any] | None = None):
+        self.body = body
+        self.headers = headers or {}
+        self.acked = False
+
+    async def ack(self, multiple: bool = False):
+        # pylint: disable=unused-argument
+        self.acked = True
+
+
+def test_failure_route_walks_retry_tiers_then_dead_letters():
+    delays = (1000, 5000)
+    error = RuntimeError("database down")
+
+    queue_name, headers = failure_route({"event": "USER_UPDATED"}, error, delays)
+    assert queue_name == retry_queue_name(1000)
+    assert headers[RETRY_COUNT_HEADER] == 1
+    assert headers[LAST_ERROR_HEADER] == "RuntimeError: database down"
+    assert headers["event"] == "USER_UPDATED"
+
+    queue_name, headers = failure_route(headers, error, delays)
+    assert queue_name == retry_queue_name(5000)
+    assert headers[RETRY_COUNT_HEADER] == 2
+
+    queue_name, headers = failure_route(headers, error, delays)
+    assert queue_name == DEAD_LETTER_QUEUE
+    assert headers[RETRY_COUNT_HEADER] == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_message_is_republished_and_acked():
+    processor = AsyncMock(side_effect=RuntimeError("database down"))
+    listener = AsyncListener("rh_event.sells", processor)
+    listener.channel = FakeChannel()  # type: ignore
+
+    message = FakeMessage(b'{"event": "USER_UPDATED"}')
+    await listener.handle_message(message)  # type: ignore
+
+    processor.assert_awaited_once_with('{"event": "USER_UPDATED"}')
+    assert message.acked
+
+    [(routing_key, published)] = listener.channel.default_exchange.published  # type: ignore
+    assert routing_key.startswith("sells_events/rh.retry.")
+    assert published.body == message.body
+    assert published.headers[RETRY_COUNT_HEADER] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_retries_only_failed_messages():
+    batch_processor = AsyncMock(return_value={1: RuntimeError("bad event")})
+    listener = AsyncListener(
+        "rh_event.sells", AsyncMock(), batch_processor=batch_processor, batch_size=3
+    )
+    listener.channel = FakeChannel()  # type: ignore
+
+    messages = [FakeMessage(f'{{"n": {n}}}'.encode()) for n in range(3)]
+    await listener.process_batch(messages)  # type: ignore
+
+    [(_, published)] = listener.channel.default_exchange.published  # type: ignore
+    assert published.body == b'{"n": 1}'
+    assert messages[-1].acked
+
+
+class FakeQueueIterator:
+    """Like aio_pika's QueueIterator, closed when a wait for a message is cancelled."""
+
+    def __init__(self):
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def __anext__(self):
+        try:
+            return await self.messages.get()
+        except asyncio.CancelledError:
+            self.closed = True
+            raise
+
+
+class FakeQueue:
+    def __init__(self):
+        self.queue_iter = FakeQueueIterator()
+
+    def iterator(self):
+        return self.queue_iter
+
+
+@pytest.mark.asyncio
+async def test_batches_across_partial_windows():
+    listener = AsyncListener(
+        "rh_event.sells",
+        AsyncMock(),
+        batch_processor=AsyncMock(),
+        batch_size=3,
+        batch_window_ms=20,
+    )
+    batches: list[list[int]] = []
+
+    async def process_batch(batch: list[int]):
+        batches.append(batch)
+
+    listener.process_batch = process_batch  # type: ignore
+    queue = FakeQueue()
+    task = asyncio.create_task(listener.iterate_batches(queue))  # type: ignore
+
+    # Each round ends with a window that times out waiting for more
+    for messages in ([0], [1, 2], [3, 4, 5, 6]):
+        for message in messages:
+            queue.queue_iter.messages.put_nowait(message)
+        await asyncio.sleep(0.1)
+        assert not queue.queue_iter.closed
+
+    assert batches == [[0], [1, 2], [3, 4, 5], [6]]
+    assert not task.done()
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_inspect_and_replay_dead_letters(test_client_authenticated_default: TestClient):
+    client = test_client_authenticated_default
+    dead_letter = {"body": '{"event": "USER_CREATED"}', "headers": {RETRY_COUNT_HEADER: 4}}
+
+    with patch(
+        "app.router.admin.DeadLetters.peek", AsyncMock(return_value=(7, [dead_letter]))
+    ), patch("app.router.admin.DeadLetters.replay", AsyncMock(return_value=7)) as replay:
+        response = client.get("/admin/dlq", params={"limit": 1})
+        assert response.status_code == 200
+        assert response.json() == {"count": 7, "data": [dead_letter]}
+
+        response = client.post("/admin/dlq/replay", params={"limit": 10})
+        assert response.status_code == 200
+        assert response.json() == {"replayed": 7}
+        replay.assert_awaited_once_with(10)
@@ -0,0 +1,182 @@
+import datetime
+from unittest.mock import Mock, patch
+
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from app.messages.event import UpdateEvent
+from app.messages.watermark import watermark_cache
+from app.metrics import counters
+from app.models.scope import DefaultScope
+from app.models.user import User
+from app.models.watermark import UserEventWatermark
+from app.router.utils import (
+    UserCreateEvent,
+    UserDeleteEvent,
+    UserDeleteWithId,
+    UserUpdateEvent,
+    UserUpdateWithId,
+)
+from tests.batch_event_test import to_message, user_read
+from tests.message_receive_test import gen_db, setup_db, setup_db_defaults  # pylint: disable=unused-import
+
+
+def with_start_date(message: str, start_date: datetime.datetime) -> str:
+    return message.replace(
+        message[message.index('"start_date"'):message.index('"origin"')],
+        f'"start_date": "{start_date.isoformat()}", ',
+    )
+
+
+def update_message(
+    created, enterprise_id: int, username: str, start_date: datetime.datetime
+) -> str:
+    message = to_message(
+        UserUpdateEvent(
+            event_scope=DefaultScope.SELLS.value,
+            update_scope=DefaultScope.ALL.value,
+            user=created,
+            data=UserUpdateWithId(id=created.id, enterprise_id=enterprise_id, username=username),
+        )
+    )
+    return with_start_date(message, start_date)
+
+
+def defaults(engine: Engine) -> tuple[int, int, int]:
+    local_db_session = Session(autocommit=False, autoflush=False, bind=engine)
+    _, enterprise = setup_db_defaults(local_db_session)
+
+    assert enterprise.id is not None and enterprise.roles and enterprise.scopes
+    ids = (enterprise.id, enterprise.roles[0].id, enterprise.scopes[1].id)
+    local_db_session.close()
+
+    assert ids[1] is not None and ids[2] is not None
+    return ids  # type: ignore
+
+
+@pytest.mark.asyncio
+@patch("app.messages.event.get_db")
+async def test_duplicate_and_stale_messages_are_dropped(mock_get: Mock, setup_db: Engine):
+    watermark_cache.clear()
+    counters.clear()
+    enterprise_id, role_id, scope_id = defaults(setup_db)
+    mock_get.side_effect = lambda: gen_db(
+        Session(autocommit=False, autoflush=False, bind=setup_db)
+    )
+
+    created = user_read(8, enterprise_id, role_id, scope_id)
+    create = to_message(UserCreateEvent(event_scope=DefaultScope.SELLS.value, data=created))
+    now = datetime.datetime.now()
+    newer = update_message(created, enterprise_id, "newer", now)
+
+    # Act
+    await UpdateEvent.process_message(create)
+    await UpdateEvent.process_message(newer)
+    await UpdateEvent.process_message(newer)
+    await UpdateEvent.process_message(create)
+    await UpdateEvent.process_message(
+        update_message(created, enterprise_id, "older", now - datetime.timedelta(microseconds=1))
+    )
+
+    # The cache is only a shortcut, the stored watermark drops the event too
+    watermark_cache.clear()
+    await UpdateEvent.process_message(update_message(created, enterprise_id, "again", now))
+
+    # Assert
+    with Session(bind=setup_db) as session:
+        user = session.get(User, 8)
+        watermark = session.get(UserEventWatermark, 8)
+
+        assert user is not None and user.username == "newer"
+        assert watermark is not None and watermark.applied_at == now
+
+    assert counters.get("user_events.dropped_duplicate") == 2
+    assert counters.get("user_events.dropped_stale") == 2
+
+
+@pytest.mark.asyncio
+@patch("app.messages.event.get_db")
+async def test_batch_drops_duplicate_and_stale_events(mock_get: Mock, setup_db: Engine):
+    watermark_cache.clear()
+    counters.clear()
+    enterprise_id, role_id, scope_id = defaults(setup_db)
+    mock_get.side_effect = lambda: gen_db(
+        Session(autocommit=False, autoflush=False, bind=setup_db)
+    )
+
+    created = user_read(9, enterprise_id, role_id, scope_id)
+    create = to_message(UserCreateEvent(event_scope=DefaultScope.SELLS.value, data=created))
+    now = datetime.datetime.now()
+    newer = update_message(created, enterprise_id, "newer", now)
+
+    # Act
+    await UpdateEvent.process_batch(
+        [
+            create,
+            newer,
+            update_message(created, enterprise_id, "older", now - datetime.timedelta(seconds=1)),
+            newer,
+        ]
+    )
+    await UpdateEvent.process_batch([newer])
+
+    # Assert
+    with Session(bind=setup_db) as session:
+        user = session.get(User, 9)
+        assert user is not None and user.username == "newer"
+
+    assert counters.get("user_events.dropped_duplicate") == 2
+    assert counters.get("user_events.dropped_stale") == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batched", [False, True])
+@patch("app.messages.event.get_db")
+async def test_noop_events_keep_no_watermark(mock_get: Mock, setup_db: Engine, batched: bool):
+    watermark_cache.clear()
+    enterprise_id, role_id, scope_id = defaults(setup_db)
+    mock_get.side_effect = lambda: gen_db(
+        Session(autocommit=False, autoflush=False, bind=setup_db)
+    )
+
+    created = user_read(10, enterprise_id, role_id, scope_id)
+    now = datetime.datetime.now()
+    create = with_start_date(
+        to_message(UserCreateEvent(event_scope=DefaultScope.SELLS.value, data=created)), now
+    )
+    # Deletes a user that is not there yet, changing nothing
+    delete = with_start_date(
+        to_message(
+            UserDeleteEvent(
+                event_scope=DefaultScope.SELLS.value,
+                data=UserDeleteWithId(id=10, enterprise_id=enterprise_id),
+            )
+        ),
+        now + datetime.timedelta(seconds=1),
+    )
+
+    # Act
+    for message in (delete, create):
+        if batched:
+            await UpdateEvent.process_batch([message])
+        else:
+            await UpdateEvent.process_message(message)
+
+    # Assert
+    with Session(bind=setup_db) as session:
+        watermark = session.get(UserEventWatermark, 10)
+
+        assert session.get(User, 10) is not None
+        assert watermark is not None and watermark.applied_at == now
+
+
+def test_metrics_endpoint(test_client: TestClient):
+    counters.clear()
+    counters.increment("user_events.dropped_stale", 3)
+
+    response = test_client.get("/check/metrics")
+
+    assert response.status_code == 200
+    assert response.json() == {"data": {"user_events.dropped_stale": 3}}
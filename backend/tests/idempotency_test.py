@@ -0,0 +1,108 @@
+from datetime import timedelta
+from typing import Any
+import uuid
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.middlewares.idempotency import (
+    REPLAY_HEADER,
+    purge_expired_idempotency_keys,
+    response_cache,
+    utcnow,
+)
+from app.models.idempotency import IdempotencyKey
+from app.models.sell import BaseProduct, Sell
+
+
+def test_retried_sell_is_replayed(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+    stock_before = create_default_user["products"][0].stock
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    payload = {"client_id": client_id, "product_id": product_id, "quantity": 3}
+
+    first = test_client.post("/sells/me", json=payload, headers=headers)
+    assert first.status_code == status.HTTP_200_OK
+    assert REPLAY_HEADER not in first.headers
+
+    response_cache.clear()
+
+    retry = test_client.post("/sells/me", json=payload, headers=headers)
+    assert retry.status_code == status.HTTP_200_OK
+    assert retry.headers[REPLAY_HEADER] == "true"
+    assert retry.json() == first.json()
+
+    cached_retry = test_client.post("/sells/me", json=payload, headers=headers)
+    assert cached_retry.json() == first.json()
+
+    sells = db_session.exec(
+        select(Sell).where(Sell.product_id == product_id, Sell.quantity == 3)
+    ).all()
+    assert len(sells) == 1
+
+    db_product = db_session.get(BaseProduct, product_id)
+    assert db_product is not None
+    assert db_product.stock == stock_before - 3
+
+
+def test_key_reused_with_other_payload_is_rejected(
+    test_client_authenticated_default: TestClient,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    first = test_client.post(
+        "/sells/me",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 1},
+        headers=headers,
+    )
+    assert first.status_code == status.HTTP_200_OK
+
+    other = test_client.post(
+        "/sells/me",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 2},
+        headers=headers,
+    )
+    assert other.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_purge_expired_keys(db_session: Session):
+    now = utcnow()
+
+    for i in range(5):
+        db_session.add(
+            IdempotencyKey(
+                key=f"expired-{i}",
+                user_id=1,
+                endpoint="POST /sells/me",
+                request_hash="0" * 64,
+                expires_at=now - timedelta(minutes=1),
+            )
+        )
+    db_session.add(
+        IdempotencyKey(
+            key="alive",
+            user_id=1,
+            endpoint="POST /sells/me",
+            request_hash="0" * 64,
+            expires_at=now + timedelta(hours=1),
+        )
+    )
+    db_session.commit()
+
+    assert purge_expired_idempotency_keys(db_session, batch_size=2) == 5
+
+    remaining = db_session.exec(select(IdempotencyKey.key)).all()
+    assert remaining == ["alive"]
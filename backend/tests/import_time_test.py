@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "2500"))
+
+LAZY_MODULES = ("pika", "aio_pika", "aiormq", "passlib", "pyarrow", "numpy")
+
+
+def import_app_main() -> dict[str, int]:
+    """Imports app.main in a fresh interpreter and returns the cumulative
+    import time of every module, in microseconds."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+    cumulative: dict[str, int] = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative_us, name = line.split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+
+    return cumulative
+
+
+def test_app_main_import_time_within_budget():
+    cumulative = import_app_main()
+
+    # app.main is imported by the package __init__, so "app" covers all of it
+    app_ms = cumulative["app"] / 1000
+
+    assert app_ms <= IMPORT_TIME_BUDGET_MS, (
+        f"Importing app.main took {app_ms:.0f}ms, "
+        f"budget is {IMPORT_TIME_BUDGET_MS:.0f}ms"
+    )
+
+
+def test_broker_and_crypto_stacks_are_lazy():
+    cumulative = import_app_main()
+
+    eager = [module for module in LAZY_MODULES if module in cumulative]
+
+    assert not eager, f"Imported at boot, should be lazy: {eager}"
@@ -0,0 +1,39 @@
+import argparse
+
+import pytest
+
+from app.main import app
+from app.middlewares import admission, rate_limit
+from bench import loadgen
+
+
+@pytest.mark.asyncio
+async def test_baseline_run_is_not_rate_limited(
+    monkeypatch: pytest.MonkeyPatch, tmp_path
+):
+    # The overrides of the other tests would replace the tokens of the run
+    monkeypatch.setattr(app, "dependency_overrides", {})
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+
+    # Few users and no pause between requests, far over the default limits
+    args = argparse.Namespace(
+        target=None,
+        database_url=f"sqlite:///{tmp_path / 'bench.db'}",
+        duration=1.0,
+        warmup=0.0,
+        concurrency=8,
+        timeout=30.0,
+        enterprises=1,
+        users=2,
+        clients=2,
+        products=2,
+        stock=1_000_000,
+        mix=loadgen.DEFAULT_MIX,
+        limits=False,
+    )
+    report = await loadgen.main_async(args)
+
+    assert report["overall"]["requests"] > 0
+    assert "429" not in report["status_codes"]
+    assert rate_limit.RATE_LIMIT_ENABLED and admission.ADMISSION_ENABLED
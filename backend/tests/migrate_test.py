@@ -0,0 +1,135 @@
+import os
+
+import pytest
+from sqlalchemy import Engine, create_engine, inspect, text
+from sqlmodel import Session, StaticPool, col, select
+
+from app.db.migrate import (
+    apply_migrations,
+    backfill_sell_enterprise_ids,
+    migrate,
+    require_sell_enterprise_id,
+    sell_enterprise_id_required,
+)
+from app.models.sell import BaseProduct, Sell
+from tests.message_receive_test import setup_db_defaults
+
+
+# See tests/partitions_test.py
+SELLS_PG_TEST_URL = os.environ.get("SELLS_PG_TEST_URL")
+PG_TEST_SCHEMA = "migrate_test"
+
+
+def test_migrate_creates_tables():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    migrate(engine)
+
+    tables = inspect(engine).get_table_names()
+
+    for table in ("enterprise", "role", "scope", "user", "client", "product", "sell"):
+        assert table in tables
+
+
+def test_migrate_is_idempotent():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    migrate(engine)
+    migrate(engine)
+
+    assert "sell" in inspect(engine).get_table_names()
+
+
+@pytest.fixture(scope="function")
+def pg_engine():
+    """A migrated schema of its own in the PostgreSQL test database."""
+
+    if not SELLS_PG_TEST_URL:
+        pytest.skip("SELLS_PG_TEST_URL is not set")
+
+    admin = create_engine(SELLS_PG_TEST_URL)
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {PG_TEST_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {PG_TEST_SCHEMA}"))
+
+    engine = create_engine(
+        SELLS_PG_TEST_URL, connect_args={"options": f"-csearch_path={PG_TEST_SCHEMA}"}
+    )
+    migrate(engine)
+
+    yield engine
+
+    engine.dispose()
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {PG_TEST_SCHEMA} CASCADE"))
+    admin.dispose()
+
+
+def test_backfill_sell_enterprise_ids(pg_engine: Engine):
+    assert sell_enterprise_id_required(pg_engine)
+
+    # The column as it was added to the sells from before it
+    with pg_engine.begin() as conn:
+        conn.execute(text("ALTER TABLE sell ALTER COLUMN enterprise_id DROP NOT NULL"))
+    assert not sell_enterprise_id_required(pg_engine)
+
+    with Session(pg_engine) as session:
+        user, enterprise = setup_db_defaults(session)
+        product = BaseProduct(
+            name="Product", cost=1.0, enterprise_id=enterprise.id, created_by=user.id
+        )
+        session.add(product)
+        session.commit()
+        session.add_all(
+            [
+                Sell(product_id=product.id, client_id=None, quantity=1, user_id=user.id)
+                for _ in range(5)
+            ]
+        )
+        session.commit()
+        enterprise_id = enterprise.id
+
+        session.add(
+            Sell(product_id=product.id, client_id=None, quantity=2, user_id=user.id)
+        )
+        session.commit()
+
+    # Users of older databases may have no enterprise, the product has one
+    with pg_engine.begin() as conn:
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN enterprise_id DROP NOT NULL'))
+        conn.execute(text('UPDATE "user" SET enterprise_id = NULL'))
+
+    assert not require_sell_enterprise_id(pg_engine)
+
+    assert backfill_sell_enterprise_ids(pg_engine, batch_rows=2) == 6
+    assert require_sell_enterprise_id(pg_engine)
+    assert sell_enterprise_id_required(pg_engine)
+    assert backfill_sell_enterprise_ids(pg_engine, batch_rows=2) == 0
+
+    with Session(pg_engine) as session:
+        assert set(session.exec(select(col(Sell.enterprise_id))).all()) == {enterprise_id}
+
+
+def test_concurrent_indexes_are_rebuilt_when_invalid(pg_engine: Engine):
+    with pg_engine.begin() as conn:
+        conn.execute(
+            text("UPDATE pg_index SET indisvalid = false WHERE indexrelid = to_regclass(:index)"),
+            {"index": "ix_sell_client_id"},
+        )
+
+    apply_migrations(pg_engine)
+
+    with pg_engine.connect() as conn:
+        assert conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index)"),
+            {"index": "ix_sell_client_id"},
+        ).scalar()
+
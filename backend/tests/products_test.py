@@ -0,0 +1,79 @@
+from datetime import timedelta
+from typing import Any
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, select
+
+from app.db.products import compact_deleted_products
+from app.middlewares.idempotency import utcnow
+from app.models.sell import BaseProduct, ProductStockShard
+
+
+def test_deleted_products_are_not_sold(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+    product = create_default_user["products"][0]
+    product_id = product.id
+    sell = {
+        "client_id": create_default_user["clients"][0].id,
+        "product_id": product_id,
+        "quantity": 1,
+    }
+
+    response = test_client.post("/sells/reservations/", json=sell)
+    assert response.status_code == status.HTTP_200_OK
+    reservation_id = response.json()["data"]["id"]
+
+    product.deleted_at = utcnow()
+    db_session.add(product)
+    db_session.commit()
+
+    for method, url, body in (
+        ("POST", "/sells/me", sell),
+        ("POST", "/sells/", {**sell, "user_id": create_default_user["user"].id}),
+        ("POST", "/sells/reservations/", sell),
+        ("POST", f"/sells/reservations/{reservation_id}/confirm", None),
+        ("GET", f"/sells/product/{product_id}/stock", None),
+    ):
+        response = test_client.request(method, url, json=body)
+        assert response.status_code == status.HTTP_404_NOT_FOUND, url
+
+    # The hold can still be given back
+    response = test_client.post(f"/sells/reservations/{reservation_id}/release")
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_compact_deleted_products(db_session: Session, create_default_user: dict[str, Any]):
+    enterprise_id = create_default_user["user"].enterprise_id
+    long_ago = utcnow() - timedelta(days=100)
+
+    # Deleted long ago and sold before: kept with its sells
+    sold = create_default_user["products"][0]
+    sold.deleted_at = long_ago
+    db_session.add(sold)
+
+    dead, recent, live = (
+        BaseProduct(name=name, cost=1.0, enterprise_id=enterprise_id, deleted_at=deleted_at)
+        for name, deleted_at in (
+            ("Dead", long_ago),
+            ("Recent", utcnow() - timedelta(days=1)),
+            ("Live", None),
+        )
+    )
+    db_session.add_all([dead, recent, live])
+    db_session.commit()
+    db_session.add(ProductStockShard(product_id=dead.id, shard=0, stock=3))  # type: ignore
+    db_session.commit()
+    kept = {x.id for x in (sold, recent, live)}
+    dead_id = dead.id
+
+    assert compact_deleted_products(db_session, batch_size=1) == 1
+
+    db_session.expire_all()
+    product_ids = db_session.exec(select(col(BaseProduct.id))).all()
+    assert kept <= set(product_ids) and dead_id not in product_ids
+    assert db_session.exec(select(ProductStockShard)).all() == []
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.middlewares import rate_limit
+from app.middlewares.rate_limit import RateLimiter, parse_limits, sync_rate_limits
+from app.models.rate_limit import RateLimitBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_parse_limits():
+    assert parse_limits("write=20:40, heavy=0.5") == {"write": (20.0, 40.0), "heavy": (0.5, 1.0)}
+    assert parse_limits("") == {}
+    with pytest.raises(ValueError):
+        parse_limits("read=0:10")
+
+
+def test_token_buckets():
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    user = ("user:1:read", 1.0, 2.0)
+    enterprise = ("enterprise:1:read", 10.0, 3.0)
+
+    assert limiter.take([user, enterprise]) == 0
+    assert limiter.take([user, enterprise]) == 0
+    assert limiter.take([user, enterprise]) == pytest.approx(1.0)
+
+    # The refused request took no enterprise token
+    assert limiter.take([("user:2:read", 1.0, 2.0), enterprise]) == 0
+    assert limiter.take([("user:3:read", 1.0, 2.0), enterprise]) == pytest.approx(0.1)
+
+    clock.now += 0.5
+    assert limiter.take([user]) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.take([user]) == 0
+
+    started = time.perf_counter()
+    for _ in range(10000):
+        limiter.take([("user:4:write", 1e9, 1e9), ("enterprise:4:write", 1e9, 1e9)])
+    assert (time.perf_counter() - started) / 10000 < 50e-6
+
+
+def test_rate_limited_route(
+    test_client_authenticated_default: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_USER", {"heavy": (0.5, 2.0)})
+
+    assert test_client_authenticated_default.get("/sells/").status_code == status.HTTP_200_OK
+    assert test_client_authenticated_default.get("/sells/").status_code == status.HTTP_200_OK
+
+    response = test_client_authenticated_default.get("/sells/")
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["retry-after"] == "2"
+
+    # Other route classes have their own buckets
+    assert test_client_authenticated_default.get("/sells/me").status_code == status.HTTP_200_OK
+
+
+def test_sync_rate_limits(db_session: Session):
+    clock = Clock()
+    pods = [RateLimiter(clock=clock), RateLimiter(clock=clock)]
+    limit = ("enterprise:1:heavy", 1.0, 10.0)
+
+    for pod, taken in zip(pods, (3, 4)):
+        for _ in range(taken):
+            assert pod.take([limit]) == 0
+    assert [sync_rate_limits(db_session, pod) for pod in pods] == [1, 1]
+
+    shared = db_session.exec(select(RateLimitBucket)).one()
+    assert shared.tokens == pytest.approx(3.0)
+
+    # The first pod learns about the tokens taken by the second one
+    clock.now += 1
+    pods[0].take([limit])
+    assert sync_rate_limits(db_session, pods[0]) == 1
+    assert pods[0].take([limit] * 1) == 0
+    db_session.expire_all()
+    assert db_session.exec(select(RateLimitBucket)).one().tokens == pytest.approx(3.0)
+
+    clock.now += 10_000
+    assert sync_rate_limits(db_session, pods[1]) == 0
+    assert db_session.exec(select(RateLimitBucket)).all() == []
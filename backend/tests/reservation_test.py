@@ -0,0 +1,182 @@
+from datetime import timedelta
+from typing import Any
+
+from fastapi import status
+from fastapi.testclient import TestClient
+import pytest
+from sqlmodel import Session, select
+
+from app.db.stock import expire_stock_reservations
+from app.main import app
+from app.middlewares.auth import authenticate_user
+from app.middlewares.idempotency import utcnow
+from app.models.reservation import StockReservation
+from app.models.scope import DefaultScope
+from app.models.sell import BaseProduct, Client, Sell
+
+
+def product_stock(db_session: Session, product_id: int) -> tuple[int, int]:
+    product = db_session.get(BaseProduct, product_id)
+    assert product is not None
+    db_session.refresh(product)
+    return product.stock, product.reserved
+
+
+def test_reserve_and_confirm(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+    stock_before = create_default_user["products"][0].stock
+
+    reserved = test_client.post(
+        "/sells/reservations/",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 4},
+    )
+    assert reserved.status_code == status.HTTP_200_OK
+    reservation = reserved.json()["data"]
+    assert reservation["status"] == "held"
+    assert product_stock(db_session, product_id) == (stock_before - 4, 4)
+
+    stock = test_client.get(f"/sells/product/{product_id}/stock")
+    assert stock.json()["data"]["stock"] == stock_before - 4
+    assert stock.json()["data"]["reserved"] == 4
+
+    too_many = test_client.post(
+        "/sells/reservations/",
+        json={
+            "client_id": client_id,
+            "product_id": product_id,
+            "quantity": stock_before - 3,
+        },
+    )
+    assert too_many.status_code == status.HTTP_400_BAD_REQUEST
+
+    confirmed = test_client.post(f"/sells/reservations/{reservation['id']}/confirm")
+    assert confirmed.status_code == status.HTTP_200_OK
+    assert confirmed.json()["data"]["status"] == "confirmed"
+    assert product_stock(db_session, product_id) == (stock_before - 4, 0)
+
+    sell = db_session.get(Sell, confirmed.json()["data"]["sell_id"])
+    assert sell is not None
+    assert sell.quantity == 4
+
+    again = test_client.post(f"/sells/reservations/{reservation['id']}/release")
+    assert again.status_code == status.HTTP_409_CONFLICT
+
+
+def test_release_gives_stock_back(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+    stock_before = create_default_user["products"][0].stock
+
+    reserved = test_client.post(
+        "/sells/reservations/",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 2},
+    )
+    reservation_id = reserved.json()["data"]["id"]
+
+    released = test_client.post(f"/sells/reservations/{reservation_id}/release")
+    assert released.status_code == status.HTTP_200_OK
+    assert released.json()["data"]["status"] == "released"
+    assert product_stock(db_session, product_id) == (stock_before, 0)
+
+    confirmed = test_client.post(f"/sells/reservations/{reservation_id}/confirm")
+    assert confirmed.status_code == status.HTTP_409_CONFLICT
+
+
+def test_expired_reservations_are_reaped(
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    products = create_default_user["products"]
+    user_id = create_default_user["user"].id
+    now = utcnow()
+
+    for product in products:
+        product.stock -= 3
+        product.reserved = 3
+        db_session.add(product)
+        for quantity in (1, 2):
+            db_session.add(
+                StockReservation(
+                    product_id=product.id,
+                    user_id=user_id,
+                    quantity=quantity,
+                    created_at=now - timedelta(minutes=30),
+                    expires_at=now - timedelta(minutes=15),
+                )
+            )
+    db_session.add(
+        StockReservation(
+            product_id=products[0].id,
+            user_id=user_id,
+            quantity=1,
+            created_at=now,
+            expires_at=now + timedelta(minutes=15),
+        )
+    )
+    db_session.commit()
+    stocks = {p.id: p.stock for p in products}
+
+    assert expire_stock_reservations(db_session, batch_size=3) == 4
+
+    for product_id, stock in stocks.items():
+        assert product_stock(db_session, product_id) == (stock + 3, 0)
+
+    statuses = db_session.exec(
+        select(StockReservation.status).order_by(StockReservation.id)
+    ).all()
+    assert statuses == ["expired"] * 4 + ["held"]
+
+
+def test_reservations_need_a_client_of_the_enterprise_and_the_sells_scope(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+    monkeypatch: pytest.MonkeyPatch,
+):
+    test_client = test_client_authenticated_default
+    product = create_default_user["products"][0]
+    stock_before = product.stock
+
+    other_client = Client(name="Other", enterprise_id=product.enterprise_id + 1)
+    db_session.add(other_client)
+    db_session.commit()
+
+    response = test_client.post(
+        "/sells/reservations/",
+        json={"client_id": other_client.id, "product_id": product.id, "quantity": 1},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert product_stock(db_session, product.id) == (stock_before, 0)
+
+    reserved = test_client.post(
+        "/sells/reservations/",
+        json={
+            "client_id": create_default_user["clients"][0].id,
+            "product_id": product.id,
+            "quantity": 1,
+        },
+    )
+    assert reserved.status_code == status.HTTP_200_OK
+    reservation_id = reserved.json()["data"]["id"]
+
+    user = app.dependency_overrides[authenticate_user]()
+    scope = user.scope.model_copy(update={"name": DefaultScope.HUMAN_RESOURCE})
+    outsider = user.model_copy(update={"scope": scope})
+    monkeypatch.setitem(app.dependency_overrides, authenticate_user, lambda: outsider)
+
+    for path in ("confirm", "release"):
+        response = test_client.post(f"/sells/reservations/{reservation_id}/{path}")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,146 @@
+from datetime import datetime
+import json
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from app.db.resync import read_lines, resync_users
+from app.models.enterprise import Enterprise
+from app.models.scope import DefaultScope
+from app.models.sell import BaseProduct
+from app.models.user import User
+from app.models.watermark import UserEventWatermark
+from tests.batch_event_test import user_read
+# pylint: disable-next=unused-import
+from tests.message_receive_test import setup_db, setup_db_defaults
+
+
+AS_OF = datetime(2024, 5, 1, 12)
+
+
+def test_resync_users_from_snapshot(setup_db: Engine, tmp_path):
+    with Session(setup_db) as session:
+        saved_user, enterprise = setup_db_defaults(session)
+        assert enterprise.id is not None and enterprise.roles and enterprise.scopes
+        enterprise_id = enterprise.id
+        role_id = enterprise.roles[0].id
+        sells_scope_id = enterprise.scopes[0].id
+        assert role_id is not None and sells_scope_id is not None
+
+        # 20 is referenced by a product and 21 is not, neither is in the snapshot
+        for user_id in (10, 11, 20, 21):
+            session.add(
+                User(
+                    id=user_id,
+                    username=f"batchuser{user_id}",
+                    email=f"batchuser{user_id}@test.mail.com",
+                    full_name=f"Batch User {user_id}",
+                    role_id=role_id,
+                    scope_id=sells_scope_id,
+                    enterprise_id=enterprise_id,
+                )
+            )
+        session.add(
+            BaseProduct(
+                name="Product", cost=1.0, enterprise_id=enterprise_id, created_by=20
+            )
+        )
+        session.commit()
+        saved_id = saved_user.id
+
+    snapshot = []
+    for user_id in (10, 11, 12, 13):
+        user = json.loads(
+            user_read(user_id, enterprise_id, role_id, sells_scope_id).model_dump_json()
+        )
+        user["scope"]["name"] = DefaultScope.SELLS.value
+        snapshot.append(user)
+    snapshot[1]["full_name"] = "Changed Name"
+    snapshot[3]["scope"]["name"] = "PT"
+
+    path = tmp_path / "users.ndjson"
+    other_enterprise = {**snapshot[0]["enterprise"], "id": 99}
+    path.write_text(
+        "\n".join(json.dumps(user) for user in snapshot)
+        + "\n"
+        + json.dumps({**snapshot[0], "id": 30, "enterprise": other_enterprise})
+        + "\n"
+    )
+
+    report = resync_users(
+        enterprise_id, read_lines(path=str(path)), AS_OF, engine=setup_db, chunk_rows=2
+    )
+
+    assert (report.read, report.skipped) == (5, 2)
+    assert (report.inserted, report.updated) == (1, 1)
+    assert (report.deleted, report.kept) == (2, 1)
+
+    with Session(setup_db) as session:
+        users = {user.id: user for user in session.exec(select(User))}
+        assert set(users) == {10, 11, 12, 20}
+        assert saved_id not in users
+        assert users[11].full_name == "Changed Name"
+
+        watermarks = session.exec(
+            select(UserEventWatermark.user_id, UserEventWatermark.applied_at)
+        ).all()
+        assert sorted(watermarks) == [(10, AS_OF), (11, AS_OF), (12, AS_OF)]
+
+    # A second run finds nothing to change
+    report = resync_users(
+        enterprise_id, read_lines(path=str(path)), AS_OF, engine=setup_db
+    )
+    counts = (report.inserted, report.updated, report.deleted, report.kept)
+    assert counts == (0, 0, 0, 1)
+
+
+def test_resync_skips_repeated_and_foreign_users(setup_db: Engine, tmp_path):
+    with Session(setup_db) as session:
+        _, enterprise = setup_db_defaults(session)
+        assert enterprise.id is not None and enterprise.roles and enterprise.scopes
+        enterprise_id = enterprise.id
+        role_id = enterprise.roles[0].id
+        sells_scope_id = enterprise.scopes[0].id
+        assert role_id is not None and sells_scope_id is not None
+
+        other = Enterprise(name="Other", accountable_email="other@test.mail.com")
+        session.add(other)
+        session.commit()
+        session.add(
+            User(
+                id=40,
+                username="otheruser",
+                email="otheruser@test.mail.com",
+                full_name="Other User",
+                role_id=role_id,
+                scope_id=sells_scope_id,
+                enterprise_id=other.id,
+            )
+        )
+        session.commit()
+
+    snapshot = []
+    for user_id, full_name in ((10, "First"), (10, "Second"), (40, "Taken")):
+        user = json.loads(
+            user_read(user_id, enterprise_id, role_id, sells_scope_id).model_dump_json()
+        )
+        user["scope"]["name"] = DefaultScope.SELLS.value
+        snapshot.append({**user, "full_name": full_name})
+    path = tmp_path / "users.ndjson"
+    path.write_text("".join(json.dumps(user) + "\n" for user in snapshot))
+
+    report = resync_users(
+        enterprise_id, read_lines(path=str(path)), AS_OF, engine=setup_db
+    )
+
+    assert (report.read, report.repeated, report.foreign) == (3, 1, 1)
+    assert (report.inserted, report.updated) == (1, 0)
+
+    with Session(setup_db) as session:
+        users = {user.id: user for user in session.exec(select(User))}
+        assert users[10].full_name == "First"
+        assert users[40].full_name == "Other User"
+        assert users[40].enterprise_id != enterprise_id
+
+        watermarks = session.exec(select(UserEventWatermark.user_id)).all()
+        assert watermarks == [10]
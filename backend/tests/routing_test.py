@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from app.messages.routing import is_sells_event, routing_headers
+from app.models.scope import DefaultScope
+
+
+def event_body(event: str, event_scope: str, update_scope: str | None = None, **extra) -> dict:
+    return {
+        "event": event,
+        "event_scope": event_scope,
+        "update_scope": update_scope,
+        "data": {"id": 1, "enterprise_id": 1},
+        "start_date": "2024-01-01T00:00:00",
+        "origin": "rh",
+        **extra,
+    }
+
+
+@pytest.mark.parametrize(
+    "body,expected",
+    [
+        (event_body("USER_CREATED", DefaultScope.SELLS.value), True),
+        (event_body("USER_UPDATED", DefaultScope.ALL.value, DefaultScope.SELLS.value), True),
+        (event_body("USER_DELETED", DefaultScope.SELLS.value), True),
+        (event_body("USER_UPDATED", DefaultScope.ALL.value, "PT"), False),
+        (event_body("USER_CREATED", "PT"), False),
+        (event_body("USER_LOGIN", DefaultScope.SELLS.value), False),
+        (event_body("ENTERPRISE_UPDATED", DefaultScope.SELLS.value), False),
+    ],
+)
+def test_is_sells_event(body: dict, expected: bool):
+    raw = json.dumps(body).encode()
+
+    assert is_sells_event(None, raw) is expected
+    assert is_sells_event(routing_headers(body), raw) is expected
+    # Headers are trusted over the body
+    assert is_sells_event(routing_headers(body), b"{}") is expected
+
+
+def test_ambiguous_or_unreadable_messages_are_kept():
+    nested = event_body("USER_LOGIN", "PT", data={"event": "USER_CREATED"})
+
+    assert is_sells_event(None, json.dumps(nested).encode())
+    assert is_sells_event(None, b'{"data": {}}')
+    assert is_sells_event({}, b"not json")
@@ -63,26 +63,25 @@ def test_query_clients(
     create_default_user: dict[str, Any],
 ):
     test_client = test_client_authenticated_default
+    # Read before the request, the handler closes the shared session
+    fields = ("id", "name", "description", "enterprise_code", "person_code")
+    clients = [
+        {field: getattr(client, field) for field in fields}
+        for client in create_default_user["clients"]
+    ]
 
     response = test_client.get("/sells/client")
     assert response.status_code == status.HTTP_200_OK
 
     clients_data = response.json()["data"]
-    assert len(clients_data) == len(create_default_user["clients"])
+    assert len(clients_data) == len(clients)
 
     for i, client_data in enumerate(clients_data):
-        assert client_data["id"] == create_default_user["clients"][i].id
-        assert client_data["name"] == create_default_user["clients"][i].name
-        assert (
-            client_data["description"] == create_default_user["clients"][i].description
-        )
-        assert (
-            client_data["enterprise_code"]
-            == create_default_user["clients"][i].enterprise_code
-        )
-        assert (
-            client_data["person_code"] == create_default_user["clients"][i].person_code
-        )
+        assert client_data["id"] == clients[i]["id"]
+        assert client_data["name"] == clients[i]["name"]
+        assert client_data["description"] == clients[i]["description"]
+        assert client_data["enterprise_code"] == clients[i]["enterprise_code"]
+        assert client_data["person_code"] == clients[i]["person_code"]
 
 
 def test_delete_client(
@@ -180,17 +179,22 @@ def test_get_my_sells(
     create_default_user: dict[str, Any],
 ):
     test_client = test_client_authenticated_default
+    # Read before the request, the handler closes the shared session
+    sells = [
+        {"user_id": sell.user_id, "product_id": sell.product_id, "quantity": sell.quantity}
+        for sell in create_default_user["sells"]
+    ]
 
     response = test_client.get("/sells/me")
     assert response.status_code == status.HTTP_200_OK
 
     sells_data = response.json()["data"]
-    assert len(sells_data) == len(create_default_user["sells"])
+    assert len(sells_data) == len(sells)
 
     for i, sell_data in enumerate(sells_data):
-        assert sell_data["user_id"] == create_default_user["sells"][i].user_id
-        assert sell_data["product_id"] == create_default_user["sells"][i].product_id
-        assert sell_data["quantity"] == create_default_user["sells"][i].quantity
+        assert sell_data["user_id"] == sells[i]["user_id"]
+        assert sell_data["product_id"] == sells[i]["product_id"]
+        assert sell_data["quantity"] == sells[i]["quantity"]
 
 
 def test_query_sells(
@@ -258,3 +262,50 @@ def test_delete_sell(
     ).first()
 
     assert db_sell is None
+
+
+def test_query_sells_by_user(
+    test_client_authenticated_default: TestClient,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+    user_id = create_default_user["user"].id
+    sell_ids = sorted(sell.id for sell in create_default_user["sells"])
+
+    response = test_client.get("/sells/")
+    assert response.status_code == status.HTTP_200_OK
+
+    users_data = response.json()["data"]
+    user_data = next(x for x in users_data if x["id"] == user_id)
+    assert [sell["id"] for sell in user_data["sells"]] == sell_ids
+    assert all(sell["user_id"] == user_id for sell in user_data["sells"])
+
+    filtered = test_client.get("/sells/", params={"user_ids": str(user_id + 1000)})
+    assert filtered.status_code == status.HTTP_200_OK
+    assert filtered.json()["data"] == []
+
+
+def test_sells_of_other_enterprises_are_hidden(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+    enterprise_id = create_default_user["user"].enterprise_id
+    sell, other = create_default_user["sells"]
+    url = f"/sells/{sell.user_id}/{sell.client_id}/{sell.product_id}"
+
+    response = test_client.post(
+        "/sells/me",
+        json={"client_id": other.client_id, "product_id": other.product_id, "quantity": 1},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    created = db_session.get(Sell, response.json()["data"]["id"])
+    assert created is not None and created.enterprise_id == enterprise_id
+
+    # The tenant of a sell is its own enterprise_id, not the one of its user
+    sell.enterprise_id = enterprise_id + 1
+    db_session.commit()
+
+    assert test_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.delete(url).status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,113 @@
+from collections.abc import Callable
+from typing import Any
+import uuid
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.db.conn import get_db, unit_of_work
+from app.main import app
+
+
+@pytest.fixture(scope="function")
+def count_statements(
+    test_client_authenticated_default: TestClient, db_session: Session
+) -> Callable[..., tuple[Any, list[str]]]:
+    """
+    Requests through the unit of work of get_db, on the connection of the
+    test, returning the response and the SQL statements the request ran.
+    """
+
+    connection = db_session.connection()
+
+    def override_get_db():
+        yield from unit_of_work(connection)
+
+    app.dependency_overrides[get_db] = override_get_db
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, *args):
+        # pylint: disable=unused-argument
+        statements.append(statement.split()[0].upper())
+
+    event.listen(connection, "before_cursor_execute", record)
+
+    def request(method: str, url: str, **kwargs) -> tuple[Any, list[str]]:
+        statements.clear()
+        response = test_client_authenticated_default.request(method, url, **kwargs)
+        return response, list(statements)
+
+    yield request
+
+    event.remove(connection, "before_cursor_execute", record)
+
+
+def test_write_statement_counts(
+    count_statements, create_default_user: dict[str, Any]
+):
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+    sell = {"client_id": client_id, "product_id": product_id, "quantity": 1}
+
+    # The new row comes back from the INSERT, it is not reloaded after the commit
+    response, statements = count_statements(
+        "POST",
+        "/sells/client",
+        json={"name": "Counted", "description": "Counted", "person_code": "PER777"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["id"] is not None
+    assert statements == ["INSERT"]
+
+    # Product, stock update, sell
+    response, statements = count_statements("POST", "/sells/me", json=sell)
+    assert response.status_code == status.HTTP_200_OK
+    assert statements == ["SELECT", "UPDATE", "INSERT"]
+
+    # With a key: the claim and the stored response, not reloaded either
+    response, statements = count_statements(
+        "POST", "/sells/me", json=sell, headers={"Idempotency-Key": str(uuid.uuid4())}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert statements == ["SAVEPOINT", "INSERT", "RELEASE", "SELECT", "UPDATE", "INSERT", "UPDATE"]
+
+    response, statements = count_statements(
+        "POST", "/sells/reservations/", json={**sell, "quantity": 2}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    reservation_id = response.json()["data"]["id"]
+    # The client is checked before the product is locked
+    assert statements == ["SELECT", "SELECT", "UPDATE", "UPDATE", "INSERT"]
+
+    # Reservation and product, sell, reserved counter, reservation
+    response, statements = count_statements(
+        "POST", f"/sells/reservations/{reservation_id}/confirm"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["sell_id"] is not None
+    assert statements == ["SELECT", "SELECT", "INSERT", "UPDATE", "UPDATE"]
+
+    response, statements = count_statements(
+        "PUT", f"/sells/product/{product_id}/stock-shards", json={"shards": 2}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(statements) == 5
+
+
+def test_read_statement_counts(count_statements, create_default_user: dict[str, Any]):
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+
+    for url, count in (
+        (f"/sells/client/{client_id}", 1),
+        ("/sells/client", 1),
+        (f"/sells/product/{product_id}/stock", 1),
+        ("/sells/me", 2),
+        ("/sells/", 2),
+    ):
+        response, statements = count_statements("GET", url)
+        assert response.status_code == status.HTTP_200_OK, url
+        assert statements == ["SELECT"] * count, url
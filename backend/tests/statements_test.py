@@ -0,0 +1,46 @@
+import json
+from typing import Any
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.db import statements
+from app.router import sell as sell_router
+
+
+def test_statements_are_built_once():
+    assert statements.clients(True, False, True) is statements.clients(True, False, True)
+    assert statements.my_sells(False, True) is statements.my_sells(False, True)
+    assert statements.enterprise_sells(True, True, False, chunked=True) is (
+        statements.enterprise_sells(True, True, False, chunked=True)
+    )
+
+
+def test_optional_filters(
+    test_client_authenticated_default: TestClient,
+    create_default_user: dict[str, Any],
+    monkeypatch: pytest.MonkeyPatch,
+):
+    test_client = test_client_authenticated_default
+    user_id = create_default_user["user"].id
+    sell_ids = sorted(x.id for x in create_default_user["sells"])
+
+    response = test_client.get("/sells/client", params={"person_code": "PER123"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [x["name"] for x in response.json()["data"]] == ["Test Client 2"]
+
+    response = test_client.get(
+        "/sells/client", params={"name": "Test Client", "enterprise_code": "ENT999"}
+    )
+    assert response.json()["data"] == []
+
+    response = test_client.get("/sells/", params={"user_ids": f"{user_id},{user_id + 1}"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [len(x["sells"]) for x in response.json()["data"]] == [2]
+
+    # Every chunk reads after the last id of the previous one
+    monkeypatch.setattr(sell_router, "EXPORT_CHUNK_ROWS", 1)
+    response = test_client.get("/sells/export", params={"user_ids": str(user_id)})
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [x["id"] for x in exported] == sell_ids
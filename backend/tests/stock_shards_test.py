@@ -0,0 +1,125 @@
+from typing import Any
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.db.stock import rebalance_stock_shards, split_stock
+from app.models.sell import BaseProduct, ProductStockShard
+
+
+def shard_stocks(db_session: Session, product_id: int) -> list[int]:
+    return list(
+        db_session.exec(
+            select(ProductStockShard.stock)
+            .where(ProductStockShard.product_id == product_id)
+            .order_by(ProductStockShard.shard)
+        ).all()
+    )
+
+
+def test_split_stock():
+    assert split_stock(10, 4) == [3, 3, 2, 2]
+    assert split_stock(2, 4) == [1, 1, 0, 0]
+    assert sum(split_stock(1001, 7)) == 1001
+
+
+def test_sharded_product_sells(
+    test_client_authenticated_default: TestClient,
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    test_client = test_client_authenticated_default
+
+    product_id = create_default_user["products"][0].id
+    client_id = create_default_user["clients"][0].id
+    stock_before = create_default_user["products"][0].stock
+
+    enabled = test_client.put(
+        f"/sells/product/{product_id}/stock-shards", json={"shards": 4}
+    )
+    assert enabled.status_code == status.HTTP_200_OK
+    assert enabled.json()["data"] == {
+        "product_id": product_id,
+        "stock": stock_before,
+        "reserved": 0,
+        "stock_shards": 4,
+    }
+    assert shard_stocks(db_session, product_id) == split_stock(stock_before, 4)
+
+    sold = test_client.post(
+        "/sells/me",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 2},
+    )
+    assert sold.status_code == status.HTTP_200_OK
+
+    # Larger than any single shard: taken from several of them
+    sold = test_client.post(
+        "/sells/me",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 5},
+    )
+    assert sold.status_code == status.HTTP_200_OK
+
+    too_many = test_client.post(
+        "/sells/me",
+        json={"client_id": client_id, "product_id": product_id, "quantity": 4},
+    )
+    assert too_many.status_code == status.HTTP_400_BAD_REQUEST
+
+    stock = test_client.get(f"/sells/product/{product_id}/stock")
+    assert stock.status_code == status.HTTP_200_OK
+    assert stock.json()["data"]["stock"] == stock_before - 7
+    assert sum(shard_stocks(db_session, product_id)) == stock_before - 7
+
+    disabled = test_client.put(
+        f"/sells/product/{product_id}/stock-shards", json={"shards": 0}
+    )
+    assert disabled.status_code == status.HTTP_200_OK
+    assert shard_stocks(db_session, product_id) == []
+
+    db_product = db_session.get(BaseProduct, product_id)
+    assert db_product is not None
+    assert db_product.stock == stock_before - 7
+    assert db_product.stock_shards == 0
+
+
+def test_rebalance_stock_shards(
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    product = create_default_user["products"][0]
+    product_id = product.id
+
+    product.stock = 0
+    product.stock_shards = 3
+    db_session.add(product)
+    for shard, stock in enumerate([9, 0, 1]):
+        db_session.add(ProductStockShard(product_id=product_id, shard=shard, stock=stock))
+    db_session.commit()
+
+    assert rebalance_stock_shards(db_session) == 1
+    assert shard_stocks(db_session, product_id) == [4, 3, 3]
+
+    assert rebalance_stock_shards(db_session) == 0
+
+
+def test_rebalance_goes_past_the_first_batch(
+    db_session: Session,
+    create_default_user: dict[str, Any],
+):
+    products = create_default_user["products"][:2]
+    assert len(products) == 2
+
+    for product in products:
+        product.stock = 0
+        product.stock_shards = 2
+        db_session.add(product)
+        for shard, stock in enumerate([6, 0]):
+            db_session.add(
+                ProductStockShard(product_id=product.id, shard=shard, stock=stock)
+            )
+    db_session.commit()
+
+    assert rebalance_stock_shards(db_session, batch_size=1) == 2
+    for product in products:
+        assert shard_stocks(db_session, product.id) == [3, 3]
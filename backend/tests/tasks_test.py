@@ -0,0 +1,46 @@
+import os
+
+import pytest
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from app import tasks
+
+
+# See tests/partitions_test.py
+SELLS_PG_TEST_URL = os.environ.get("SELLS_PG_TEST_URL")
+
+
+def test_single_worker_jobs_are_scheduled():
+    names = {name for name, _, _ in tasks.PERIODIC_JOBS}
+    assert tasks.SINGLE_WORKER_JOBS <= names
+
+
+def test_run_job_skipped_while_locked(monkeypatch: pytest.MonkeyPatch):
+    if not SELLS_PG_TEST_URL:
+        pytest.skip("SELLS_PG_TEST_URL is not set")
+
+    engine = sa.create_engine(SELLS_PG_TEST_URL)
+    monkeypatch.setattr(tasks, "engine", engine)
+
+    def job(session: Session) -> int:
+        # Two transactions, the lock is kept across the commit
+        session.execute(sa.text("SELECT 1"))
+        session.commit()
+        return int(session.execute(sa.text("SELECT 1")).scalar_one())
+
+    lock_id = tasks.job_lock_id("job")
+    with engine.connect() as other_worker:
+        other_worker.execute(sa.text("SELECT pg_advisory_lock(:id)"), {"id": lock_id})
+        assert tasks.run_job(job, "job") == 0
+
+        other_worker.execute(sa.text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+        assert tasks.run_job(job, "job") == 1
+        assert tasks.run_job(job) == 1
+
+        # Released after the run
+        assert other_worker.execute(
+            sa.text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}
+        ).scalar()
+
+    engine.dispose()